@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmark of the acquisition paths of the drivers.
+
+Every case runs one acquisition method (TDS.acquire_waveform, CSA.acquire_waveform,
+DCA.acquire_waveform, OSA.grab_spectrum, RFSA.get_spectrum) against the instrument
+simulator for a record length and transfer encoding, and reports samples/s, bytes/s,
+sleep time (fixed time.sleep() waits of the driver), parse time (end-to-end time neither
+spent in bus transfers nor sleeping) and end-to-end latency. Results are written as JSON
+and compared against a stored baseline.
+
+Latencies measured on different machines are not comparable, so every run also times a
+fixed parsing workload. The baseline latencies are scaled by the ratio of the two
+calibration times before comparing. The comparison uses the active time (latency without
+sleeps) of the fastest repeat, as fixed sleeps and background load only add noise.
+
+Typical usage example:
+    python -m src.AcquisitionBenchmark                       # Compare against the baseline
+    python -m src.AcquisitionBenchmark --save-baseline       # Store a new baseline
+
+@author: ri679647
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')   # Keep any figure a driver draws off screen
+import matplotlib.pyplot as plt
+from src.InstrumentSimulator import use_simulated_bench
+from src.TDS import TDS
+from src.CSA import CSA
+from src.DCA import DCA
+from src.OSA import OSA
+from src.RFSA import RFSA
+
+DEFAULT_REPEATS = 5
+DEFAULT_TOLERANCE = 1.0     # Relative increase of the active time reported as a regression
+MIN_REGRESSION = 0.005      # Smaller absolute increases of the active time are timing noise, in seconds
+CALIBRATION_POINTS = 50000  # Values formatted and parsed by the calibration workload
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'acquisition_baseline.json')
+
+class SleepRecorder():
+    """This class stands in for the time module of a driver module and adds up its time.sleep() waits.
+    
+    Attributes
+    ----------
+    sleepTime: float
+        Seconds spent in sleep() so far.
+    """
+    def __init__(self):
+        self.sleepTime = 0.0
+    
+    def sleep(self, seconds):
+        startTime = time.perf_counter()
+        time.sleep(seconds)
+        self.sleepTime = self.sleepTime + time.perf_counter() - startTime
+    
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+def measure_calibration(repeats = 5):
+    """This function times a fixed workload of formatting and parsing numbers, a measure of the machine speed.
+    
+    Returns
+    -------
+    calibration: float
+        Fastest run of the workload in seconds.
+    """
+    values = np.linspace(-1, 1, CALIBRATION_POINTS)
+    timings = []
+    for repeat in range(repeats):
+        startTime = time.perf_counter()
+        text = ','.join(['%.6E' % value for value in values])
+        np.array(text.split(','), dtype = np.float64)
+        timings.append(time.perf_counter() - startTime)
+    return min(timings)
+
+def acquire_tds(driver, encoding, width):
+    driver.acquire_waveform(encoding, width)
+    return len(driver.waveformArray)
+
+def acquire_csa(driver, encoding, width):
+    driver.acquire_waveform(encoding = encoding, width = width)
+    return len(driver.waveformArray)
+
+def acquire_dca(driver, encoding, width):
+    driver.acquire_waveform(encoding)
+    return len(driver.waveformArray)
+
+def acquire_osa(driver, encoding, width):
+    driver.grab_spectrum('A')
+    return len(driver.waveform)
+
+def acquire_rfsa(driver, encoding, width):
+    driver.get_spectrum(encoding)
+    return len(driver.spectrum)
+
+# (instrument, driver class, address, acquisition, record lengths, (encoding, width) pairs, width None if fixed by the format)
+benchmarkSuite = [
+    ("TDS", TDS, 'GPIB0::5::INSTR', acquire_tds, [2500], [("RIBinary", 1), ("RIBinary", 2), ("RPBinary", 2), ("ASCii", 1)]),
+    ("CSA", CSA, 'GPIB0::4::INSTR', acquire_csa, [4000, 50000, 500000], [("RIBinary", 2), ("RPBinary", 1), ("ASCii", 1)]),
+    ("DCA", DCA, 'GPIB0::7::INSTR', acquire_dca, [1024], [("WORD", None), ("BYTE", None), ("ASCII", None)]),
+    ("OSA", OSA, 'GPIB0::27::INSTR', acquire_osa, [1001, 20001], [("ASCII", None)]),
+    ("RFSA", RFSA, 'GPIB0::18::INSTR', acquire_rfsa, [1001], [("BINARY", None), ("ASCII", None)]),
+]
+
+def set_record_length(simulatedInstrument, recordLength):
+    """This function sets the record length of a simulated instrument that supports several lengths."""
+    if hasattr(simulatedInstrument, 'recordLength'):
+        simulatedInstrument.recordLength = recordLength
+    if 'SMPL' in simulatedInstrument.settings:
+        simulatedInstrument.settings['SMPL'] = str(recordLength)
+
+def get_case_name(instrument, recordLength, encoding, width):
+    if width == None:
+        return instrument + '/' + str(recordLength) + '/' + encoding
+    return instrument + '/' + str(recordLength) + '/' + encoding + str(width)
+
+def run_case(driver, simulatedInstrument, acquisition, encoding, width, repeats, sleepRecorder):
+    """This function runs one acquisition repeats times and returns the median of every figure.
+
+    Returns
+    -------
+    result: dict
+        samples, bytes, latency, busTime, sleepTime, parseTime, fastestActiveTime (s), samplesPerSecond
+        and bytesPerSecond.
+    """
+    acquisition(driver, encoding, width)       # Warm up caches such as the OSA wavelength axis
+    runs = []
+    for repeat in range(repeats):
+        busTime = sum([stats.totalTime for stats in driver.commandStats.values()])
+        sleepTime = sleepRecorder.sleepTime
+        bytesMoved = simulatedInstrument.bytesRead + simulatedInstrument.bytesWritten
+        startTime = time.perf_counter()
+        samples = acquisition(driver, encoding, width)
+        latency = time.perf_counter() - startTime
+        busTime = sum([stats.totalTime for stats in driver.commandStats.values()]) - busTime
+        sleepTime = sleepRecorder.sleepTime - sleepTime
+        bytesMoved = simulatedInstrument.bytesRead + simulatedInstrument.bytesWritten - bytesMoved
+        runs.append((latency, busTime, sleepTime, samples, bytesMoved))
+        plt.close('all')
+    latency = float(np.median([run[0] for run in runs]))
+    busTime = float(np.median([run[1] for run in runs]))
+    sleepTime = float(np.median([run[2] for run in runs]))
+    samples = runs[-1][3]
+    bytesMoved = runs[-1][4]
+    return {
+        "samples": samples,
+        "bytes": bytesMoved,
+        "latency": latency,
+        "busTime": busTime,
+        "sleepTime": sleepTime,
+        "parseTime": max(latency - busTime - sleepTime, 0.0),
+        "fastestActiveTime": float(min([run[0] - run[2] for run in runs])),
+        "samplesPerSecond": samples/latency if latency > 0 else 0.0,
+        "bytesPerSecond": bytesMoved/latency if latency > 0 else 0.0,
+    }
+
+def run_benchmarks(repeats = DEFAULT_REPEATS, latency = 0.0, bandwidth = None, instruments = None):
+    """This function runs the whole suite against a simulated bench.
+
+    Parameters
+    ----------
+    repeats: int
+        Acquisitions timed per case, the median is reported.
+    latency: float
+        Simulated latency of every bus transaction in seconds.
+    bandwidth: float
+        Simulated bus throughput in bytes per second, None for an unlimited bus.
+    instruments: list
+        Names of the instruments to benchmark, all by default.
+
+    Returns
+    -------
+    results: dict
+        Environment description and the result of every case keyed by case name.
+    """
+    resourceManager = use_simulated_bench(latency, bandwidth)
+    cases = {}
+    for (instrument, driverClass, address, acquisition, recordLengths, encodings) in benchmarkSuite:
+        if instruments != None and instrument not in instruments:
+            continue
+        simulatedInstrument = resourceManager.instruments[address]
+        driverModule = sys.modules[driverClass.__module__]
+        sleepRecorder = SleepRecorder()
+        driverModule.time = sleepRecorder       # Fixed sleeps of the driver are reported apart from parsing
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                driver = driverClass()
+                driver.connect(address)
+            for recordLength in recordLengths:
+                set_record_length(simulatedInstrument, recordLength)
+                for (encoding, width) in encodings:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        result = run_case(driver, simulatedInstrument, acquisition, encoding, width, repeats, sleepRecorder)
+                    name = get_case_name(instrument, recordLength, encoding, width)
+                    cases[name] = result
+                    print(name.ljust(28) + ('%.2f ms' % (1000*result["latency"])).rjust(12) + ('%.3g S/s' % result["samplesPerSecond"]).rjust(14)
+                          + ('%.3g B/s' % result["bytesPerSecond"]).rjust(14) + ('sleep %.0f ms' % (1000*result["sleepTime"])).rjust(16)
+                          + ('parse %.2f ms' % (1000*result["parseTime"])).rjust(18))
+        finally:
+            driverModule.time = time
+    return {
+        "date": datetime.datetime.now().isoformat(timespec = 'seconds'),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "repeats": repeats,
+        "calibration": measure_calibration(),
+        "latency": latency,
+        "bandwidth": bandwidth,
+        "cases": cases,
+    }
+
+def get_active_time(result):
+    """This function returns the active time of the fastest repeat of a case, without the fixed sleeps of the driver."""
+    if "fastestActiveTime" in result:
+        return result["fastestActiveTime"]
+    return result["latency"] - result.get("sleepTime", 0.0)
+
+def compare_with_baseline(results, baseline, tolerance = DEFAULT_TOLERANCE, minRegression = MIN_REGRESSION):
+    """This function lists the cases whose active time grew by more than tolerance relative to the baseline.
+
+    The baseline times are first scaled by the ratio of the calibration times of both runs, so that
+    a baseline stored on another machine stays comparable. A case only regresses if its active time
+    also grew by more than minRegression seconds.
+
+    Returns
+    -------
+    regressions: list
+        (case name, scaled baseline active time, current active time) of every regression.
+    """
+    speedRatio = 1.0
+    if results.get("calibration", 0) > 0 and baseline.get("calibration", 0) > 0:
+        speedRatio = results["calibration"]/baseline["calibration"]
+    regressions = []
+    for name, result in results["cases"].items():
+        reference = baseline["cases"].get(name)
+        if reference == None or get_active_time(reference) <= 0:
+            continue
+        referenceTime = get_active_time(reference)*speedRatio
+        activeTime = get_active_time(result)
+        if activeTime > referenceTime*(1 + tolerance) and activeTime - referenceTime > minRegression:
+            regressions.append((name, referenceTime, activeTime))
+    return regressions
+
+def save_results(results, fileName):
+    folder = os.path.dirname(fileName)
+    if folder != '' and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(fileName, 'w') as fileWriter:
+        json.dump(results, fileWriter, indent = 2, sort_keys = True)
+
+def load_results(fileName):
+    with open(fileName) as fileReader:
+        return json.load(fileReader)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Acquisition throughput benchmark against the instrument simulator.")
+    parser.add_argument('--repeats', type = int, default = DEFAULT_REPEATS)
+    parser.add_argument('--latency', type = float, default = 0.0, help = "simulated bus latency per transaction in seconds")
+    parser.add_argument('--bandwidth', type = float, default = None, help = "simulated bus throughput in bytes per second")
+    parser.add_argument('--instrument', action = 'append', help = "benchmark only this instrument (TDS, CSA, DCA, OSA or RFSA)")
+    parser.add_argument('--output', default = None, help = "JSON file for the results")
+    parser.add_argument('--baseline', default = BASELINE_FILE)
+    parser.add_argument('--tolerance', type = float, default = DEFAULT_TOLERANCE)
+    parser.add_argument('--min-regression', type = float, default = MIN_REGRESSION, help = "smallest active time increase in seconds reported as a regression")
+    parser.add_argument('--save-baseline', action = 'store_true', help = "store the results as the new baseline")
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.repeats, arguments.latency, arguments.bandwidth, arguments.instrument)
+    if arguments.output != None:
+        save_results(results, arguments.output)
+    if arguments.save_baseline:
+        save_results(results, arguments.baseline)
+        print("Baseline saved to " + arguments.baseline)
+    elif os.path.isfile(arguments.baseline):
+        regressions = compare_with_baseline(results, load_results(arguments.baseline), arguments.tolerance, arguments.min_regression)
+        for (name, referenceTime, activeTime) in regressions:
+            print("REGRESSION " + name + ": " + '%.2f' % (1000*referenceTime) + " ms -> " + '%.2f' % (1000*activeTime) + " ms")
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("No regression against " + arguments.baseline)
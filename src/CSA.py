@@ -5,24 +5,147 @@ Created on Mon Mar 30 12:18:19 2020
 @author: ri679647
 """
 
-import sys
 import pyvisa
 import time
 import numpy as np
 import matplotlib.pyplot as plt
 import datetime
 import csv
+from src.WaveformScaling import codes_from_ascii, get_reusable_buffer, scale_waveform
+from src.CompletionWaiter import CompletionWaiter
+from src.InstrumentErrors import InstrumentConnectionError, InstrumentIOError
+from src.TraceFile import write_columns
+from src.Instrument import Instrument, timed_acquisition
 #import types
 
 GLOBAL_TOUT =  100000 # IO time out in milliseconds
+SWEEP_TIMEOUT = 600   # Hard deadline of a single sweep in seconds
+PREAMBLE_QUERY = "HEADER ON;VERBOSE ON;:WFMOUTPRE?;:HEADER OFF" # Keyword tagged WFMOutpre? reply in one round trip
+DEFAULT_ENCODING = "RIBinary"   # CURVE? transfer encoding (ASCIi, RIBinary or RPBinary)
+DEFAULT_WIDTH = 2               # Bytes per sample point transferred by CURVE?
+DEFAULT_CHUNK_POINTS = 5000     # Points per DATA:START/DATA:STOP window when streaming a record
+MAX_RECORD_POINTS = 10000000    # DATA:STOP used to select the whole record, the CSA clamps it to the record length
+NUMBER_OF_CHANNELS = 2
+CHANNEL_SETTINGS = ["SCAle", "POSition"]    # Read by refresh() for every channel, coupling and bandwidth are read on first use
+HORIZONTAL_SETTINGS = ["HORizontal:MAIn:SCAle", "HORizontal:MAIn:POSition"]
 
-class CSA():
+switcherCurveDatatype = {
+    ("RIBINARY", 1): "b",   # Signed integer, one byte per sample.
+    ("RIBINARY", 2): "h",   # Signed integer, two bytes per sample.
+    ("RPBINARY", 1): "B",   # Positive integer, one byte per sample.
+    ("RPBINARY", 2): "H",   # Positive integer, two bytes per sample.
+}
+
+class WaveformPreamble():
+    """This class holds the WFMOutpre? preamble of a CSA record.
+    
+    The reply is requested with headers on, so every field is parsed by its keyword
+    (e.g. XINCR 1.0E-12) instead of by its position in the reply.
+    
+    Attributes
+    ----------
+    bytesPerPoint: int
+        BYT_NR, bytes per transferred data point.
+    bitsPerPoint: int
+        BIT_NR, bits per transferred data point.
+    encoding: str
+        ENCDG, ASCII or BINARY.
+    binaryFormat: str
+        BN_FMT, RI (signed) or RP (positive) integers.
+    byteOrder: str
+        BYT_OR, MSB or LSB first.
+    waveformId: str
+        WFID, description of the source waveform.
+    numberOfPoints: int
+        NR_PT, number of points transferred by CURVE?.
+    xUnit: str
+        XUNIT, horizontal units.
+    xIncrement: float
+        XINCR, time between points.
+    xZero: float
+        XZERO, time of the first transferred point.
+    pointsOffset: float
+        PT_OFF, trigger point offset in points.
+    yUnit: str
+        YUNIT, vertical units.
+    yMultiplier: float
+        YSCALE (or YMULT), vertical units per digitizing level.
+    yOffset: float
+        YOFF, vertical position in digitizing levels.
+    yZero: float
+        YZERO, vertical offset in vertical units.
+    """
+    def __init__(self, preambleReply = None):
+        self.bytesPerPoint = 0
+        self.bitsPerPoint = 0
+        self.encoding = 'XX'
+        self.binaryFormat = 'XX'
+        self.byteOrder = 'XX'
+        self.waveformId = 'XX'
+        self.numberOfPoints = 0
+        self.xUnit = 'XX'
+        self.xIncrement = 0.0
+        self.xZero = 0.0
+        self.pointsOffset = 0.0
+        self.yUnit = 'XX'
+        self.yMultiplier = 0.0
+        self.yOffset = 0.0
+        self.yZero = 0.0
+        if preambleReply != None:
+            self.parse(preambleReply)
+    
+    def parse(self, preambleReply):
+        """This method fills the preamble from a keyword tagged WFMOutpre? reply.
+        
+        Both the short (XIN) and long (XINCR) keyword forms are accepted.
+        """
+        for field in preambleReply.strip().split(';'):
+            field = field.strip().split(' ', 1)
+            if len(field) < 2:
+                continue
+            keyword = field[0].split(':')[-1].upper()
+            value = field[1].strip().replace('"', '')
+            if keyword.startswith('BYT_N'):
+                self.bytesPerPoint = int(value)
+            elif keyword.startswith('BIT_N'):
+                self.bitsPerPoint = int(value)
+            elif keyword.startswith('ENC'):
+                self.encoding = value
+            elif keyword.startswith('BN_F'):
+                self.binaryFormat = value
+            elif keyword.startswith('BYT_O'):
+                self.byteOrder = value
+            elif keyword.startswith('WFI'):
+                self.waveformId = value
+            elif keyword.startswith('NR_P'):
+                self.numberOfPoints = int(value)
+            elif keyword.startswith('XUN'):
+                self.xUnit = value
+            elif keyword.startswith('XIN'):
+                self.xIncrement = float(value)
+            elif keyword.startswith('XZE'):
+                self.xZero = float(value)
+            elif keyword.startswith('PT_O'):
+                self.pointsOffset = float(value)
+            elif keyword.startswith('YUN'):
+                self.yUnit = value
+            elif keyword.startswith('YSC'):
+                self.yMultiplier = float(value)
+            elif keyword.startswith('YMU') and self.yMultiplier == 0.0:
+                self.yMultiplier = float(value)
+            elif keyword.startswith('YOF'):
+                self.yOffset = float(value)
+            elif keyword.startswith('YZE'):
+                self.yZero = float(value)
+
+class CSA(Instrument):
     def __init__(self,Port=None): 
+        super().__init__()
         self.connected = False
         self.bool_sweep = False
+        self.sweepDuration = 0.0
 
         self.parent=self
-        self.list_devices()
         self.idn='IDN'
         self.idnMfg = 'XX'
         self.idnModel = 'XX'
@@ -46,20 +169,20 @@ class CSA():
         self.waveformMode = 'XX'   
         self.timeArray = []
         self.waveformArray = []
+        self.reuseBuffers = False                                               # Scale new captures into the previous arrays
+        self.preamble = WaveformPreamble()
+        self.debug = False                                                      # Print acquisition diagnostics
+        self.waveformCodes = np.empty(0, dtype=np.int32)                        # Raw record filled by stream_waveform()
+        self.pointsTransferred = 0
+        self.streamCancelled = False
+        self.waveformScaling = None                                             # scale_waveform() factors of waveformCodes
             
-    def list_devices(self):
-        try:
-            self.rm = pyvisa.ResourceManager()
-            self.list = self.rm.list_resources()
-        except:
-            print("Couldn't find resource manager")
-                
     def connect(self, device): 
         try:          
-            self.handle = self.rm.open_resource(device)
+            self.open_session(device)
 
             self.print_message('connected to...')
-            self.idn = str(self.handle.query("*IDN?"))
+            self.idn = str(self.query("*IDN?"))
             print(self.idn)
 #            self.idn = self.idn.split(',')
 #            self.idnMfg = self.idn[0]                                           # Manufacturer
@@ -77,35 +200,37 @@ class CSA():
         except Exception as e:
             self.print_message(e)
             self.print_message(' Couldn\'t connect to: ' + device)
-            sys.exit() # From InfiniiVision Script
+            raise InstrumentConnectionError("Couldn't connect to " + str(device)) from e
     
     def get_measurement_params(self):
-        self.handle.write("DCL")
+        self.write("DCL")
     
     def set_params(self):
         self.handle.timeout = GLOBAL_TOUT
         ## Clear the instrument bus
-        self.handle.clear()
+        self.clear()
 
-        ## Clear any previously encountered errors
-        self.handle.write("*CLS")
-        self.handle.write("HEADER OFF")
+        ## Clear any previously encountered errors, the settings query carries both writes
+        with self.batch():
+            self.write("*CLS")
+            self.write("HEADER OFF")
+            self.refresh()
 #        print("Initial parameters set.")
     
     def get_number_averages(self):
-        self.numAvg = int(self.handle.query("ACQuire:NUMAVg?"))
+        self.numAvg = int(self.query("ACQuire:NUMAVg?"))
         return self.numAvg
         
     def set_number_averages(self, numAvg):
         if numAvg == 4 or 16 or 64 or 128:
-            self.handle.write("ACQuire:NUMAVg " + str(numAvg))
+            self.write("ACQuire:NUMAVg " + str(numAvg))
             print('Number of averages: ' + str(numAvg) + ' set')
         else:
             print('Incorrect number of averages: ' + str(numAvg))
     
     def get_osc_state(self):
-        print(self.handle.query("ACQuire:MODE?"))
-        oscNumState = self.handle.query("ACQuire:STATE?")
+        print(self.query("ACQuire:MODE?"))
+        oscNumState = self.query("ACQuire:STATE?")
         print('Oscilloscope state: ' + oscNumState)
         if oscNumState == '0\n':
             self.oscState = 'STOP'
@@ -118,26 +243,27 @@ class CSA():
     def set_osc_state(self, oscState): # RUN or STOP
         if oscState != 0:#'RUN' or 'STOP':
 #            self.oscState = oscState
-            self.handle.write("ACQuire:STATE " + oscState)      
+            self.write("ACQuire:STATE " + oscState)      
     
     def get_channel_bandwidth(self, channelNumber):
         if channelNumber == 1 or 2:
-            channelBandwidthState = self.handle.query("CH" + str(channelNumber) + ":BANdwidth?")
+            channelBandwidthState = self.get_setting("CH" + str(channelNumber) + ":BANdwidth")
             print('CH' + str(channelNumber) + ' bandwidth state: ' + channelBandwidthState)
-            if channelBandwidthState == 'OFF\n':
+            if channelBandwidthState == 'OFF':
                 self.channelBandwidth[channelNumber-1] = 'OFF'      # 20 MHz
-            elif channelBandwidthState == 'ON\n':
+            elif channelBandwidthState == 'ON':
                 self.channelBandwidth[channelNumber-1] = 'ON'       # Full oscilloscope bandwidth
             else:
                 self.channelBandwidth[channelNumber-1] = '0'
                 print('Invalid CH' + str(channelNumber) + ' state: ' + channelBandwidthState)
         else:
             print('Invalid channel number: ' + str(channelNumber))           
+        return self.channelBandwidth[channelNumber-1]
     
     def set_channel_bandwidth(self, channelNumber, channelBandwidthState):
         if channelNumber == 1 or 2:
             if channelBandwidthState == 'ON' or 'OFF':
-                self.handle.write("CH" + str(channelNumber) + ":BANdwidth " + channelBandwidthState)
+                self.write_setting("CH" + str(channelNumber) + ":BANdwidth", channelBandwidthState)
             else:
                 print('Invalid CH' + str(channelNumber) + ' state: ' + channelBandwidthState)
         else:
@@ -145,25 +271,25 @@ class CSA():
     
     def get_channel_coupling(self, channelNumber):
         if channelNumber == 1 or 2:
-            channelCoupling = self.handle.query("CH" + str(channelNumber) + ":COUPling?")
+            channelCoupling = self.get_setting("CH" + str(channelNumber) + ":COUPling")
             print('CH' + str(channelNumber) + ' coupling: ' + channelCoupling)
-            if channelCoupling == 'DC\n':
-                self.channelBandwidth[channelNumber-1] = 'DC'       # DC coupling
-            elif channelCoupling == 'AC\n':
-                self.channelBandwidth[channelNumber-1] = 'AC'       # AC coupling
-            elif channelCoupling == 'GND\n':
-                self.channelBandwidth[channelNumber-1] = 'GND'      # Ground coupling, only a flat ground-level waveform
+            if channelCoupling == 'DC':
+                self.channelCoupling[channelNumber-1] = 'DC'        # DC coupling
+            elif channelCoupling == 'AC':
+                self.channelCoupling[channelNumber-1] = 'AC'        # AC coupling
+            elif channelCoupling == 'GND':
+                self.channelCoupling[channelNumber-1] = 'GND'       # Ground coupling, only a flat ground-level waveform
             else:
                 self.channelCoupling[channelNumber-1] = '0'
                 print('Invalid CH' + str(channelNumber) + ' coupling: ' + channelCoupling)
         else:
             print('Invalid channel number: ' + str(channelNumber))
-        return self.channelBandwidth[channelNumber-1]
+        return self.channelCoupling[channelNumber-1]
     
     def set_channel_coupling(self, channelNumber, channelCoupling):
         if channelNumber == 1 or 2:
             if channelCoupling == 'DC' or 'AC' or 'GND':
-                self.handle.write("CH" + str(channelNumber) + ":COUPLing " + channelCoupling)
+                self.write_setting("CH" + str(channelNumber) + ":COUPling", channelCoupling)
             else:
                 print('Invalid CH' + str(channelNumber) + ' coupling: ' + channelCoupling)
         else:
@@ -171,18 +297,18 @@ class CSA():
 
     def get_channel_scale(self, channelNumber):
         if channelNumber == 1 or 2:
-            channelPosition = self.handle.query("CH" + str(channelNumber) + ":SCAle?")
-#            print('CH' + str(channelNumber) + ' scale: ' + channelPosition + ' V/div')
-            self.channelPosition[channelNumber-1] = float(channelPosition)      # DC coupling
+            channelScale = self.get_setting("CH" + str(channelNumber) + ":SCAle")
+#            print('CH' + str(channelNumber) + ' scale: ' + channelScale + ' V/div')
+            self.channelScale[channelNumber-1] = float(channelScale)
         else:
             print('Invalid channel number: ' + str(channelNumber))
-        return self.channelPosition[channelNumber-1]
+        return self.channelScale[channelNumber-1]
     
     def set_channel_scale(self, channelNumber, channelScale):
         if channelNumber == 1 or 2:
             if isinstance(channelScale, float):
                 if abs(channelScale) <= 5 and abs(channelScale) >= 2e-3:            # 2mV/div < x < 5 V/div
-                    self.handle.write("CH" + str(channelNumber) + ":SCAle " + str(channelScale))
+                    self.write_setting("CH" + str(channelNumber) + ":SCAle", channelScale)
                 else:
                     print('Invalid CH' + str(channelNumber) + ' scale, outside limits: ' + str(channelScale))
             else:
@@ -192,7 +318,7 @@ class CSA():
     
     def get_channel_position(self, channelNumber):
         if channelNumber == 1 or 2:
-            channelPosition = self.handle.query("CH" + str(channelNumber) + ":POSITION?")
+            channelPosition = self.get_setting("CH" + str(channelNumber) + ":POSition")
 #            print('CH' + str(channelNumber) + ' position: ' + channelPosition)
             self.channelPosition[channelNumber-1] = float(channelPosition)       # DC coupling
         else:
@@ -203,7 +329,7 @@ class CSA():
         if channelNumber == 1 or 2:
             if isinstance(channelPosition, float):
                 if abs(channelPosition) < abs(self.get_channel_scale(channelNumber)):
-                    self.handle.write("CH" + str(channelNumber) + ":POSITION " + str(channelPosition))
+                    self.write_setting("CH" + str(channelNumber) + ":POSition", channelPosition)
                 else:
                     print('Invalid CH' + str(channelNumber) + ' position, bigger than scale: ' + str(channelPosition))
             else:
@@ -212,11 +338,33 @@ class CSA():
             print('Invalid channel number: ' + str(channelNumber))
     
     def get_horizontal_parameters(self):
-        horizontalParams = self.handle.query("HORizontal?")
+        horizontalParams = self.query("HORizontal?")
         print(horizontalParams)
     
+    def get_horizontal_scale(self):
+        return float(self.get_setting("HORizontal:MAIn:SCAle"))
+    
+    def get_horizontal_position(self):
+        return float(self.get_setting("HORizontal:MAIn:POSition"))
+    
     def set_time_scale(self,timeScale):
-        self.handle.write("HORizontal:DELay:SCAle " + str(timeScale))
+        self.write_setting("HORizontal:DELay:SCAle", timeScale)
+    
+    def get_settings_commands(self):
+        """This method returns the headers of the channel and horizontal settings read by refresh().
+        """
+        commands = []
+        for channelNumber in range(1, NUMBER_OF_CHANNELS + 1):
+            commands = commands + ["CH" + str(channelNumber) + ":" + setting for setting in CHANNEL_SETTINGS]
+        return commands + HORIZONTAL_SETTINGS
+    
+    def refresh(self):
+        """This method reads the channel and horizontal state in one compound query.
+        
+        connect() fills the cache and the setters keep it up to date, call refresh() after
+        changing settings on the front panel.
+        """
+        return self.refresh_settings(self.get_settings_commands())
     
     def set_waveform_parameters(self, waveformId):
 #        print("Waveform ID: " + waveformId)
@@ -273,111 +421,252 @@ class CSA():
             print('Waveform mode error.')
             return 'XX'
         
-    def set_waveform_values(self, waveformAscii, xZero, xIncrement, pointsOffset, yZero, yScale, yOffset):
-        waveformAscii = waveformAscii.split(',')
-        print("Length of waveformAscii:", len(waveformAscii))
-#        print("Characters:", waveformAscii)
-        waveformTime = []
-        waveformVolts = []
-        y = 0
-        n = 0
-        for y in waveformAscii:
-            y = int(y)
-            waveformTime.append(  xZero + xIncrement  * ( n ) )
-            waveformVolts.append( yZero + yScale * ( y - yOffset     ) )            
-            n = n + 1
-        self.timeArray = np.array(waveformTime)
-        self.waveformArray = np.array(waveformVolts)
-        print(self.timeArray[0])
-        print(self.timeArray[-1])
-        print("Total time scale:", self.timeArray[-1]-self.timeArray[0], "s")
+    def set_waveform_values(self, waveformCodes, xZero, xIncrement, pointsOffset, yZero, yScale, yOffset):
+        if isinstance(waveformCodes, str):
+            waveformCodes = codes_from_ascii(waveformCodes, np.int32)
+        self.print_debug("Length of waveformCodes: " + str(len(waveformCodes)))
+        self.waveformScaling = {"xZero": xZero, "xIncrement": xIncrement, "pointsOffset": 0,
+                                "yZero": yZero, "yMultiplier": yScale, "yOffset": yOffset}
+#        print("Characters:", waveformCodes)
+        timeOut = None
+        voltsOut = None
+        if self.reuseBuffers:
+            timeOut = get_reusable_buffer(self.timeArray, len(waveformCodes))
+            voltsOut = get_reusable_buffer(self.waveformArray, len(waveformCodes))
+        # The CSA time axis starts at XZEro, the points offset is not applied
+        (self.timeArray, self.waveformArray) = scale_waveform(waveformCodes, xZero, xIncrement, 0,
+                                                              yZero, yScale, yOffset, timeOut, voltsOut)
+        if len(self.timeArray) > 0:
+            self.print_debug(self.timeArray[0])
+            self.print_debug(self.timeArray[-1])
+            self.print_debug("Total time scale: " + str(self.timeArray[-1]-self.timeArray[0]) + " s")
     
     def get_waveform_time(self):
         return self.timeArray
     
     def get_waveform_volts(self):
         return self.waveformArray
+    
+    def get_binary_arrays(self):
+        """This method returns the raw codes of the last acquisition, or the scaled record if it was loaded from a CSV file.
+        """
+        if self.waveformScaling == None:
+            return {"time": self.timeArray, "volts": self.waveformArray}
+        return {"codes": self.waveformCodes[:self.pointsTransferred]}
+    
+    def get_binary_metadata(self):
+        return {
+            "preamble": vars(self.preamble),
+            "scaling": self.waveformScaling,
+            "channel": self.waveformChannel,
+            "coupling": self.waveformCoupling,
+            "verticalScale": self.waveformVerScale,
+            "horizontalScale": self.waveformHorScale,
+            "samplePoints": self.waveformSamplePoints,
+            "mode": self.waveformMode,
+        }
+    
+    def set_binary_arrays(self, arrays, metadata):
+        self.preamble = WaveformPreamble()
+        for name, value in metadata.get("preamble", {}).items():
+            setattr(self.preamble, name, value)
+        self.waveformChannel = metadata.get("channel", 'XX')
+        self.waveformCoupling = metadata.get("coupling", 'XX')
+        self.waveformVerScale = metadata.get("verticalScale", 'XX')
+        self.waveformHorScale = metadata.get("horizontalScale", 'XX')
+        self.waveformSamplePoints = metadata.get("samplePoints", 'XX')
+        self.waveformMode = metadata.get("mode", 'XX')
+        if "codes" in arrays:
+            scaling = metadata["scaling"]
+            self.waveformCodes = np.array(arrays["codes"], dtype=np.int32)
+            self.pointsTransferred = len(self.waveformCodes)
+            self.set_waveform_values(self.waveformCodes, scaling["xZero"], scaling["xIncrement"], scaling["pointsOffset"],
+                                     scaling["yZero"], scaling["yMultiplier"], scaling["yOffset"])
+        else:
+            self.waveformScaling = None
+            self.timeArray = arrays["time"]
+            self.waveformArray = arrays["volts"]
+    
+    def get_waveform_preamble(self):
+        """This method reads the complete WFMOutpre? preamble in a single query.
+        
+        Returns
+        -------
+        preamble: WaveformPreamble
+            Parsed preamble of the record selected with DATA:SOUrce, DATA:STARt and DATA:STOP.
+        """
+        self.preamble = WaveformPreamble(self.query(PREAMBLE_QUERY))
+        return self.preamble
         
-    def acquire_waveform(self):
-        self.handle.write("DATA:ENCDG ASCIi")
-#        self.handle.write("DATA:WIDth 2")
-        self.handle.write("CH1:UNITS VOLT")
-#        self.handle.write('WFMInPre:YUNit "V"')
-        print("Number of points transferred:", self.handle.query("WFMOUTPre:NR_PT?"))
-        print("Number of bytes per sample point:", self.handle.query("WFMOUTPre:BYT_NR?"))
-        self.handle.write("DATA:START 1")
-        self.handle.write("DATA:STOP 2000")
-        print("Initial point transferred:", self.handle.query("DATA:START?"))
-        print("Last point transferred:", self.handle.query("DATA:STOP?"))
-        print("Horizontal scale [s/div]:", self.handle.query("HORIZONTAL:REF1:MAIN:SCALE?"))
-        print("Number of points transferred:", self.handle.query("WFMOUTPre:NR_PT?"))
+    def read_curve(self, encoding = DEFAULT_ENCODING, width = DEFAULT_WIDTH):
+        """This method reads the current DATA:START/DATA:STOP window with CURVE? and returns the raw codes.
         
+        Binary encodings are read as a definite-length block into a NumPy array using the byte order
+        of the last preamble, the ASCIi encoding splits the comma separated reply instead.
+        """
+        if encoding.upper() == "ASCII":
+            return codes_from_ascii(self.query("CURVE?"), np.int32)
+        datatype = switcherCurveDatatype.get((encoding.upper(), int(width)))
+        if datatype == None:
+            raise ValueError("Invalid CURVE? encoding and width: " + str(encoding) + ", " + str(width))
+        isBigEndian = not self.preamble.byteOrder.upper().startswith('LSB')
+        return self.query_binary_block("CURVE?", datatype, isBigEndian)
+    
+    def prepare_record_transfer(self, encoding = DEFAULT_ENCODING, width = DEFAULT_WIDTH):
+        """This method sets the transfer encoding, selects the whole record and reads its preamble.
         
-        waveformAscii = self.handle.query("CURVE?")
-        print(self.handle.query("DATA?"))
-#        waveformParameters = self.handle.query("WFMOutPre?")
-#        print('Waveform parameters: ' + waveformParameters)
-#        waveformParameters = waveformParameters.split(";")
-#        waveformId = waveformParameters[6].replace('"','')  # WFID
-        xIncrement = float(self.handle.query("WFMOutPre:XINcr?"))           # XINcr
-        pointsOffset = float(self.handle.query("WFMOutPre:XOFf?"))         # PT_Off
-        xZero = float(self.handle.query("WFMOutPre:XZEro?"))               # XZERo
-        xUnit = self.handle.query("WFMOutPre:XUNit?")      # XUNit
-        yMultiplier = float(self.handle.query("WFMOutPre:YSCALE?"))         # YSCale
-        yZero = float(self.handle.query("WFMOutPre:YZEro?"))               # YZEro
-        yOffset = float(self.handle.query("WFMOutPre:YOFf?"))             # YOFf
-        yUnit =self.handle.query("WFMOutPre:YUNit?")      # YUNit
-        print(self.handle.query("WFMOutPre:XMULT?"))
-        print(self.handle.query("WFMOutPre:YSCALE?"))
-        print("\nXINcr: " + str(xIncrement) + "\nPT_Off: " + str(pointsOffset) + "\nXZEro: " + str(xZero) +
-              "\nXUNit: " + xUnit           + "\nYMUlt: "  + str(yMultiplier)  + "\nYZEro: " + str(yZero) + 
-              "\nYOFf: "  + str(yOffset)    + "\nYUNit: "  + yUnit)
-
-#        self.set_waveform_parameters(waveformId)
-        self.set_waveform_values(waveformAscii, xZero, xIncrement, pointsOffset, yZero, yMultiplier, yOffset)
-        plt.plot(self.get_waveform_time(), self.get_waveform_volts(), 'b')
+        Returns
+        -------
+        preamble: WaveformPreamble
+            Preamble of the whole record, numberOfPoints is the record length.
+        """
+        with self.batch():
+            self.write("DATA:ENCDG " + encoding)
+            if encoding.upper() != "ASCII":
+                self.write("WFMOutpre:BYT_NR " + str(width))
+            self.write("CH1:UNITS VOLT")
+#            self.write('WFMInPre:YUNit "V"')
+            self.write("DATA:START 1")
+            self.write("DATA:STOP " + str(MAX_RECORD_POINTS))
+            return self.get_waveform_preamble()
+    
+    def stream_waveform(self, chunkPoints = DEFAULT_CHUNK_POINTS, progressCallback = None, cancelEvent = None,
+                        encoding = DEFAULT_ENCODING, width = DEFAULT_WIDTH, recordLength = None):
+        """This generator transfers the whole record in DATA:START/DATA:STOP windows of chunkPoints points.
+        
+        Every chunk is copied into the preallocated waveformCodes array and yielded as a view of it,
+        so no single CURVE? read has to move the full record within GLOBAL_TOUT. Stop iterating or
+        set cancelEvent to abandon the record, pointsTransferred then holds the points already read.
+        A chunk shorter than its window raises InstrumentIOError, so the record never has gaps.
+        
+        Parameters
+        ----------
+        chunkPoints: int
+            Number of points read per CURVE? query.
+        progressCallback: function
+            Called as progressCallback(pointsTransferred, recordLength) after every chunk.
+        cancelEvent: threading.Event
+            Checked before every chunk, the transfer stops once it is set.
+        encoding: str
+            CURVE? transfer encoding, RIBinary or RPBinary for binary blocks or ASCIi.
+        width: int
+            Bytes per sample point for binary encodings (1 or 2).
+        recordLength: int
+            Number of points to transfer, by default the record length reported by the preamble.
+        
+        Yields
+        ------
+        (firstPoint, chunk): tuple
+            Index of the first point of the chunk in the record and the raw codes of the chunk.
+        """
+        if recordLength == None:
+            recordLength = self.prepare_record_transfer(encoding, width).numberOfPoints
+        if len(self.waveformCodes) != recordLength:
+            self.waveformCodes = np.empty(recordLength, dtype=np.int32)
+        self.pointsTransferred = 0
+        self.streamCancelled = False
+        chunkPoints = max(int(chunkPoints), 1)
+        for firstPoint in range(0, recordLength, chunkPoints):
+            if cancelEvent != None and cancelEvent.is_set():
+                self.streamCancelled = True
+                self.print_debug("Record transfer cancelled at point " + str(firstPoint))
+                return
+            lastPoint = min(firstPoint + chunkPoints, recordLength)
+            with self.batch():
+                self.write("DATA:START " + str(firstPoint + 1))
+                self.write("DATA:STOP " + str(lastPoint))
+                chunk = self.read_curve(encoding, width)
+            if len(chunk) < lastPoint - firstPoint:
+                raise InstrumentIOError("CURVE? returned " + str(len(chunk)) + " of the " + str(lastPoint - firstPoint)
+                                        + " points starting at point " + str(firstPoint + 1))
+            self.waveformCodes[firstPoint:lastPoint] = chunk[:lastPoint - firstPoint]
+            self.pointsTransferred = lastPoint
+            if progressCallback != None:
+                progressCallback(self.pointsTransferred, recordLength)
+            yield (firstPoint, self.waveformCodes[firstPoint:lastPoint])
+    
+    @timed_acquisition
+    def acquire_waveform(self, chunkPoints = DEFAULT_CHUNK_POINTS, progressCallback = None, cancelEvent = None,
+                         encoding = DEFAULT_ENCODING, width = DEFAULT_WIDTH):
+        """This method transfers the whole record in chunks and stores it in timeArray and waveformArray.
+        
+        Parameters are the same as in stream_waveform().
+        
+        Returns
+        -------
+        completed: boolean
+            False if the transfer was cancelled, the arrays then hold the points read so far.
+        """
+        preamble = self.prepare_record_transfer(encoding, width)
+        self.print_debug("Number of points transferred: " + str(preamble.numberOfPoints))
+        self.print_debug("Number of bytes per sample point: " + str(preamble.bytesPerPoint))
+        self.print_debug("\nXINcr: " + str(preamble.xIncrement) + "\nPT_Off: " + str(preamble.pointsOffset) + "\nXZEro: " + str(preamble.xZero) +
+                         "\nXUNit: " + preamble.xUnit + "\nYMUlt: "  + str(preamble.yMultiplier)  + "\nYZEro: " + str(preamble.yZero) + 
+                         "\nYOFf: "  + str(preamble.yOffset) + "\nYUNit: "  + preamble.yUnit)
+        
+        for chunk in self.stream_waveform(chunkPoints, progressCallback, cancelEvent, encoding, width, preamble.numberOfPoints):
+            pass
+        self.waveformSamplePoints = str(self.pointsTransferred)
+        self.set_waveform_values(self.waveformCodes[:self.pointsTransferred], preamble.xZero, preamble.xIncrement, preamble.pointsOffset,
+                                 preamble.yZero, preamble.yMultiplier, preamble.yOffset)
+        if self.debug:
+            plt.plot(self.get_waveform_time(), self.get_waveform_volts(), 'b')
+        return not self.streamCancelled
     
     def close(self):
+        sessionFailed = False
         try:
-            self.handle.write("*CLS")
+            self.write("*CLS")
         except Exception as e:
             self.print_message(e)
-            sys.exit() # From InfiniiVision Script                              
+            sessionFailed = True                                                # Not handed back to the pool
         time.sleep(1)
+        self.invalidate_settings_cache()                                        # Front panel unlocked
         try:
-            self.rm.close()
+            self.close_session(sessionFailed)
         except Exception as e:
             self.print_message(e)
-            sys.exit() # From InfiniiVision Script                
         time.sleep(1)
         self.print_message('Connection to ' + self.idnMfg + ': ' + self.idnModel + ' closed')
         
-    def send_cmd(self, cmd):
-        
-        self.handle.write(cmd)
-         
-        response = self.handle.read_raw()
-        return response
-    
     def cont_sweep(self):
 
         self.bool_sweep = True
-        self.handle.write("RPT")
+        self.write("RPT")
     
-    def single_sweep(self):
-
+    def single_sweep(self, timeout = SWEEP_TIMEOUT, srqCommand = None):
+        """This method starts a single sweep (SGL) and waits until SWEEP? reports it finished.
+        
+        The wait wakes on a service request from the instrument and otherwise polls SWEEP?
+        with a sub-second adaptive interval, see CompletionWaiter.
+        
+        Parameters
+        ----------
+        timeout: float
+            Hard deadline of the sweep in seconds, InstrumentTimeoutError is raised after it.
+        srqCommand: str
+            Optional command sent before SGL that makes the instrument assert SRQ when the sweep ends.
+        
+        Returns
+        -------
+        sweepDuration: float
+            Observed sweep duration in seconds.
+        """
         self.bool_sweep = True
-        self.handle.write("SGL")
-        time.sleep(1)
-        response = self.handle.query("SWEEP?")
-        while response != "0\r\n":
-            time.sleep(1)
-            response = self.handle.query("SWEEP?")
-#            print(response)
-        self.bool_sweep = False
+        if srqCommand != None:
+            self.write(srqCommand)
+        startTime = time.monotonic()
+        self.write("SGL")
+        self.mark_trigger()
+        waiter = CompletionWaiter(self, timeout)
+        try:
+            self.sweepDuration = waiter.wait(lambda: self.query("SWEEP?").strip() == "0", startTime)
+        finally:
+            self.bool_sweep = False
+        return self.sweepDuration
 
-    def print_message(self, msg):
-        if __name__ == "__main__":
+    def print_debug(self, msg):
+        if self.debug:
             print(msg)
             
 #    def get_measurement_parameters(channelNumber):
@@ -401,8 +690,7 @@ class CSA():
 #                self.csvWriter.writerow(["Acquisition mode: " + self.get_waveform_mode()])
 #                self.csvWriter.writerow(["Number of averages: " + self.span_wl])
                 self.csvWriter.writerow(["Time (s) Waveform (V)"])
-                for (x,y) in zip(self.get_waveform_time(), self.get_waveform_volts()):
-                    self.csvWriter.writerow(('{0:.12f}'.format(x),'{0:.12f}'.format(y)))
+                write_columns(fileWriter, (self.get_waveform_time(), self.get_waveform_volts()), ('%.12f', '%.12f'))
         except Exception as e:
             print(e)
             self.close()
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent capture of several instruments into one bundle.
+
+Every instrument is registered as a capture task with an optional prepare step, an
+acquisition and an optional save step. run() prepares the instruments in the order they
+were added, runs every acquisition in its own thread so the instrument side sweeps,
+averaging and settling times overlap, and then saves and plots the results one after
+another in the calling thread (matplotlib is not thread safe). Bus transfers stay
+serialized per GPIB board by the lock taken in Instrument.transfer().
+
+The bundle keeps the AcquisitionTiming of every instrument (trigger, transfer start and
+transfer end on the time.perf_counter() clock) and reports the skew between them.
+
+Typical usage example:
+    capture = CaptureOrchestrator()
+    capture.add('OSA', lambda: OSA_243A.grab_spectrum('B'), save = save_osa, instrument = OSA_243A)
+    capture.add('TDS', acquire_tds, save = save_tds, instrument = TDS210)
+    bundle = capture.run()
+    spectrum = bundle.get('OSA')
+    bundle.print_skew_report()
+
+@author: ri679647
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.Instrument import AcquisitionTiming, get_wall_time
+from src.InstrumentErrors import InstrumentIOError, InstrumentTimeoutError
+
+DEFAULT_RETRIES = 1     # Acquisitions repeated after a reconnection when the bus failed
+
+class CaptureTask():
+    """This class holds the steps of the capture of one instrument.
+    
+    Attributes
+    ----------
+    name: str
+        Name of the instrument in the bundle, e.g. 'OSA'.
+    acquire: function
+        Acquires the data, run in a worker thread. Its return value is stored in the bundle.
+    prepare: function
+        Starts the instrument side work, e.g. a trigger or a setting, run before any acquisition.
+    save: function
+        Saves and plots the data, run in the calling thread after every acquisition finished.
+    instrument: Instrument
+        Driver whose timing is reported, None to time the acquisition function as a whole.
+    retries: int
+        Acquisitions repeated after a reconnection of instrument when the bus failed.
+    """
+    def __init__(self, name, acquire, prepare = None, save = None, instrument = None, retries = 0):
+        self.name = name
+        self.acquire = acquire
+        self.prepare = prepare
+        self.save = save
+        self.instrument = instrument
+        self.retries = retries
+
+class CaptureBundle():
+    """This class gathers the results of one capture of the bench.
+    
+    Attributes
+    ----------
+    startTime: float
+        time.time() when the capture started.
+    duration: float
+        Duration of the whole capture in seconds, saving included.
+    results: dict
+        Return value of the acquisition of every instrument keyed by name.
+    errors: dict
+        Exception raised by the failed steps keyed by instrument name.
+    durations: dict
+        Duration of the acquisition of every instrument keyed by name, in seconds.
+    timings: dict
+        AcquisitionTiming of every acquired instrument keyed by name.
+    """
+    def __init__(self):
+        self.startTime = time.time()
+        self.duration = 0.0
+        self.results = {}
+        self.errors = {}
+        self.durations = {}
+        self.timings = {}
+    
+    def get(self, name):
+        """This method returns the result of the acquisition of name, None if it failed or was not captured.
+        """
+        return self.results.get(name)
+    
+    def is_complete(self):
+        """This method returns True if every step of every instrument succeeded.
+        """
+        return len(self.errors) == 0
+    
+    def print_summary(self):
+        """This method prints the acquisition time of every instrument and the errors.
+        """
+        for name in self.durations:
+            if name in self.errors:
+                print(name.ljust(8) + "failed: " + str(self.errors[name]))
+            else:
+                print(name.ljust(8) + '%.2f s' % self.durations[name])
+        print("Capture took " + '%.2f s' % self.duration)
+    
+    def get_skew_report(self):
+        """This method summarizes how far apart the acquisitions of the snapshot were.
+        
+        Returns
+        -------
+        report: dict
+            firstTrigger: earliest trigger time (time.perf_counter() seconds).
+            triggerSkew, transferStartSkew, transferEndSkew: spread of the trigger times,
+            transfer start times and transfer end times in seconds.
+            window: time from the earliest trigger to the latest transfer end in seconds.
+            overlap: True if every acquisition was running at a common instant.
+            None if no acquisition was timed.
+        """
+        timings = list(self.timings.values())
+        if len(timings) == 0:
+            return None
+        triggerTimes = [timing.triggerTime for timing in timings]
+        startTimes = [timing.transferStartTime for timing in timings if timing.transferStartTime != None]
+        endTimes = [timing.transferEndTime for timing in timings if timing.transferEndTime != None]
+        report = {
+            "firstTrigger": min(triggerTimes),
+            "triggerSkew": max(triggerTimes) - min(triggerTimes),
+            "transferStartSkew": max(startTimes) - min(startTimes) if len(startTimes) > 0 else 0.0,
+            "transferEndSkew": max(endTimes) - min(endTimes) if len(endTimes) > 0 else 0.0,
+            "window": max(endTimes + triggerTimes) - min(triggerTimes),
+            "overlap": len(endTimes) == len(timings) and max(triggerTimes) < min(endTimes),
+        }
+        return report
+    
+    def print_skew_report(self):
+        """This method prints the trigger and transfer times of every instrument relative to the first trigger.
+        """
+        report = self.get_skew_report()
+        if report == None:
+            print("No acquisition was timed")
+            return
+        firstTrigger = report["firstTrigger"]
+        def get_offset(counterTime):
+            if counterTime == None:
+                return '-'
+            return '%.1f' % (1000*(counterTime - firstTrigger))
+        print("First trigger at " + get_wall_time(firstTrigger).strftime('%Y-%m-%d %H:%M:%S.%f'))
+        print('Instrument'.ljust(12) + 'Trigger ms'.rjust(12) + 'Start ms'.rjust(12) + 'End ms'.rjust(12))
+        for name, timing in sorted(self.timings.items(), key = lambda item: item[1].triggerTime):
+            print(name.ljust(12) + get_offset(timing.triggerTime).rjust(12) + get_offset(timing.transferStartTime).rjust(12)
+                  + get_offset(timing.transferEndTime).rjust(12))
+        print("Trigger skew: " + '%.1f ms' % (1000*report["triggerSkew"]) + ", transfer start skew: " + '%.1f ms' % (1000*report["transferStartSkew"])
+              + ", transfer end skew: " + '%.1f ms' % (1000*report["transferEndSkew"]))
+        print("Snapshot window: " + '%.1f ms' % (1000*report["window"]) + (", acquisitions overlap" if report["overlap"] else ", acquisitions do not overlap"))
+
+class CaptureOrchestrator():
+    """This class captures the registered instruments concurrently.
+    
+    Attributes
+    ----------
+    tasks: list
+        CaptureTask of every registered instrument, in registration order.
+    maxWorkers: int
+        Largest number of acquisitions running at once, one per task by default.
+    bundle: CaptureBundle
+        Bundle of the last run, already filled with the results while the save steps run.
+    """
+    def __init__(self, maxWorkers = None):
+        self.tasks = []
+        self.maxWorkers = maxWorkers
+        self.bundle = None
+    
+    def add(self, name, acquire, prepare = None, save = None, instrument = None, retries = DEFAULT_RETRIES):
+        """This method registers the capture of one instrument.
+        
+        Parameters
+        ----------
+        name: str
+            Name of the instrument in the bundle, must be unique.
+        acquire: function
+            Acquires the data without arguments, run in a worker thread.
+        prepare: function
+            Starts the instrument side work without arguments, run before any acquisition.
+        save: function
+            Saves and plots the data without arguments, run in the calling thread.
+        instrument: Instrument
+            Driver acquiring the data, its AcquisitionTiming is stored in the bundle. Without
+            it the acquisition function is timed as a whole.
+        retries: int
+            Times the acquisition is repeated after instrument.reconnect() when it failed with
+            a bus timeout or IO error.
+        """
+        for task in self.tasks:
+            if task.name == name:
+                raise ValueError("Capture task " + name + " is already registered")
+        self.tasks.append(CaptureTask(name, acquire, prepare, save, instrument, retries))
+    
+    def run_acquisition(self, task):
+        """This method runs the acquisition of task and returns (result, error, duration, timing).
+        
+        The AcquisitionTiming of the instrument is only used if this run replaced it, an
+        acquisition that failed before recording its timing is timed as a whole instead.
+        """
+        previousTiming = task.instrument.timing if task.instrument != None else None
+        startTime = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                result = task.acquire()
+                error = None
+                break
+            except (InstrumentTimeoutError, InstrumentIOError) as exception:
+                result = None
+                error = exception
+                if task.instrument == None or attempt >= task.retries:
+                    break
+                attempt = attempt + 1
+                print(task.name + ": " + str(exception) + ", reconnecting")
+                try:
+                    task.instrument.reconnect()
+                except Exception as reconnectError:
+                    error = reconnectError
+                    break
+            except Exception as exception:
+                result = None
+                error = exception
+                break
+        endTime = time.perf_counter()
+        if task.instrument != None and task.instrument.timing != None and task.instrument.timing is not previousTiming:
+            timing = task.instrument.timing
+        else:
+            timing = AcquisitionTiming(startTime)
+            timing.add_transfer(startTime, endTime)
+        return (result, error, endTime - startTime, timing)
+    
+    def run(self):
+        """This method captures every registered instrument.
+        
+        A failing instrument does not stop the others. A bus failure of an instrument
+        registered with its driver is retried after a reconnection, any other failure is
+        stored in the bundle as a typed exception and the save step is skipped.
+        
+        Returns
+        -------
+        bundle: CaptureBundle
+            Results, errors and acquisition times of the capture.
+        """
+        bundle = CaptureBundle()
+        self.bundle = bundle
+        startTime = time.perf_counter()
+        tasks = []
+        for task in self.tasks:
+            if task.prepare != None:
+                try:
+                    task.prepare()
+                except Exception as error:
+                    print(task.name + " couldn't be prepared: " + str(error))
+                    bundle.errors[task.name] = error
+                    bundle.durations[task.name] = 0.0
+                    continue
+            tasks.append(task)
+        
+        if len(tasks) > 0:
+            maxWorkers = self.maxWorkers if self.maxWorkers != None else len(tasks)
+            with ThreadPoolExecutor(max_workers = maxWorkers) as executor:
+                futures = [(task, executor.submit(self.run_acquisition, task)) for task in tasks]
+                for (task, future) in futures:
+                    (result, error, duration, timing) = future.result()
+                    bundle.durations[task.name] = duration
+                    bundle.timings[task.name] = timing
+                    if error != None:
+                        print(task.name + " acquisition failed: " + str(error))
+                        bundle.errors[task.name] = error
+                    else:
+                        bundle.results[task.name] = result
+        
+        for task in tasks:
+            if task.save == None or task.name in bundle.errors:
+                continue
+            try:
+                task.save()
+            except Exception as error:
+                print(task.name + " couldn't be saved: " + str(error))
+                bundle.errors[task.name] = error
+        bundle.duration = time.perf_counter() - startTime
+        return bundle
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Binary capture files written by the save_binary methods of the drivers.
+
+A capture file is a NumPy .npz archive holding the arrays of one acquisition as they were
+read from the instrument, e.g. raw digitizer codes instead of scaled volts, and a JSON
+document with the structured metadata needed to use them: IDN, preamble, scale factors,
+instrument settings and timestamps. Reloading a capture costs no float parsing and
+keeps every setting with its full precision.
+
+The legacy tab delimited CSV files of save_csv() can be converted, their header lines
+become metadata under the same keys the drivers use.
+
+Typical usage example:
+    OSA_243A.save_binary('spectrum.npz')
+    OSA_243A.load_binary('spectrum.npz')
+    python -m src.CaptureStore OSA spectrum_1.csv spectrum_2.csv
+
+@author: ri679647
+"""
+
+import argparse
+import datetime
+import json
+import os
+import numpy as np
+from src.WaveformScaling import scale_waveform
+
+FORMAT_VERSION = 1
+METADATA_KEY = 'metadata'       # Archive member holding the JSON metadata
+LEGACY_TIME_FORMAT = '%m/%d/%Y %H:%M hrs'
+
+# Arrays written by the legacy save_csv() of every driver, first and second column
+legacyColumns = {
+    "TDS": ("time", "volts"),
+    "CSA": ("time", "volts"),
+    "DCA": ("time", "volts"),
+    "OSA": ("wavelength", "level"),
+    "RFSA": ("frequency", "spectrum"),
+}
+
+# Metadata key of every header line of the legacy files
+legacyHeaderKeys = {
+    "RECORD LENGTH": "samplePoints",
+    "SOURCE": "channel",
+    "VERTICAL SCALE": "verticalScale",
+    "HORIZONTAL SCALE": "horizontalScale",
+    "ACQUISITION MODE": "mode",
+    "REFERENCE LEVEL": "referenceLevel",
+    "SENSITIVITY": "sensitivity",
+    "RESOLUTION BANDWIDTH": "resolutionBandwidth",
+    "SPAN": "span",
+    "VIDEO BANDWIDTH": "videoBandwidth",
+    "CENTAL FREQUENCY": "centralFrequency",
+}
+
+def get_json_value(value):
+    """This function converts NumPy scalars and other values json does not know into plain types.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+def save_capture(fileName, arrays, metadata):
+    """This function writes the arrays and metadata of a capture to a .npz file.
+
+    Parameters
+    ----------
+    fileName: str
+        Capture file, written as given (NumPy would otherwise append .npz).
+    arrays: dict
+        Arrays keyed by name, saved with their dtype.
+    metadata: dict
+        JSON serializable description of the capture.
+    """
+    if METADATA_KEY in arrays:
+        raise ValueError("'" + METADATA_KEY + "' is reserved for the capture metadata")
+    metadata = dict(metadata)
+    metadata["formatVersion"] = FORMAT_VERSION
+    members = {name: np.asarray(array) for name, array in arrays.items()}
+    members[METADATA_KEY] = np.array(json.dumps(metadata, default = get_json_value, sort_keys = True))
+    with open(fileName, 'wb') as fileWriter:
+        np.savez(fileWriter, **members)
+
+def load_capture(fileName):
+    """This function reads a capture file written by save_capture().
+
+    Returns
+    -------
+    arrays: dict
+        Arrays keyed by name.
+    metadata: dict
+        Description of the capture.
+    """
+    with np.load(fileName, allow_pickle = False) as archive:
+        if METADATA_KEY not in archive.files:
+            raise ValueError(fileName + " is not a capture file")
+        metadata = json.loads(str(archive[METADATA_KEY]))
+        if metadata.get("formatVersion", 0) > FORMAT_VERSION:
+            raise ValueError(fileName + " was written by a newer capture format (" + str(metadata.get("formatVersion")) + ")")
+        arrays = {name: archive[name] for name in archive.files if name != METADATA_KEY}
+    return (arrays, metadata)
+
+def get_trace_columns(arrays, metadata):
+    """This function returns the two columns save_csv() writes for a capture, e.g. time and volts.
+
+    Raw digitizer codes are scaled with the scale factors of the metadata.
+    """
+    if "codes" in arrays:
+        scaling = metadata["scaling"]
+        return scale_waveform(arrays["codes"], scaling["xZero"], scaling["xIncrement"], scaling["pointsOffset"],
+                              scaling["yZero"], scaling["yMultiplier"], scaling["yOffset"])
+    columnNames = legacyColumns[metadata["instrument"]]
+    return (arrays[columnNames[0]], arrays[columnNames[1]])
+
+def parse_legacy_header(line, metadata):
+    """This function stores one header line of a legacy CSV file in metadata.
+
+    "Key: value (unit)" lines are stored under the key of legacyHeaderKeys without the
+    unit, a line holding only the save_csv() timestamp becomes captureTime.
+    """
+    line = line.strip().replace('"', '')
+    if line == '' or line.startswith('('):
+        return                              # Unit of a value queried with its line terminator
+    if ':' in line and not line[0].isdigit():
+        (label, value) = line.split(':', 1)
+        label = label.strip()
+        value = value.strip()
+        metadata["header"][label] = value
+        if value.endswith(')') and ' (' in value:
+            value = value[:value.rindex(' (')]
+        key = legacyHeaderKeys.get(label.upper())
+        if key != None:
+            metadata[key] = value
+        return
+    try:
+        metadata["captureTime"] = datetime.datetime.strptime(line, LEGACY_TIME_FORMAT).isoformat()
+    except ValueError:
+        metadata["header"][line] = ''      # Column titles such as "Time (s) Waveform (V)"
+
+def read_legacy_csv(fileName):
+    """This function reads a tab delimited file written by a save_csv() method.
+
+    Returns
+    -------
+    columns: array
+        One row per column of samples.
+    metadata: dict
+        Values of the header lines, see parse_legacy_header().
+    """
+    metadata = {"header": {}, "source": os.path.basename(fileName)}
+    with open(fileName, 'r', newline = '') as fileReader:
+        position = fileReader.tell()
+        line = fileReader.readline()
+        while line != '':
+            fields = line.split()
+            try:
+                [float(field) for field in fields]
+                if len(fields) > 0:
+                    break
+            except ValueError:
+                parse_legacy_header(line, metadata)
+            position = fileReader.tell()
+            line = fileReader.readline()
+        fileReader.seek(position)
+        samples = fileReader.read().split()
+    numberOfColumns = max(len(line.split()), 1)
+    samples = np.array(samples, dtype = np.float64)
+    return (samples.reshape(-1, numberOfColumns).T, metadata)
+
+def convert_legacy_csv(csvFileName, instrument, binaryFileName = None):
+    """This function converts a legacy CSV file into a capture file that the driver's load_binary() reads.
+
+    Parameters
+    ----------
+    csvFileName: str
+        File written by save_csv().
+    instrument: str
+        Driver that wrote the file: TDS, CSA, DCA, OSA or RFSA.
+    binaryFileName: str
+        Capture file, by default csvFileName with the .npz extension.
+
+    Returns
+    -------
+    binaryFileName: str
+        Capture file written.
+    """
+    columnNames = legacyColumns.get(instrument.upper())
+    if columnNames == None:
+        raise ValueError("Unknown instrument: " + str(instrument))
+    if binaryFileName == None:
+        binaryFileName = os.path.splitext(csvFileName)[0] + '.npz'
+    (columns, metadata) = read_legacy_csv(csvFileName)
+    if len(columns) < len(columnNames):
+        raise ValueError(csvFileName + " holds " + str(len(columns)) + " columns, " + str(len(columnNames)) + " expected")
+    metadata["instrument"] = instrument.upper()
+    save_capture(binaryFileName, dict(zip(columnNames, columns)), metadata)
+    return binaryFileName
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Convert legacy save_csv() files into binary capture files.")
+    parser.add_argument('instrument', help = "driver that wrote the files: " + ", ".join(legacyColumns))
+    parser.add_argument('files', nargs = '+')
+    arguments = parser.parse_args()
+    for csvFileName in arguments.files:
+        print(csvFileName + " -> " + convert_legacy_csv(csvFileName, arguments.instrument))
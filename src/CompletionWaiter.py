@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Completion waiter for long running instrument operations (sweeps, saves, ...).
+
+Instead of sleeping a fixed second between status queries, the waiter blocks on the
+GPIB service request line between checks, so an instrument that asserts SRQ at the end
+of the operation wakes it immediately. Interfaces without SRQ support fall back to
+polling with an interval that starts short and grows up to maxInterval. Every wait has
+a hard deadline.
+
+@author: ri679647
+"""
+
+import time
+import pyvisa
+from src.Instrument import get_instrument_error
+from src.InstrumentErrors import InstrumentIOError, InstrumentTimeoutError
+
+DEFAULT_TIMEOUT = 600           # Hard deadline in seconds
+DEFAULT_MIN_INTERVAL = 0.02     # First wait between completion checks in seconds
+DEFAULT_MAX_INTERVAL = 0.5      # Longest wait between completion checks in seconds
+DEFAULT_GROWTH = 1.5            # Interval multiplier after every unsuccessful check
+
+class CompletionWaiter():
+    """This class waits until an instrument operation reports completion.
+    
+    Typical usage example:
+        waiter = CompletionWaiter(self, timeout = 60)
+        duration = waiter.wait(lambda: self.query("SWEEP?").strip() == "0")
+    
+    Attributes
+    ----------
+    instrument: Instrument
+        Driver of the instrument. The service request waits are recorded in its command
+        statistics but do not hold the lock of the interface board, so the other instruments
+        of the board keep transferring, only the completion checks hold it.
+    timeout: float
+        Hard deadline of every wait in seconds.
+    minInterval: float
+        First wait between completion checks in seconds.
+    maxInterval: float
+        Longest wait between completion checks in seconds.
+    useSrq: boolean
+        Wait on the service request line between checks, cleared when the interface does not support it.
+    duration: float
+        Duration in seconds of the last completed wait.
+    checks: int
+        Number of completion checks made during the last wait.
+    """
+    def __init__(self, instrument, timeout = DEFAULT_TIMEOUT, minInterval = DEFAULT_MIN_INTERVAL,
+                 maxInterval = DEFAULT_MAX_INTERVAL, useSrq = True):
+        self.instrument = instrument
+        self.timeout = timeout
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.useSrq = useSrq
+        self.duration = 0.0
+        self.checks = 0
+    
+    def pause(self, interval):
+        """This method waits up to interval seconds, returning early if the instrument requests service.
+        
+        Interfaces that fail the wait with another error than a timeout fall back to sleeping.
+        """
+        if self.useSrq:
+            startTime = time.perf_counter()
+            try:
+                self.wait_for_srq(interval)
+                self.instrument.record_command("WAIT_SRQ", time.perf_counter() - startTime, 0, 0, False)
+                return
+            except (InstrumentIOError, AttributeError, NotImplementedError):
+                self.instrument.record_command("WAIT_SRQ", time.perf_counter() - startTime, 0, 0, True)
+                self.useSrq = False
+        time.sleep(interval)
+    
+    def wait_for_srq(self, interval):
+        """This method blocks on the service request line, a wait that times out is not a failure.
+        
+        Any other VisaIOError is raised as InstrumentIOError.
+        
+        Returns
+        -------
+        requested: boolean
+            True if the instrument requested service within interval seconds.
+        """
+        try:
+            self.instrument.handle.wait_for_srq(max(int(interval*1000), 1))
+            return True
+        except pyvisa.errors.VisaIOError as e:
+            if e.error_code == pyvisa.constants.StatusCode.error_timeout:
+                return False
+            raise get_instrument_error("WAIT_SRQ", self.instrument.address, e) from e
+    
+    def wait(self, isComplete, startTime = None):
+        """This method blocks until isComplete() returns True.
+        
+        Parameters
+        ----------
+        isComplete: function
+            Returns True once the operation finished, e.g. by querying a status register.
+        startTime: float
+            time.monotonic() value at which the operation was started, defaults to now.
+        
+        Returns
+        -------
+        duration: float
+            Observed duration of the operation in seconds.
+        """
+        if startTime == None:
+            startTime = time.monotonic()
+        deadline = startTime + self.timeout
+        interval = self.minInterval
+        self.checks = 0
+        while True:
+            self.checks = self.checks + 1
+            if isComplete():
+                self.duration = time.monotonic() - startTime
+                return self.duration
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise InstrumentTimeoutError("Operation not completed after " + str(self.timeout) + " s")
+            self.pause(min(interval, remaining))
+            interval = min(interval*DEFAULT_GROWTH, self.maxInterval)
+
+class PendingOperation():
+    """This class is the handle of an instrument operation that completes in the background.
+    
+    The caller can keep using the instrument (e.g. start the next acquisition) and check
+    the operation with done(), or block until it finishes with result().
+    
+    Typical usage example:
+        operation = dca.save_waveform(filePath, fileName)
+        ...
+        duration = operation.result()
+    
+    Attributes
+    ----------
+    isComplete: function
+        Returns True once the operation finished, raises an InstrumentError if it failed.
+    waiter: CompletionWaiter
+        Waiter used by result(), holds the deadline of the operation.
+    startTime: float
+        time.monotonic() value at which the operation was started.
+    completed: boolean
+        True once the operation was observed to finish.
+    duration: float
+        Observed duration of the operation in seconds, None until it completes.
+    """
+    def __init__(self, instrument, isComplete, timeout = DEFAULT_TIMEOUT):
+        self.isComplete = isComplete
+        self.waiter = CompletionWaiter(instrument, timeout)
+        self.startTime = time.monotonic()
+        self.completed = False
+        self.duration = None
+    
+    def done(self):
+        """This method checks the operation once without blocking.
+        
+        Returns
+        -------
+        completed: boolean
+            True if the operation finished.
+        """
+        if not self.completed:
+            if self.isComplete():
+                self.completed = True
+                self.duration = time.monotonic() - self.startTime
+            elif time.monotonic() - self.startTime > self.waiter.timeout:
+                raise InstrumentTimeoutError("Operation not completed after " + str(self.waiter.timeout) + " s")
+        return self.completed
+    
+    def result(self):
+        """This method blocks until the operation finishes or its deadline expires.
+        
+        Returns
+        -------
+        duration: float
+            Observed duration of the operation in seconds.
+        """
+        if not self.completed:
+            self.duration = self.waiter.wait(self.isComplete, self.startTime)
+            self.completed = True
+        return self.duration
@@ -6,15 +6,24 @@ Created on Mon Mar 30 12:18:19 2020
 @author: Ricardo Bustos-Ramirez
 """
 
-import sys
 import pyvisa
 import time
 import numpy as np
 import matplotlib.pyplot as plt
 import datetime
 import csv
+from src.WaveformScaling import codes_from_ascii, get_reusable_buffer, scale_waveform
+from src.CompletionWaiter import CompletionWaiter, PendingOperation
+from src.InstrumentErrors import InstrumentConnectionError, InstrumentIOError, SaveWaveformError
+from src.TraceFile import write_columns
+from src.Instrument import Instrument, timed_acquisition
 
 GLOBAL_TOUT =  100000 # IO time out in milliseconds
+SWEEP_TIMEOUT = 600   # Hard deadline of a single sweep in seconds
+SAVE_TIMEOUT = 120    # Hard deadline of a waveform save in seconds
+IO_COMPLETE_MASK = 1 << 13 # IOC bit of the Operation Event Register
+IO_FAIL_MASK = 1 << 14     # IOF bit of the Operation Event Register
+DEFAULT_WAVEFORM_FORMAT = "WORD" # :WAVEFORM:FORMAT used by acquire_waveform (ASCII, BYTE or WORD)
 
 switcherWaveformType = {
     1: "RAW",           # One data point in each time bucket w/no interpolation.
@@ -54,7 +63,12 @@ switcherWaveformUnits = {
     5: "dB"             # DECIBEL units.
 }
 
-class DCA():
+switcherWaveformDatatype = {
+    "BYTE": "b",        # 8-bit signed integer per data point.
+    "WORD": "h",        # 16-bit signed integer per data point.
+}
+
+class DCA(Instrument):
     """This class controls the high-speed data communication analyzer (DCA).
     
     The current script controls the DCA for capturing data and saving it to a CSV file.
@@ -90,11 +104,15 @@ class DCA():
             Time vector, x-axis values of a captured trace after DCA.acquire_waveform(). 
         waveformArray: array
             Voltage vector, y-axis values of a captured trace after DCA.acquire_waveform().
+        reuseBuffers: boolean
+            If this attribute is True, new captures of the same length are scaled into timeArray and waveformArray in place.
             
     """
     def __init__(self,Port=None): 
+        super().__init__()
         self.connected = False
         self.bool_sweep = False
+        self.sweepDuration = 0.0
         
 #        self.start_wl = '900.00'
 #        self.stop_wl = '1100.00'
@@ -109,7 +127,6 @@ class DCA():
 #        self.waveform = np.empty((0,1), dtype=np.float64)
 #        self.wavelength = np.empty((0,1), dtype=np.float64)
         self.parent=self
-        self.list_devices()
         self.idn='IDN'
         self.idnMfg = 'XX'
         self.idnModel = 'XX'
@@ -137,16 +154,21 @@ class DCA():
         
         self.timeArray = []
         self.waveformArray = []
+        self.reuseBuffers = False
+        self.waveformChannel = 'XX'
+        self.waveformFormat = 'XX'
+        self.waveformCoupling = 'XX'
+        self.waveformVerScale = 'XX'
+        self.waveformHorScale = 'XX'
+        self.waveformXUnits = 'XX'
+        self.waveformYUnits = 'XX'
+        self.waveformSamplePoints = 'XX'
+        self.waveformMode = 'XX'
+        self.waveformAverageCount = 0
+        self.waveformPreamble = 'XX'                                            # Preamble reply of the last acquisition
+        self.waveformCodes = None                                               # Raw record of the last acquisition
+        self.waveformScaling = None                                             # scale_waveform() factors of waveformCodes
     
-    def list_devices(self):
-        """This method list the devices in the VISA manager.
-        """
-        try:
-            self.rm = pyvisa.ResourceManager()
-            self.list = self.rm.list_resources()
-        except:
-            print("Couldn't find resource manager")
-                
     def connect(self, device):
         """
         Parameters
@@ -162,10 +184,10 @@ class DCA():
 #                self.print_message('Connected to laser ' + self.name + ' on port ' + self.port)
 #                self.connected = True
             
-            self.handle = self.rm.open_resource(device)
+            self.open_session(device)
 
             self.print_message('connected to...')
-            self.idn = str(self.handle.query("*IDN?"))
+            self.idn = str(self.query("*IDN?"))
 #            print(self.idn)
             self.idn = self.idn.split(',')
             self.idnMfg = self.idn[0]      # Manufacturer
@@ -191,31 +213,33 @@ class DCA():
         except Exception as e:
             self.print_message(e)
             self.print_message(' Couldn\'t connect to ' + device)
-            sys.exit() # From InfiniiVision Script
+            raise InstrumentConnectionError("Couldn't connect to " + str(device)) from e
             
     def set_params(self):
         if self.connected:
-#            self.handle.write('STAWL'+self.start_wl + ', STPWL'+self.stop_wl +
+#            self.write('STAWL'+self.start_wl + ', STPWL'+self.stop_wl +
 #                              ', RESOLN'+self.resolution + ', AVG'+self.average +
 #                              ', SMPL'+ self.sampling_points + ', ' + self.range)
 
-#            self.handle.write()
+#            self.write()
             self.handle.timeout = GLOBAL_TOUT
             ## Clear the instrument bus
-            self.handle.clear()
+            self.clear()
 
             ## Clear any previously encountered errors
-            self.handle.write("*CLS")
-            self.handle.write("SYSTEM:HEADER OFF")
+            with self.batch():
+                self.write("*CLS")
+                self.write("SYSTEM:HEADER OFF")
     
     def check_channel(self):
-        self.handle.write(":TIMebase:SCALe 100 NS") # Set timescale to something fast so we do not have to wait too long
-        er = str(self.handle.query("SYST:ERR?"))
-        self.handle.write(":TIMebase:POSition 0")
-        self.handle.write(":TRIGger:MODE EDGE") # Set trigger type to edge
-        self.handle.write(":TRIGger:EDGE:SOURce LINE") # Set trigger source to LINE, so there is ANYTHING to trigger on ; triggers gets set below, so ok to leave this alone
-        self.handle.query("*OPC?") # 
-        self.handle.write(":SINGle") # Do a :SINGle to fill up the memory and check the memory size (this is not a proper synchronization, but will work here)
+        with self.batch():
+            self.write(":TIMebase:SCALe 100 NS") # Set timescale to something fast so we do not have to wait too long
+            er = str(self.query("SYST:ERR?"))
+        with self.batch(waitForCompletion = True):
+            self.write(":TIMebase:POSition 0")
+            self.write(":TRIGger:MODE EDGE") # Set trigger type to edge
+            self.write(":TRIGger:EDGE:SOURce LINE") # Set trigger source to LINE, so there is ANYTHING to trigger on ; triggers gets set below, so ok to leave this alone
+        self.write(":SINGle") # Do a :SINGle to fill up the memory and check the memory size (this is not a proper synchronization, but will work here)
         time.sleep(.5)
     
     def set_waveform_parameters(self, wvfFormat, wvfCoupling, xDisplayRange, yDisplayRange, xUnits, yUnits, wvfPoints, wvfType, wvfCount):
@@ -273,34 +297,120 @@ class DCA():
         wvfCount: int
             For average, is the fewest number of hits for all time buckets, for RAW and INTERPOLATE is 0 or 1.
         """
-        waveformAscii = waveformAscii.split(',')
+        if isinstance(waveformAscii, str):
+            waveformAscii = codes_from_ascii(waveformAscii, np.float64)
         print(len(waveformAscii))
-        waveformTime = []
-        waveformVolts = []
-        y = 0
-        n = 0
-        for y in waveformAscii:
-            y = float(y)
-            waveformTime.append(  xOrigin + xIncr * ( n - xReference ) )
-            waveformVolts.append( yOrigin + yIncr * ( y - yReference ) )            
-            n = n + 1
-        self.timeArray = np.array(waveformTime)
-        self.waveformArray = np.array(waveformVolts)     
+        self.waveformCodes = waveformAscii
+        self.waveformScaling = {"xZero": xOrigin, "xIncrement": xIncr, "pointsOffset": xReference,
+                                "yZero": yOrigin, "yMultiplier": yIncr, "yOffset": yReference}
+        timeOut = None
+        voltsOut = None
+        if self.reuseBuffers:
+            timeOut = get_reusable_buffer(self.timeArray, len(waveformAscii))
+            voltsOut = get_reusable_buffer(self.waveformArray, len(waveformAscii))
+        (self.timeArray, self.waveformArray) = scale_waveform(waveformAscii, xOrigin, xIncr, xReference,
+                                                              yOrigin, yIncr, yReference, timeOut, voltsOut)
     
     def get_waveform_time(self):
         return self.timeArray
     
     def get_waveform_volts(self):
         return self.waveformArray
+    
+    def get_binary_arrays(self):
+        """This method returns the raw codes of the last acquisition, or the scaled record if it was loaded from a CSV file.
+        """
+        if self.waveformCodes is None:
+            return {"time": self.timeArray, "volts": self.waveformArray}
+        return {"codes": self.waveformCodes}
+    
+    def get_binary_metadata(self):
+        return {
+            "preamble": self.waveformPreamble,
+            "scaling": self.waveformScaling,
+            "channel": self.waveformChannel,
+            "coupling": self.waveformCoupling,
+            "verticalScale": self.waveformVerScale,
+            "horizontalScale": self.waveformHorScale,
+            "samplePoints": self.waveformSamplePoints,
+            "mode": self.waveformMode,
+            "format": self.waveformFormat,
+            "xUnits": self.waveformXUnits,
+            "yUnits": self.waveformYUnits,
+            "averageCount": self.waveformAverageCount,
+        }
+    
+    def set_binary_arrays(self, arrays, metadata):
+        self.waveformPreamble = metadata.get("preamble", 'XX')
+        self.waveformFormat = metadata.get("format", 'XX')
+        self.waveformXUnits = metadata.get("xUnits", 'XX')
+        self.waveformYUnits = metadata.get("yUnits", 'XX')
+        self.waveformAverageCount = metadata.get("averageCount", 0)
+        self.waveformChannel = metadata.get("channel", 'XX')
+        self.waveformCoupling = metadata.get("coupling", 'XX')
+        self.waveformVerScale = metadata.get("verticalScale", 'XX')
+        self.waveformHorScale = metadata.get("horizontalScale", 'XX')
+        self.waveformSamplePoints = metadata.get("samplePoints", 'XX')
+        self.waveformMode = metadata.get("mode", 'XX')
+        if "codes" in arrays:
+            scaling = metadata["scaling"]
+            self.set_waveform_values(arrays["codes"], scaling["xZero"], scaling["xIncrement"], scaling["pointsOffset"],
+                                     scaling["yZero"], scaling["yMultiplier"], scaling["yOffset"])
+        else:
+            self.waveformCodes = None
+            self.waveformScaling = None
+            self.timeArray = arrays["time"]
+            self.waveformArray = arrays["volts"]
+
+    def read_waveform_data(self, waveformFormat = DEFAULT_WAVEFORM_FORMAT):
+        """This method reads the waveform record with :WAVEFORM:DATA? in the requested format.
+        
+        Parameters
+        ----------
+        waveformFormat: str
+            ASCII, or BYTE/WORD to read an IEEE definite-length block of LSB first integers.
+        
+        Returns
+        -------
+        waveformData: array
+            ASCII values or raw BYTE/WORD codes, to be scaled with the :WAVEFORM:PREAMBLE? values.
+        """
+        if waveformFormat == "ASCII":
+            return codes_from_ascii(self.query(":WAVEFORM:DATA?"), np.float64)
+        datatype = switcherWaveformDatatype.get(waveformFormat)
+        if datatype == None:
+            raise ValueError("Invalid waveform format: " + str(waveformFormat))
+        return self.query_binary_block(":WAVEFORM:DATA?", datatype, False)
 
-    def acquire_waveform(self):
-        self.handle.write(":WAVEFORM:FORMAT ASCII:ACQUIRE:AVERAGE ON:ACQUIRE:COUNT 8:ACQUIRE:POINTS  1024:MEAS:CLE:WAVEFORM:SOURCE CHANNEL1:DIGITIZE CHANNEL1")
+    @timed_acquisition
+    def acquire_waveform(self, waveformFormat = DEFAULT_WAVEFORM_FORMAT):
+        """This method digitizes channel 1 and stores the scaled record in timeArray and waveformArray.
+        
+        Parameters
+        ----------
+        waveformFormat: str
+            Transfer format, WORD (default) or BYTE for binary transfers, ASCII as a fallback.
+        """
+        waveformFormat = waveformFormat.upper()
+        if waveformFormat != "ASCII" and waveformFormat not in switcherWaveformDatatype:
+            raise ValueError("Invalid waveform format: " + str(waveformFormat))
+        with self.batch():
+            self.write(":WAVEFORM:FORMAT " + waveformFormat)
+            self.write(":WAVEFORM:BYTEORDER LSBFIRST")
+            self.write(":ACQUIRE:AVERAGE ON")
+            self.write(":ACQUIRE:COUNT 8")
+            self.write(":ACQUIRE:POINTS 1024")
+            self.write(":MEAS:CLE")
+            self.write(":WAVEFORM:SOURCE CHANNEL1")
+            self.write(":DIGITIZE CHANNEL1")
+        self.mark_trigger()
         time.sleep(1)
-        dcaStatus = self.handle.query("*OPC?")
+        dcaStatus = self.query("*OPC?")
         print("DCA status: " + dcaStatus)
         time.sleep(1)
-        waveformParameters = self.handle.query(":WAVEFORM:PREAMBLE?")
+        waveformParameters = self.query(":WAVEFORM:PREAMBLE?")
         print('Waveform parameters: ' + waveformParameters)
+        self.waveformPreamble = waveformParameters.strip()
         waveformParameters = waveformParameters.split(",")
         
         wvfFormat = int(waveformParameters[0])              # Waveform format (e.g: 0 - ASCII)
@@ -328,102 +438,114 @@ class DCA():
         maxBwLimit = float(waveformParameters[23])          # Estimated maximum bandwidth of the source waveform (e.g. 50e9 [Hz])
         minBwLimit = float(waveformParameters[24])          # Estimated minimum bandwidth of the source waveform (e.g. 0 [Hz])
         
-        waveformAscii = self.handle.query(":WAVEFORM:DATA?")
+        if switcherWaveformFormat.get(wvfFormat) != waveformFormat:
+            # The data would be decoded with the wrong format, e.g. ASCII text as WORD codes
+            raise InstrumentIOError("Waveform format " + switcherWaveformFormat.get(wvfFormat, str(wvfFormat)) + " does not match requested format " + waveformFormat)
+        waveformData = self.read_waveform_data(waveformFormat)
         self.set_waveform_parameters(wvfFormat, wvfCoupling, xDisplayRange, yDisplayRange, xUnits, yUnits, wvfPoints, wvfType, wvfCount)
-        self.set_waveform_values(waveformAscii, xOrigin, xIncr, xReference, yOrigin, yIncr, yReference)
-        plt.plot(self.get_waveform_time(), self.get_waveform_volts(), 'b')
+        self.set_waveform_values(waveformData, xOrigin, xIncr, xReference, yOrigin, yIncr, yReference)
     
         
-    def save_waveform(self, filePath, fileName):
-        TYPE = "ASCiixy" # "CSV" or "ASCiixy" or "BINary"
-        self.handle.write(':SAVE:FILename "' + str(fileName) + '"')
-        self.handle.write(":SAVE:WAVeform:FORMat " + str(TYPE))
-        
-        self.handle.write(":SAVE:WAVeform:LENGth 1000")
-        
-        print("Now saving waveforms to file.\n")
-        
-        self.handle.query("*CLS;*OPC?") # Clear all registers before issuing the command to save the data; this is necessary so we can properly determine when the scope is done saving data.
-        self.handle.write(':SAVE:WAVeform:STARt "' +  str(filePath) + '\\' + str(fileName) + '"')
+    def check_save_status(self):
+        """This method checks the Operation Event Register once for the end of a waveform save.
         
-        ## First definite IOC and IOF criterion:
-        IO_COMPLETE_BIT = 13 #  the IOC bit is bit-weigh 13 in the Operation Event Register
-        IO_COMPLETE_MASK = 1<< IO_COMPLETE_BIT # << is a left shift; 1<<13 = 8192 = 2 raised to 13;
-        IO_COMPLETE = 1 << IO_COMPLETE_BIT
-        IO_NOT_COMPLETE = 0
+        Reading :OPER:EVENt? clears the register, so every bit is reported by one query only.
         
-        IO_FAIL_BIT = 14 #  the IOC bit is bit-weigh 14 in the Operation Event Register
-        IO_FAIL_MASK = 1<< IO_FAIL_BIT # << is a left shift; 1<<14 = 16384 = 2 raised to 14;
-        IO_FAIL = 1<< IO_FAIL_BIT
-        IO_NOT_FAIL = 0
+        Returns
+        -------
+        completed: boolean
+            True if the save finished.
+        """
+        status = int(self.query(":OPER:EVENt?")) # DO NOT use :OPERation
+        if status & IO_FAIL_MASK: # Checked first: removing the USB stick while saving sets both IOF and IOC
+            self.clear() # Clear scope communications interface, the session stays open
+            raise SaveWaveformError("FAILED saving waveforms to USB stick. Check that a USB stick is inserted and that you can manually save a file to it.")
+        if status & IO_COMPLETE_MASK:
+            print("Done saving waveforms to USB stick.\n")
+            return True
+        return False
+    
+    def save_waveform(self, filePath, fileName, timeout = SAVE_TIMEOUT):
+        """This method starts saving the waveform to the scope storage and returns without waiting.
         
-        ## Define IOF and IOC initial states:
-        IOC_STATUS = 0
-        IOF_STATUS = 0
+        The scope keeps saving while the caller continues, e.g. with the next acquisition.
+        A failed save raises SaveWaveformError and leaves the connection open.
         
-        self.handle.query(":OPER:EVENt?")
-        ## Begin checking for IO_Status
-        while IOF_STATUS ==  IO_NOT_FAIL and IOC_STATUS == IO_NOT_COMPLETE: # Note there is no time qualification here... it should just eventually be done, or fail... eventually.
-            Status = int(self.handle.query(":OPER:EVENt?")) # DO NOT use :OPERation
-            IOC_STATUS = Status & IO_COMPLETE_MASK # A bitwise and of Status IO_COMPLETE_MASK
-            IOF_STATUS = Status & IO_FAIL_MASK
-            if IOF_STATUS == IO_FAIL:
-                print("FAILED saving waveforms to USB stick.\n")
-                print("Check that a USB stick is inserted and that you can manually save a file to the USB tick.  If not, try a different USB stick.\n")
-                print("Aborting script and properly closing scope.\n")
-                self.handle.clear() # Clear scope communications interface
-                self.handle.close() # Close communications interface to scope
-                sys.exit()
-            if IOC_STATUS == IO_COMPLETE: # you need to do this last. If you were to remvoe the USB stick whiel it is saving, it will say that the IO operation is both failed and done...
-                print("Done saving waveforms to USB stick.\n")
-                break # Break out of while loop to avoid the wait time below
-            time.sleep(0.1) # Pause 100 ms to prevent excessive queries (probably ok to go faster)
+        Parameters
+        ----------
+        filePath: str
+            Folder on the scope storage.
+        fileName: str
+            Name of the saved file.
+        timeout: float
+            Hard deadline of the save in seconds.
         
-        ##############################################################################################################################################################################
-        ##############################################################################################################################################################################
-        ## Done - cleanup
-        ##############################################################################################################################################################################
-        ##############################################################################################################################################################################
+        Returns
+        -------
+        operation: PendingOperation
+            Handle of the save, operation.result() blocks until it finishes.
+        """
+        TYPE = "ASCiixy" # "CSV" or "ASCiixy" or "BINary"
+        with self.batch():
+            self.write(':SAVE:FILename "' + str(fileName) + '"')
+            self.write(":SAVE:WAVeform:FORMat " + str(TYPE))
+            
+            self.write(":SAVE:WAVeform:LENGth 1000")
+            
+            print("Now saving waveforms to file.\n")
+            
+            self.query("*CLS;*OPC?") # Clear all registers before issuing the command to save the data; this is necessary so we can properly determine when the scope is done saving data.
+        self.query(":OPER:EVENt?") # Clear stale events before starting the save
+        self.write(':SAVE:WAVeform:STARt "' +  str(filePath) + '\\' + str(fileName) + '"')
         
-        self.handle.clear() # Clear scope communications interface
-        self.handle.close() # Close communications interface to scope
-#        
-        print("Done.")
+        return PendingOperation(self, self.check_save_status, timeout)
                 
     def close(self):
         
-        self.handle.write("GTL")
+        self.write("GTL")
         time.sleep(1)
-        self.rm.close()
+        self.close_session()
         self.print_message('Connection to OSA closed')
         
-    def send_cmd(self, cmd):
-        
-        self.handle.write(cmd)
-         
-        response = self.handle.read_raw()
-        return response
-    
     def cont_sweep(self):
 
         self.bool_sweep = True
-        self.handle.write("RPT")
+        self.write("RPT")
     
-    def single_sweep(self):
-
+    def single_sweep(self, timeout = SWEEP_TIMEOUT, srqCommand = None):
+        """This method starts a single sweep (SGL) and waits until SWEEP? reports it finished.
+        
+        The wait wakes on a service request from the instrument and otherwise polls SWEEP?
+        with a sub-second adaptive interval, see CompletionWaiter.
+        
+        Parameters
+        ----------
+        timeout: float
+            Hard deadline of the sweep in seconds, InstrumentTimeoutError is raised after it.
+        srqCommand: str
+            Optional command sent before SGL that makes the instrument assert SRQ when the sweep ends.
+        
+        Returns
+        -------
+        sweepDuration: float
+            Observed sweep duration in seconds.
+        """
         self.bool_sweep = True
-        self.handle.write("SGL")
-        time.sleep(1)
-        response = self.handle.query("SWEEP?")
-        while response != "0\r\n":
-            time.sleep(1)
-            response = self.handle.query("SWEEP?")
-#            print(response)
-        self.bool_sweep = False
+        if srqCommand != None:
+            self.write(srqCommand)
+        startTime = time.monotonic()
+        self.write("SGL")
+        self.mark_trigger()
+        waiter = CompletionWaiter(self, timeout)
+        try:
+            self.sweepDuration = waiter.wait(lambda: self.query("SWEEP?").strip() == "0", startTime)
+        finally:
+            self.bool_sweep = False
+        return self.sweepDuration
 
     def grab_spectrum(self, channel = 'A'):
             try:            
-                tmp = self.handle.query('LDAT'+channel)
+                tmp = self.query('LDAT'+channel)
 #                print(tmp)
                 time.sleep(1)
                 tmp2 = [float(k) for k in tmp.split(',')]
@@ -434,7 +556,7 @@ class DCA():
                 print('Acquisition error with spectrum values\r\n')
             
             try:                
-                tmp = self.handle.query('WDAT'+channel)
+                tmp = self.query('WDAT'+channel)
 #                print(tmp)
                 time.sleep(1)
                 tmp2 = [float(k) for k in tmp.split(',')]
@@ -445,19 +567,19 @@ class DCA():
                 print('Acquisition error with wavelength values\r\n')  
     
     def get_span(self):
-        self.span_wl = self.handle.query("SPAN?")
+        self.span_wl = self.query("SPAN?")
         time.sleep(1)
         self.span_wl = self.span_wl.replace("\r","")
         self.span_wl = self.span_wl.replace("\n","") 
     
     def get_rbw(self):
-        self.rbw_wl = self.handle.query("RESLN?")
+        self.rbw_wl = self.query("RESLN?")
         time.sleep(1)
         self.rbw_wl = self.rbw_wl.replace("\r","")
         self.rbw_wl = self.rbw_wl.replace("\n","") 
 
     def get_sensitivity(self):
-        sensitivity_num = self.handle.query("SENS?")
+        sensitivity_num = self.query("SENS?")
         time.sleep(1)
         sensitivity_num = sensitivity_num.replace("\r","")
         sensitivity_num = sensitivity_num.replace("\n","")
@@ -473,20 +595,16 @@ class DCA():
         self.sensitivity = sensitivity_lvl.get(sensitivity_num)
     
     def get_ref_lvl(self):
-        self.reference_lvl = self.handle.query("REFL?")
+        self.reference_lvl = self.query("REFL?")
         time.sleep(1)
         self.reference_lvl = self.reference_lvl.replace("\r","")
         self.reference_lvl = self.reference_lvl.replace("\n","")
         
-    def print_message(self, msg):
-        if __name__ == "__main__":
-            print(msg)
-    
     def save_csv(self, fileName):
         try:
             with open(fileName, 'w',newline='') as fileWriter:
                 self.csvWriter = csv.writer(fileWriter, delimiter = '\t')
-                now_ = datetime.datetime.now()
+                now_ = self.get_capture_datetime()
                 timestamp = now_.strftime('%m/%d/%Y %H:%M hrs')
                 self.csvWriter.writerow([timestamp])
 #                self.csvWriter.writerow(["Record length: " + self.get_waveform_sample_points()])
@@ -500,8 +618,7 @@ class DCA():
 #                self.csvWriter.writerow(["Acquisition mode: " + self.get_waveform_mode()])
 ##                self.csvWriter.writerow(["Number of averages: " + self.span_wl])
                 self.csvWriter.writerow(["Time (s) Waveform (V)"])
-                for (x,y) in zip(self.get_waveform_time(), self.get_waveform_volts()):
-                    self.csvWriter.writerow(('{0:.12f}'.format(x),'{0:.12f}'.format(y)))
+                write_columns(fileWriter, (self.get_waveform_time(), self.get_waveform_volts()), ('%.12f', '%.12f'))
         except:
             self.close()
             print("Error while saving " + fileName + " file")
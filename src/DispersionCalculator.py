@@ -9,10 +9,11 @@ import matplotlib.pyplot as plt
 from scipy import integrate
 import csv
 import numpy as np
-import math
 import tkinter as tk
 from tkinter import filedialog
 import os
+from src.CaptureStore import get_trace_columns
+from src.TraceFile import read_trace_csv
 
 class DispersionCalculator():
     """This class calculates the mask for harmonic injection locking.
@@ -189,26 +190,12 @@ class DispersionCalculator():
         plt.show()        
     
     def read_csv_optical_spectrum(self, fileName):
-        self.wavelength = []
-        self.spectrum = []
-        self.header = []
-        with open(fileName, 'r') as fileReader:
-            self.csvReader = csv.reader(fileReader, delimiter ='\t')
-            for row in self.csvReader:
-                if(len(row) > 1):
-                    self.wavelength.append(float(row[0]))
-                    self.spectrum.append(float(row[1]))
-                else:
-                    self.header.append(row)
-            # Define useful constants for mask calculation
-            self.maxWavelength  =  max(self.wavelength)
-            self.minWavelength  =  min(self.wavelength)            
-            self.lenWavelength  =  len(self.wavelength)
-            self.wavelengthSpan =  self.maxWavelength - self.minWavelength
-            self.maxSpectrum    =  max(self.spectrum)
-            self.minSpectrum    =  min(self.spectrum)            
-            self.lenSpectrum    =  len(self.spectrum)
-            self.spectrumSpan   =  self.maxSpectrum - self.minSpectrum
+        ((self.wavelength, self.spectrum), self.header, extrema) = read_trace_csv(fileName)
+        # Define useful constants for mask calculation
+        (self.minWavelength, self.maxWavelength, self.wavelengthSpan) = extrema[0]
+        self.lenWavelength  =  len(self.wavelength)
+        (self.minSpectrum, self.maxSpectrum, self.spectrumSpan) = extrema[1]
+        self.lenSpectrum    =  len(self.spectrum)
     
     def get_wavelength_output(self):
         return self.wavelength
@@ -217,17 +204,34 @@ class DispersionCalculator():
         return self.spectrum
 
     def read_csv_optical_pulses(self, fileName):
-        self.timeOutput = []
-        self.voltageOutput = []
+        ((self.timeOutput, self.voltageOutput), self.header, extrema) = read_trace_csv(fileName)
+    
+    def read_session_optical_pulses(self, sessionStore, traceName, memoryMap = True):
+        """This method reads an SHG trace appended to a session (see SessionStore) like read_csv_optical_pulses().
+        
+        The time and voltage outputs are kept as NumPy arrays. memoryMap only avoids copying the
+        stored arrays out of the session file: oscilloscope records hold raw codes, which are
+        scaled into new time and voltage arrays, so every sample of the trace is still read.
+        """
+        (arrays, metadata) = sessionStore.read(traceName, memoryMap)
+        (self.timeOutput, self.voltageOutput) = get_trace_columns(arrays, metadata)
         self.header = []
-        with open(fileName, 'r') as fileReader:
-            self.csvReader = csv.reader(fileReader, delimiter ='\t')
-            for row in self.csvReader:
-                if(len(row) > 1):
-                    self.timeOutput.append(float(row[0]))
-                    self.voltageOutput.append(float(row[1]))
-                else:
-                    self.header.append(row)
+    
+    def read_session_optical_spectrum(self, sessionStore, traceName, memoryMap = True):
+        """This method reads an OSA spectrum appended to a session (see SessionStore) like read_csv_optical_spectrum().
+        """
+        (arrays, metadata) = sessionStore.read(traceName, memoryMap)
+        (self.wavelength, self.spectrum) = get_trace_columns(arrays, metadata)
+        self.header = []
+        # Define useful constants for mask calculation
+        self.maxWavelength  =  float(np.max(self.wavelength))
+        self.minWavelength  =  float(np.min(self.wavelength))
+        self.lenWavelength  =  len(self.wavelength)
+        self.wavelengthSpan =  self.maxWavelength - self.minWavelength
+        self.maxSpectrum    =  float(np.max(self.spectrum))
+        self.minSpectrum    =  float(np.min(self.spectrum))
+        self.lenSpectrum    =  len(self.spectrum)
+        self.spectrumSpan   =  self.maxSpectrum - self.minSpectrum
     
     def get_time_output(self):
         return self.timeOutput
@@ -236,13 +240,12 @@ class DispersionCalculator():
         return self.voltageOutput
     
     def set_autocorrelation_values(self, timeOutput, voltageOutput):
-        self.delayPs = []
-        self.shgIntensity = []
+        # Lists and memory-mapped arrays alike, the delay and intensity are computed as arrays
+        voltageOutput = np.asarray(voltageOutput, dtype = np.float64)
         # Define useful constants for SHG intensity autocorrelation
-        maxVoltageOutput = max(voltageOutput)            
-        for timeElement, voltageElement in zip(timeOutput, voltageOutput):
-            self.delayPs.append(timeElement * 31.6 * 1e3)
-            self.shgIntensity.append(voltageElement/maxVoltageOutput)
+        maxVoltageOutput = np.max(voltageOutput)
+        self.delayPs = np.asarray(timeOutput, dtype = np.float64) * 31.6 * 1e3
+        self.shgIntensity = voltageOutput/maxVoltageOutput
     
     def get_delay_ps(self):
         return self.delayPs
@@ -259,7 +262,8 @@ class DispersionCalculator():
 #        print(section_wavelength)
         index_frep_span = int(self.lenWavelength/section_wavelength)
 #        print(index_frep_span)
-        spectrum_max_index = spectrumOutput.index(self.maxSpectrum)
+        spectrumOutput = np.asarray(spectrumOutput)     # Slices of an array are views, also of a memory map
+        spectrum_max_index = int(np.argmax(spectrumOutput))
 #        print(spectrumOutput[spectrum_max_index])
         if int((spectrum_max_index%index_frep_span)-(index_frep_span/2)) > 0:
             initial_index = int((spectrum_max_index%index_frep_span)-(index_frep_span/2))
@@ -273,9 +277,9 @@ class DispersionCalculator():
         for i in range(section_wavelength):
 #            print(i)
             sub_spectrum = spectrumOutput[initial_index+i*index_frep_span:initial_index+(i+1)*index_frep_span]
-            self.comblineSpectrumWavelength.append(max(sub_spectrum))
-            max_index = initial_index + i*index_frep_span + sub_spectrum.index(self.comblineSpectrumWavelength[i])
-            self.comblineWavelength.append(wavelengthOutput[max_index])
+            max_index = initial_index + i*index_frep_span + int(np.argmax(sub_spectrum))
+            self.comblineSpectrumWavelength.append(float(spectrumOutput[max_index]))
+            self.comblineWavelength.append(float(wavelengthOutput[max_index]))
         for x in self.comblineWavelength:
             self.comblineFrequency.append(((self.c0/(x*1e-9))*1e-12)-self.frequencyOffset)
         self.comblineFrequency.reverse()
@@ -364,30 +368,18 @@ class DispersionCalculator():
     def get_optical_spectrum_bandwidth_and_tlp(self):
         wavelength = self.get_wavelength_combline()
         comblineWavelength = self.get_spectrum_combline_wavelength()
-        linearCombline = [math.pow(10, x/10) for x in comblineWavelength]
-        maxLinearCombline = max(linearCombline)
-        normalizedLinearCombline = [x/maxLinearCombline for x in linearCombline]
+        linearCombline = np.power(10, np.asarray(comblineWavelength, dtype = np.float64)/10)
+        maxLinearCombline = np.max(linearCombline)
+        normalizedLinearCombline = linearCombline/maxLinearCombline
         wavelengthInterp = np.linspace(wavelength[0],wavelength[-1], 1000)
         spectrumInterp = np.interp(wavelengthInterp, wavelength, normalizedLinearCombline)
 #        plt.plot(wavelengthInterp, spectrumInterp, 'r')
 #        plt.show()
-        i = 0
-        while True:            
-            if spectrumInterp[i] > 0.5:
-                bandwidthValue1 = wavelengthInterp[i]
-                break
-            else:
-                i = i + 1
-        
-        i = len(spectrumInterp) - 1
-        while True:
-            if spectrumInterp[i] > 0.5:
-                bandwidthValue2 = wavelengthInterp[i]
-                break
-            else:
-                i = i - 1
-        opticalBandwidth = bandwidthValue2 - bandwidthValue1
-        centralWavelengthIndex = linearCombline.index(maxLinearCombline)
+        aboveHalf = np.flatnonzero(spectrumInterp > 0.5)   # First and last point above half maximum
+        bandwidthValue1 = wavelengthInterp[aboveHalf[0]]
+        bandwidthValue2 = wavelengthInterp[aboveHalf[-1]]
+        opticalBandwidth = float(bandwidthValue2 - bandwidthValue1)
+        centralWavelengthIndex = int(np.argmax(linearCombline))
         centralWavelength = wavelength[centralWavelengthIndex]
         frequencyBandwidth = 3e8*opticalBandwidth*1e-9/((centralWavelength*1e-9)**2)
         transformLimitedPulsePs = (0.441/frequencyBandwidth)*1e12
@@ -395,29 +387,22 @@ class DispersionCalculator():
         
     def get_autocorrelation_pulse_width(self):
         delayPs = self.get_delay_ps()
-        shgIntensity = self.get_shg_intensity()
-        i = 0
-        while True:            
-            if shgIntensity[i] > 0.5:
-                pulsewidthValue1 = delayPs[i]
-                break
-            else:
-                i = i + 1
-        
-        i = len(shgIntensity) - 1
-        while True:
-            if shgIntensity[i] > 0.5:
-                pulsewidthValue2 = delayPs[i]
-                break
-            else:
-                i = i - 1
-        return pulsewidthValue2 - pulsewidthValue1
+        shgIntensity = np.asarray(self.get_shg_intensity())
+        aboveHalf = np.flatnonzero(shgIntensity > 0.5)     # First and last point above half maximum
+        pulsewidthValue1 = delayPs[aboveHalf[0]]
+        pulsewidthValue2 = delayPs[aboveHalf[-1]]
+        return float(pulsewidthValue2 - pulsewidthValue1)
     
     def get_autocorrelation_peak_value(self):
         shgVoltageOutput = self.get_voltage_output()
-        return max(shgVoltageOutput)
+        return float(np.max(shgVoltageOutput))
     
-    def get_autocorrelation_values(self, fileName, filePath):
+    def get_autocorrelation_values(self, fileName, filePath, sessionStore = None):
+        """
+        The traces listed in the index file fileName are read from the CSV files in
+        filePath\\SHG, or memory-mapped from sessionStore if the sweep appended them to a
+        session, so a whole archive is analysed holding one trace at a time.
+        """
         acFileNameArray = []
         acDispersionArray = []
         acPulseWidthArray = []
@@ -426,13 +411,19 @@ class DispersionCalculator():
             with open(fileName, "r", newline='') as fileReader:
                 self.csvReader = csv.reader(fileReader, delimiter =',', lineterminator='\n')
                 for row in self.csvReader:
-                    acFileNameArray.append(filePath + "\\SHG\\" + str(row[0]) + ".csv")
+                    if sessionStore == None:
+                        acFileNameArray.append(filePath + "\\SHG\\" + str(row[0]) + ".csv")
+                    else:
+                        acFileNameArray.append("SHG/" + str(row[0]))
                     acDispersionArray.append(float(row[11]))
         else:
             print("Index file does not exist.")
             
         for acDispersion,acFileName in zip(acDispersionArray, acFileNameArray):
-            self.read_csv_optical_pulses(acFileName)
+            if sessionStore == None:
+                self.read_csv_optical_pulses(acFileName)
+            else:
+                self.read_session_optical_pulses(sessionStore, acFileName)
             timeOutput = self.get_time_output()
             voltageOutput = self.get_voltage_output()
             self.set_autocorrelation_values(timeOutput, voltageOutput)
@@ -455,17 +446,27 @@ class DispersionCalculator():
         self.plot_autocorrelation_values(acDispersionArray, acPulseWidthArray, acPulsePeakArray)
         return (acPulseWidthArray, acPulsePeakArray)
     
-    def get_autocorrelation_values_from_file_array(self, fileArray, dispersionArray, filePath):
+    def get_autocorrelation_values_from_file_array(self, fileArray, dispersionArray, filePath, sessionStore = None):
+        """
+        The traces of fileArray are read from the CSV files in filePath, or from sessionStore
+        if the sweep appended them to a session.
+        """
         acFileNameArray = []
         acDispersionArray = []
         acPulseWidthArray = []
         acPulsePeakArray = []
         for x, y in zip(fileArray, dispersionArray):
-            acFileNameArray.append(filePath + "\\" + str(x))
+            if sessionStore == None:
+                acFileNameArray.append(filePath + "\\" + str(x))
+            else:
+                acFileNameArray.append(str(x))
             acDispersionArray.append(float(y))
             
         for acDispersion,acFileName in zip(acDispersionArray, acFileNameArray):
-            self.read_csv_optical_pulses(acFileName)
+            if sessionStore == None:
+                self.read_csv_optical_pulses(acFileName)
+            else:
+                self.read_session_optical_pulses(sessionStore, acFileName)
             timeOutput = self.get_time_output()
             voltageOutput = self.get_voltage_output()
             self.set_autocorrelation_values(timeOutput, voltageOutput)
@@ -552,6 +553,12 @@ class DispersionCalculator():
         self.set_optical_spectrum_array(wavelengthOutput, spectrumOutput)
 #        self.plot_mask_and_original()
     
+    def set_optical_spectrum_from_session(self, sessionStore, traceName):
+        self.read_session_optical_spectrum(sessionStore, traceName)
+        wavelengthOutput = self.get_wavelength_output()
+        spectrumOutput = self.get_spectrum_output()
+        self.set_optical_spectrum_array(wavelengthOutput, spectrumOutput)
+    
     def set_autocorrelation_from_file(self, fileName = None):
         if fileName == None:
             fileName = filedialog.askopenfilename()
@@ -12,26 +12,28 @@ Created on Mon Mar 30 12:18:19 2020
 @author: ri679647
 """
 
-import sys
 import pyvisa
 import time
 import numpy as np
 import matplotlib.pyplot as plt
 import datetime
 import csv
+from src.InstrumentErrors import InstrumentConnectionError
+from src.TraceFile import write_columns
+from src.Instrument import Instrument
 #import types
 
 GLOBAL_TOUT =  100000   # IO time out in milliseconds
 MIN_FREQ = 10e6         # Minimum possible frequency 10 MHz
 MAX_FREQ = 40e9         # Maximum possible frequency 40 GHz
 
-class ElectricalSynthesizer():
+class ElectricalSynthesizer(Instrument):
     def __init__(self,Port=None): 
+        super().__init__()
         self.connected = False
         self.bool_sweep = False
 
         self.parent=self
-        self.list_devices()
         self.idn='IDN'
         self.idnMfg = 'XX'
         self.idnModel = 'XX'
@@ -41,19 +43,12 @@ class ElectricalSynthesizer():
         self.psgFrequency = 'XX'
         self.powerAttenuation = 'XX'
            
-    def list_devices(self):
-        try:
-            self.rm = pyvisa.ResourceManager()
-            self.list = self.rm.list_resources()
-        except:
-            print("Couldn't find resource manager")
-                
     def connect(self, device): 
         try:          
-            self.handle = self.rm.open_resource(device)
+            self.open_session(device)
 
             self.print_message('connected to...')
-            self.idn = str(self.handle.query("*IDN?"))
+            self.idn = str(self.query("*IDN?"))
             print(self.idn)
             self.idn = self.idn.split(',')
             self.idnMfg = self.idn[0]                                           # Manufacturer
@@ -68,38 +63,38 @@ class ElectricalSynthesizer():
         except Exception as e:
             self.print_message(e)
             self.print_message(' Couldn\'t connect to: ' + device)
-            sys.exit() # From InfiniiVision Script
+            raise InstrumentConnectionError("Couldn't connect to " + str(device)) from e
     
     def reset_psg(self):
-        self.handle.write("*RST")
+        self.write("*RST")
     
     def get_measurement_params(self):
-        self.handle.write("DCL")
+        self.write("DCL")
     
     def set_params(self):
         self.handle.timeout = GLOBAL_TOUT
         ## Clear the instrument bus
-        self.handle.clear()
+        self.clear()
 
         ## Clear any previously encountered errors
-        self.handle.write("*CLS")
+        self.write("*CLS")
     
     def get_psg_frequency(self):
-        self.psgFrequency = float(self.handle.query("FREQUENCY:FIXED?"))
+        self.psgFrequency = float(self.query("FREQUENCY:FIXED?"))
         print('Output frequency: ' + str(self.psgFrequency) + ' Hz')
         return self.psgFrequency
     
     def set_psg_frequency(self, psgFrequency):
         if isinstance(psgFrequency, float):
             if psgFrequency >= MIN_FREQ and psgFrequency <= MAX_FREQ:
-                self.handle.write("FREQUENCY:FIXED " + str(psgFrequency))
+                self.write("FREQUENCY:FIXED " + str(psgFrequency))
             else:
                 print("Set frequency outside of PSG limits.")
         else:
             print("Invalid type for set frequency.")
 
     def get_psg_output_state(self):
-        psgOutputNumState = self.handle.query("OUTPUT?")
+        psgOutputNumState = self.query("OUTPUT?")
         print("PSG output state: " + psgOutputNumState)
         if psgOutputNumState == '0\n':
             self.psgOutputState = 'OFF'
@@ -113,39 +108,38 @@ class ElectricalSynthesizer():
         return self.psgOutputState
     
     def set_psg_output_state(self, psgState):
-        self.handle.write("OUTPUT " + psgState)
+        self.write("OUTPUT " + psgState)
 
     def get_power_attenuation(self):
-        self.powerAttenuation = float(self.handle.query("POWER:ATTENUATION?"))
+        self.powerAttenuation = float(self.query("POWER:ATTENUATION?"))
         print('Output attenuation: ' + str(self.powerAttenuation) + ' dB')
         return self.powerAttenuation
     
     def set_power_attenuation(self, powerAttenuation):        
-        self.handle.write("POWER:ATTENUATION 10DB")# + powerAttenuation)
+        self.write("POWER:ATTENUATION 10DB")# + powerAttenuation)
+    
+    def get_binary_metadata(self):
+        return {"frequency": self.psgFrequency, "powerAttenuation": self.powerAttenuation}
+    
+    def set_binary_arrays(self, arrays, metadata):
+        self.psgFrequency = metadata.get("frequency", 'XX')
+        self.powerAttenuation = metadata.get("powerAttenuation", 'XX')
     
     def close(self):
-        
-        self.handle.write("*CLS")
+        sessionFailed = False
+        try:
+            self.write("*CLS")
+        except Exception as e:
+            self.print_message(e)
+            sessionFailed = True                                                # Not handed back to the pool
         time.sleep(1)
         try:
-            self.rm.close()
+            self.close_session(sessionFailed)
         except Exception as e:
             self.print_message(e)
-            sys.exit() # From InfiniiVision Script                
         time.sleep(1)
         self.print_message('Connection to ' + self.idnMfg + ': ' + self.idnModel + ' closed')
         
-    def send_cmd(self, cmd):
-        
-        self.handle.write(cmd)
-         
-        response = self.handle.read_raw()
-        return response
-    
-    def print_message(self, msg):
-        if __name__ == "__main__":
-            print(msg)
-   
     def save_csv(self, fileName):
         try:
             with open(fileName, 'w',newline='') as fileWriter:
@@ -164,8 +158,7 @@ class ElectricalSynthesizer():
                 self.csvWriter.writerow(["Acquisition mode: " + self.get_waveform_mode()])
 #                self.csvWriter.writerow(["Number of averages: " + self.span_wl])
                 self.csvWriter.writerow(["Time (s) Waveform (V)"])
-                for (x,y) in zip(self.get_waveform_time(), self.get_waveform_volts()):
-                    self.csvWriter.writerow(('{0:.12f}'.format(x),'{0:.12f}'.format(y)))
+                write_columns(fileWriter, (self.get_waveform_time(), self.get_waveform_volts()), ('%.12f', '%.12f'))
         except Exception as e:
             print(e)
             self.close()
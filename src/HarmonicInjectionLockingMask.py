@@ -43,10 +43,7 @@ class MasterOpticalFrequencyCombManager():
         self.osaManager.connect(self.osaGpibAddress)
         self.osaManager.single_sweep()
         time.sleep(1)
-        self.osaManager.get_span()
-        self.osaManager.get_rbw()
-        self.osaManager.get_sensitivity()
-        self.osaManager.get_ref_lvl()
+        self.osaManager.snapshot_settings()
         self.osaManager.grab_spectrum(channel)
         self.osaManager.save_csv(self.filePathOsa + '\\' + fileName)
 #        self.osaManager.close()
@@ -0,0 +1,765 @@
+# -*- coding: utf-8 -*-
+"""
+Base class of the instrument drivers.
+
+Every query, write and block transfer of a driver goes through a single choke point
+that records the latency, the bytes moved and the errors of each command header, so the
+bus traffic of the whole bench can be profiled in one place.
+
+A bus failure is raised as a typed InstrumentError. reconnect() reopens the session with
+the exponential backoff of a ReconnectPolicy, sends a device clear and replays the cached
+configuration, so long sweeps survive a bus hiccup without a restart.
+
+Writes issued inside a batch() block are coalesced into a single program message, so a
+configuration sequence costs one bus round trip instead of one per command.
+
+Acquisition methods decorated with timed_acquisition also record the trigger time and
+the start and end of their bus transfers on the time.perf_counter() clock, which is
+monotonic, high resolution and shared by every driver of the process.
+
+save_binary() and load_binary() keep the last acquisition in a capture file (see
+CaptureStore) with its IDN, cached settings and timestamps, append_to_session() and
+load_from_session() keep it in a session file holding a whole run (see SessionStore).
+Every driver adds its own arrays and metadata through get_binary_arrays(),
+get_binary_metadata() and set_binary_arrays().
+
+Typical usage example:
+    class OSA(Instrument):
+        ...
+    OSA_243A = OSA()
+    OSA_243A.connect('GPIB0::27::INSTR')
+    OSA_243A.grab_spectrum('A')
+    OSA_243A.print_command_stats()
+
+@author: ri679647
+"""
+
+import contextlib
+import datetime
+import functools
+import re
+import threading
+import time
+import numpy as np
+import pyvisa
+from src.CaptureStore import load_capture, save_capture
+from src.InstrumentErrors import InstrumentConnectionError, InstrumentIOError, InstrumentTimeoutError
+from src.ReconnectPolicy import ReconnectPolicy
+from src.ResourcePool import shared_pool
+
+attachedArgumentPattern = re.compile(r"([A-Za-z]+)[-+]?[0-9.]+[A-Za-z]*$")   # HP style commands such as FA100MZ or SPAN10.00
+
+def get_command_header(command):
+    """This function returns the header of a command without its arguments, e.g. 'FA' for 'FA100MZ'.
+    """
+    command = command.strip()
+    if command == "":
+        return command
+    header = command.split()[0]
+    match = attachedArgumentPattern.match(header)
+    if match != None:
+        return match.group(1)
+    return header
+
+def get_instrument_error(command, address, error):
+    """This function converts a VisaIOError raised by a transfer into an InstrumentError.
+    """
+    message = str(command) + " failed on " + str(address) + ": " + str(error)
+    if error.error_code == pyvisa.constants.StatusCode.error_timeout:
+        return InstrumentTimeoutError(message)
+    return InstrumentIOError(message)
+
+def join_commands(commands):
+    """This function joins commands into one IEEE 488.2 program message.
+    
+    Every command restarts from the root of the command tree (';:'), common commands such
+    as *CLS or *OPC? are separated by a plain ';'.
+    """
+    message = ""
+    for command in commands:
+        command = command.strip().lstrip(':')
+        if message == "":
+            message = command
+        elif command.startswith('*'):
+            message = message + ";" + command
+        else:
+            message = message + ";:" + command
+    return message
+
+def get_transferred_bytes(response):
+    """This function returns the number of bytes contained in a reply.
+    """
+    if isinstance(response, np.ndarray):
+        return response.nbytes
+    if isinstance(response, (str, bytes, bytearray)):
+        return len(response)
+    if isinstance(response, (list, tuple)):
+        return 8*len(response)
+    return 0
+
+clockEpoch = time.time() - time.perf_counter()    # Wall clock time of perf_counter() zero
+
+def get_wall_time(counterTime):
+    """This function converts a time.perf_counter() value into a datetime.
+    """
+    return datetime.datetime.fromtimestamp(clockEpoch + counterTime)
+
+def timed_acquisition(method):
+    """This decorator records the AcquisitionTiming of an acquisition method in instrument.timing.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.begin_acquisition()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.end_acquisition()
+    return wrapper
+
+class AcquisitionTiming():
+    """This class holds the timestamps of one acquisition, in time.perf_counter() seconds.
+    
+    Attributes
+    ----------
+    triggerTime: float
+        Time the acquisition was triggered, e.g. SGL or DIGITIZE was sent. Instruments that
+        read the record on screen use the time the acquisition was requested.
+    transferStartTime: float
+        Start of the first bus transfer after the trigger, None if nothing was transferred.
+    transferEndTime: float
+        End of the last bus transfer of the acquisition, None if nothing was transferred.
+    """
+    def __init__(self, triggerTime = None):
+        self.triggerTime = time.perf_counter() if triggerTime == None else triggerTime
+        self.transferStartTime = None
+        self.transferEndTime = None
+    
+    def add_transfer(self, startTime, endTime):
+        if self.transferStartTime == None:
+            self.transferStartTime = startTime
+        self.transferEndTime = endTime
+    
+    def get_duration(self):
+        """This method returns the time from the trigger to the end of the last transfer in seconds.
+        """
+        if self.transferEndTime == None:
+            return 0.0
+        return self.transferEndTime - self.triggerTime
+
+class CommandStats():
+    """This class accumulates the bus statistics of one command header.
+    
+    Attributes
+    ----------
+    count: int
+        Number of transfers.
+    errors: int
+        Number of transfers that raised an exception.
+    totalTime: float
+        Accumulated latency in seconds.
+    maxTime: float
+        Longest latency in seconds.
+    bytesSent: int
+        Bytes written to the instrument.
+    bytesReceived: int
+        Bytes read from the instrument.
+    """
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.totalTime = 0.0
+        self.maxTime = 0.0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+    
+    def record(self, elapsed, bytesSent, bytesReceived, failed):
+        self.count = self.count + 1
+        self.totalTime = self.totalTime + elapsed
+        self.maxTime = max(self.maxTime, elapsed)
+        self.bytesSent = self.bytesSent + bytesSent
+        self.bytesReceived = self.bytesReceived + bytesReceived
+        if failed:
+            self.errors = self.errors + 1
+    
+    def get_mean_time(self):
+        if self.count == 0:
+            return 0.0
+        return self.totalTime/self.count
+
+class Instrument():
+    """This class holds the session handling and the instrumented bus primitives shared by the drivers.
+    
+    Attributes
+    ----------
+    handle: pyvisa resource
+        Session of the instrument, None before connect().
+    address: str
+        VISA resource address of the session.
+    connected: boolean
+        True once a session was opened.
+    commandStats: dict
+        CommandStats of every command header sent since the last reset_command_stats().
+    busLock: threading.RLock
+        Lock of the interface board of the session, shared with the other drivers on that board.
+    timing: AcquisitionTiming
+        Timestamps of the last acquisition, None before the first one.
+    settingsCache: dict
+        Write-through cache of instrument settings keyed by upper case header, see get_setting().
+    batchCommands: list
+        Writes collected by the open batch() block, None outside of it.
+    batchSettings: dict
+        Settings written with write_setting() by the pending batched writes, they enter
+        settingsCache once the writes were sent.
+    reconnectPolicy: ReconnectPolicy
+        Retries and backoff of connect() and reconnect().
+    reconnects: int
+        Number of successful reconnections since the driver was created.
+    clearOnReconnect: boolean
+        Send a device clear after reopening the session, drivers of instruments that
+        reset on it set this to False.
+    """
+    def __init__(self):
+        self.handle = None
+        self.address = None
+        self.rm = None
+        self.connected = False
+        self.commandStats = {}
+        self.busLock = threading.RLock()
+        self.timing = None
+        self.timingActive = False
+        self.pendingTriggerTime = None
+        self.settingsCache = {}
+        self.batchCommands = None
+        self.batchSettings = {}
+        self.reconnectPolicy = ReconnectPolicy()
+        self.reconnects = 0
+        self.clearOnReconnect = True
+        self.idn = None
+    
+    def list_devices(self, refresh = True):
+        """This method enumerates the resources on the bus.
+        
+        The result is memoized by the shared pool, see ResourcePool.list_resources().
+        
+        Parameters
+        ----------
+        refresh: boolean
+            Scan the bus again even if the memoized list did not expire yet.
+        """
+        try:
+            self.rm = shared_pool().get_resource_manager()
+            return shared_pool().list_resources(refresh)
+        except:
+            print("Couldn't find resource manager")
+    
+    @property
+    def list(self):
+        """Resources on the bus, scanned on first read instead of in the constructor."""
+        return self.list_devices(False)
+    
+    def open_session(self, device):
+        """This method takes a session of device from the shared pool.
+        
+        Opening is retried with the backoff of reconnectPolicy, InstrumentConnectionError is
+        raised once every attempt failed. A session the driver still holds is handed back
+        first, so connecting again does not count the driver twice as a user of the pool.
+        """
+        if self.handle != None:
+            self.close_session()
+        self.address = device
+        self.busLock = shared_pool().get_bus_lock(device)
+        lastError = None
+        for delay in [0.0] + self.reconnectPolicy.get_delays():
+            time.sleep(delay)
+            try:
+                self.handle = shared_pool().acquire(device)
+                return self.handle
+            except Exception as error:
+                lastError = error
+                print("Couldn't open " + str(device) + ": " + str(error))
+        raise InstrumentConnectionError("Couldn't open " + str(device) + " after " + str(self.reconnectPolicy.maxRetries + 1) + " attempts") from lastError
+    
+    def close_session(self, discard = False):
+        """This method hands the session back to the pool, it stays open for the next connect().
+        
+        Parameters
+        ----------
+        discard: boolean
+            Close the session instead, e.g. because it failed.
+        """
+        if discard:
+            shared_pool().discard(self.address)
+        else:
+            shared_pool().release(self.address)
+        self.handle = None
+    
+    def set_params(self):
+        """This method configures the instrument after a session was opened, drivers override it.
+        """
+        pass
+    
+    def invalidate_driver_caches(self):
+        """This method discards the instrument state a driver keeps besides settingsCache, drivers override it.
+        
+        reconnect() calls it, after a power cycle that state no longer describes the instrument.
+        """
+        pass
+    
+    def reconnect(self):
+        """This method reopens a failed session and restores the configuration of the instrument.
+        
+        Every attempt waits the backoff delay of reconnectPolicy, closes the failed session,
+        opens a new one, sends a device clear, discards the driver caches
+        (invalidate_driver_caches()), runs set_params() and writes the cached settings back,
+        which covers an instrument that was power cycled.
+        
+        Returns
+        -------
+        handle: pyvisa resource
+            The new session.
+        """
+        if self.address == None:
+            raise InstrumentConnectionError("No session to reconnect, call connect() first")
+        settings = dict(self.settingsCache)
+        self.batchCommands = None
+        self.batchSettings = {}
+        lastError = None
+        for delay in self.reconnectPolicy.get_delays():
+            time.sleep(delay)
+            try:
+                self.close_session(True)
+                self.handle = shared_pool().acquire(self.address)
+                if self.clearOnReconnect:
+                    self.clear()
+                self.invalidate_driver_caches()
+                self.set_params()
+                self.replay_settings(settings)
+                self.connected = True
+                self.reconnects = self.reconnects + 1
+                print("Reconnected to " + self.address)
+                return self.handle
+            except Exception as error:
+                lastError = error
+                print("Reconnection to " + self.address + " failed: " + str(error))
+        self.connected = False
+        raise InstrumentConnectionError("Couldn't reconnect to " + self.address + " after " + str(self.reconnectPolicy.maxRetries) + " attempts") from lastError
+    
+    def replay_settings(self, settings):
+        """This method writes settings back to the instrument in one batch and caches them.
+        
+        Parameters
+        ----------
+        settings: dict
+            Values keyed by header, e.g. a copy of settingsCache.
+        """
+        with self.batch():
+            for command, value in settings.items():
+                self.write_setting(command, value)
+    
+    def call_with_reconnect(self, method, *args, **kwargs):
+        """This method runs a driver method and runs it once more after a reconnection if the bus failed.
+        
+        Typical usage example:
+            TDS210.call_with_reconnect(TDS210.acquire_waveform, "RIBinary", 2)
+        """
+        try:
+            return method(*args, **kwargs)
+        except (InstrumentTimeoutError, InstrumentIOError) as error:
+            print(str(error) + ", reconnecting")
+            self.reconnect()
+            return method(*args, **kwargs)
+    
+    def print_message(self, msg):
+        if type(self).__module__ == "__main__":
+            print(msg)
+    
+    def transfer(self, command, operation, bytesSent = 0):
+        """This method runs a bus operation and records its latency, bytes moved and errors.
+        
+        The operation holds the lock of the interface board, so drivers capturing from
+        parallel threads never interleave their transfers on the same GPIB board.
+        
+        Parameters
+        ----------
+        command: str
+            Command sent to the instrument, its header is used as statistics key.
+        operation: function
+            Performs the transfer and returns the reply.
+        bytesSent: int
+            Bytes written to the instrument by the operation.
+        
+        A VisaIOError is raised as InstrumentTimeoutError or InstrumentIOError.
+        """
+        with self.busLock:
+            startTime = time.perf_counter()
+            try:
+                response = operation()
+            except pyvisa.errors.VisaIOError as error:
+                self.record_command(command, time.perf_counter() - startTime, bytesSent, 0, True)
+                raise get_instrument_error(command, self.address, error) from error
+            except Exception:
+                self.record_command(command, time.perf_counter() - startTime, bytesSent, 0, True)
+                raise
+            endTime = time.perf_counter()
+        if self.timingActive:
+            self.timing.add_transfer(startTime, endTime)
+        self.record_command(command, endTime - startTime, bytesSent, get_transferred_bytes(response), False)
+        return response
+    
+    def record_command(self, command, elapsed, bytesSent, bytesReceived, failed):
+        header = get_command_header(command)
+        stats = self.commandStats.get(header)
+        if stats == None:
+            stats = CommandStats()
+            self.commandStats[header] = stats
+        stats.record(elapsed, bytesSent, bytesReceived, failed)
+    
+    def write(self, command):
+        if self.batchCommands != None:
+            self.batchCommands.append(command)
+            return
+        self.transfer(command, lambda: self.handle.write(command), len(command))
+    
+    def query(self, command):
+        (message, settings) = self.prepend_batch(command)
+        reply = self.transfer(command, lambda: self.handle.query(message), len(message))
+        self.settingsCache.update(settings)
+        return reply
+    
+    def read_raw(self, command = "READ"):
+        """This method reads a raw reply, command only labels the statistics entry.
+        """
+        self.flush_batch()
+        return self.transfer(command, self.handle.read_raw)
+    
+    def clear(self):
+        self.flush_batch()
+        self.transfer("CLEAR", self.handle.clear)
+    
+    @contextlib.contextmanager
+    def batch(self, waitForCompletion = False):
+        """This context manager coalesces the writes of its block into one program message.
+        
+        The writes are sent when the block ends, or together with the first query issued
+        inside the block, which keeps them in order. Settings written with write_setting()
+        are cached once their writes were sent. A block left by an exception discards its
+        pending writes and their settings. Nested blocks join the outermost one.
+        
+        Typical usage example:
+            with scope.batch():
+                scope.set_channel_scale(1, 0.5)
+                scope.set_channel_position(1, 0.1)
+        
+        Parameters
+        ----------
+        waitForCompletion: boolean
+            Append *OPC? to the message and wait for its reply, so the block only ends once
+            the instrument executed every command.
+        """
+        if self.batchCommands != None:
+            yield self
+            return
+        self.batchCommands = []
+        self.batchSettings = {}
+        try:
+            yield self
+        except BaseException:
+            self.batchCommands = None
+            self.batchSettings = {}
+            raise
+        commands = self.batchCommands
+        settings = self.batchSettings
+        self.batchCommands = None
+        self.batchSettings = {}
+        if waitForCompletion:
+            message = join_commands(commands + ["*OPC?"])
+            self.transfer("BATCH", lambda: self.handle.query(message), len(message))
+        elif len(commands) > 0:
+            message = join_commands(commands)
+            self.transfer("BATCH", lambda: self.handle.write(message), len(message))
+        self.settingsCache.update(settings)
+    
+    def prepend_batch(self, command):
+        """This method returns command preceded by the pending batched writes, which are consumed.
+        
+        Returns
+        -------
+        message: str
+            Program message to send.
+        settings: dict
+            Settings of the consumed writes, the caller caches them once message was sent.
+        """
+        if not self.batchCommands:
+            return (command, {})
+        message = join_commands(self.batchCommands + [command])
+        settings = self.batchSettings
+        self.batchCommands = []
+        self.batchSettings = {}
+        return (message, settings)
+    
+    def flush_batch(self):
+        """This method sends the pending batched writes on their own.
+        """
+        if self.batchCommands:
+            message = join_commands(self.batchCommands)
+            settings = self.batchSettings
+            self.batchCommands = []
+            self.batchSettings = {}
+            self.transfer("BATCH", lambda: self.handle.write(message), len(message))
+            self.settingsCache.update(settings)
+    
+    def query_binary_block(self, command, datatype, isBigEndian, headerFmt = 'ieee', dataPoints = 0, expectTermination = True):
+        """This method queries a binary block and returns its points as a numpy array.
+        
+        Parameters
+        ----------
+        command: str
+            Query answered with a binary block, e.g. 'CURVE?'.
+        datatype: str
+            struct format character of a single point, e.g. 'h' or 'B'.
+        isBigEndian: boolean
+            Byte order of the points.
+        headerFmt: str
+            'ieee' for IEEE 488.2 blocks, 'empty' for instruments that send raw bytes.
+        dataPoints: int
+            Number of points to read, required when headerFmt is 'empty'.
+        expectTermination: boolean
+            Read the termination character after the block.
+        """
+        (message, settings) = self.prepend_batch(command)
+        values = self.transfer(command, lambda: self.handle.query_binary_values(message, datatype = datatype, is_big_endian = isBigEndian,
+                                                                               header_fmt = headerFmt, data_points = dataPoints,
+                                                                               expect_termination = expectTermination, container = np.array),
+                               len(message))
+        self.settingsCache.update(settings)
+        return values
+    
+    def begin_acquisition(self):
+        """This method starts recording the timing of an acquisition.
+        
+        A trigger marked before the acquisition, e.g. by single_sweep(), is used as its
+        trigger time, otherwise the acquisition starts now.
+        """
+        self.timing = AcquisitionTiming(self.pendingTriggerTime)
+        self.pendingTriggerTime = None
+        self.timingActive = True
+    
+    def end_acquisition(self):
+        self.timingActive = False
+        return self.timing
+    
+    def mark_trigger(self):
+        """This method records that the instrument was just triggered.
+        
+        Transfers before the trigger, e.g. the setup of the acquisition, are not part of
+        the transfer window.
+        """
+        if self.timingActive:
+            self.timing = AcquisitionTiming()
+        else:
+            self.pendingTriggerTime = time.perf_counter()
+    
+    def get_capture_datetime(self):
+        """This method returns the wall clock time of the last trigger, now if nothing was acquired.
+        """
+        if self.timing == None:
+            return datetime.datetime.now()
+        return get_wall_time(self.timing.triggerTime)
+    
+    def get_setting(self, command, refresh = False):
+        """This method returns a setting from the write-through cache, querying it on a miss.
+        
+        Parameters
+        ----------
+        command: str
+            Header of the setting without question mark, e.g. 'CH1:SCAle'.
+        refresh: boolean
+            Query the instrument even if the setting is cached.
+        
+        Returns
+        -------
+        value: str
+            Reply of the instrument without termination.
+        """
+        key = command.upper()
+        if not refresh and key in self.batchSettings:
+            return self.batchSettings[key]      # Written by the open batch, not sent yet
+        if refresh or key not in self.settingsCache:
+            self.settingsCache[key] = self.query(command + "?").strip()
+        return self.settingsCache[key]
+    
+    def write_setting(self, command, value):
+        """This method sends a setting and stores it in the cache, so no read-back is needed.
+        
+        Inside a batch() block the setting is cached once the batched writes were sent.
+        """
+        self.write(command + " " + str(value))
+        if self.batchCommands != None:
+            self.batchSettings[command.upper()] = str(value)
+        else:
+            self.settingsCache[command.upper()] = str(value)
+    
+    def refresh_settings(self, commands):
+        """This method refills the settings cache with one compound query.
+        
+        The replies of a compound query come back separated by semicolons in the order of
+        the queries. If their number does not match, e.g. because the instrument rejected
+        one header, the cache is left empty and get_setting() queries them one by one.
+        
+        Parameters
+        ----------
+        commands: list
+            Headers of the settings without question mark.
+        """
+        self.settingsCache = {}
+        if len(commands) == 0:
+            return self.settingsCache
+        reply = self.query(";:".join([command + "?" for command in commands]))
+        values = reply.strip().split(";")
+        if len(values) == len(commands):
+            for command, value in zip(commands, values):
+                self.settingsCache[command.upper()] = value.strip()
+        else:
+            print("Unexpected reply to the settings query: " + reply.strip())
+        return self.settingsCache
+    
+    def invalidate_settings_cache(self):
+        self.settingsCache = {}
+    
+    def send_cmd(self, cmd):
+        
+        self.write(cmd)
+        self.invalidate_settings_cache()
+         
+        response = self.read_raw(cmd)
+        return response
+    
+    def get_binary_arrays(self):
+        """This method returns the arrays of the last acquisition saved by save_binary(), keyed by name.
+        
+        Drivers return the arrays as they were read, e.g. raw digitizer codes whose scale
+        factors are part of get_binary_metadata().
+        """
+        return {}
+    
+    def get_binary_metadata(self):
+        """This method returns the driver settings saved by save_binary() with the arrays, e.g. the preamble.
+        """
+        return {}
+    
+    def set_binary_arrays(self, arrays, metadata):
+        """This method restores the acquisition of a capture file read by load_binary().
+        """
+        pass
+    
+    def get_capture_metadata(self):
+        """This method returns the metadata of the last acquisition shared by every driver.
+        
+        Returns
+        -------
+        metadata: dict
+            Driver name, address, IDN, cached settings and the wall clock time of the
+            trigger and of the transfer window.
+        """
+        idn = self.idn
+        if isinstance(idn, (list, tuple)):
+            idn = ','.join(idn)
+        metadata = {
+            "instrument": type(self).__name__,
+            "address": self.address,
+            "idn": idn,
+            "captureTime": self.get_capture_datetime().isoformat(),
+            "savedTime": datetime.datetime.now().isoformat(),
+            "settings": dict(self.settingsCache),
+        }
+        if self.timing != None and self.timing.transferStartTime != None:
+            metadata["transferStartTime"] = get_wall_time(self.timing.transferStartTime).isoformat()
+            metadata["transferEndTime"] = get_wall_time(self.timing.transferEndTime).isoformat()
+        return metadata
+    
+    def get_binary_capture(self):
+        """This method returns the arrays and the complete metadata of the last acquisition.
+        """
+        metadata = self.get_capture_metadata()
+        metadata.update(self.get_binary_metadata())
+        return (self.get_binary_arrays(), metadata)
+    
+    def restore_capture(self, arrays, metadata, source):
+        """This method restores an acquisition from its arrays and metadata, e.g. to plot it or save it as CSV.
+        
+        The capture time becomes the trigger time of timing, the settings of the
+        instrument are not changed.
+        """
+        if metadata.get("instrument") != type(self).__name__:
+            raise ValueError(source + " holds a capture of " + str(metadata.get("instrument")) + ", not of " + type(self).__name__)
+        self.set_binary_arrays(arrays, metadata)
+        if metadata.get("captureTime") != None:
+            captureTime = datetime.datetime.fromisoformat(metadata["captureTime"])
+            self.timing = AcquisitionTiming(captureTime.timestamp() - clockEpoch)
+        return metadata
+    
+    def save_binary(self, fileName):
+        """This method saves the last acquisition with its metadata to a capture file, see CaptureStore.
+        
+        Parameters
+        ----------
+        fileName: str
+            Capture file, usually with the .npz extension.
+        """
+        try:
+            (arrays, metadata) = self.get_binary_capture()
+            save_capture(fileName, arrays, metadata)
+        except Exception as e:
+            print(e)
+            print("Error while saving " + fileName + " file")
+    
+    def load_binary(self, fileName):
+        """This method restores an acquisition saved by save_binary().
+        
+        Returns
+        -------
+        metadata: dict
+            Metadata of the capture.
+        """
+        (arrays, metadata) = load_capture(fileName)
+        return self.restore_capture(arrays, metadata, fileName)
+    
+    def append_to_session(self, sessionStore, name):
+        """This method appends the last acquisition with its metadata to an open SessionStore.
+        
+        Parameters
+        ----------
+        sessionStore: SessionStore
+            Session of the run, opened to append.
+        name: str
+            Name of the trace in the session, e.g. the file name save_csv() would have used.
+        """
+        try:
+            (arrays, metadata) = self.get_binary_capture()
+            sessionStore.append(name, arrays, metadata)
+        except Exception as e:
+            print(e)
+            print("Error while saving " + name + " to session " + sessionStore.fileName)
+    
+    def load_from_session(self, sessionStore, name):
+        """This method restores an acquisition appended to a session by append_to_session().
+        
+        Returns
+        -------
+        metadata: dict
+            Metadata of the capture.
+        """
+        (arrays, metadata) = sessionStore.read(name)
+        return self.restore_capture(arrays, metadata, sessionStore.fileName + ": " + name)
+    
+    def reset_command_stats(self):
+        self.commandStats = {}
+    
+    def print_command_stats(self):
+        """This method prints the bus statistics of every command header, slowest first.
+        """
+        print('Command'.ljust(24) + 'Count'.rjust(8) + 'Errors'.rjust(8) + 'Mean ms'.rjust(10) + 'Max ms'.rjust(10) + 'Sent B'.rjust(10) + 'Recv B'.rjust(12))
+        for header, stats in sorted(self.commandStats.items(), key = lambda item: -item[1].totalTime):
+            print(header[:23].ljust(24) + str(stats.count).rjust(8) + str(stats.errors).rjust(8)
+                  + ('%.2f' % (1000*stats.get_mean_time())).rjust(10) + ('%.2f' % (1000*stats.maxTime)).rjust(10)
+                  + str(stats.bytesSent).rjust(10) + str(stats.bytesReceived).rjust(12))
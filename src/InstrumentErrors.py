@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Exceptions raised by the instrument drivers.
+
+Scripts that run long acquisitions can catch InstrumentError to recover from a
+single failed operation instead of terminating the whole run.
+
+@author: ri679647
+"""
+
+class InstrumentError(Exception):
+    """Base class of the errors raised by the instrument drivers."""
+    pass
+
+class InstrumentTimeoutError(InstrumentError):
+    """An instrument operation did not complete before its deadline."""
+    pass
+
+class SaveWaveformError(InstrumentError):
+    """The instrument reported a failure while saving data to its own storage."""
+    pass
+
+class InstrumentIOError(InstrumentError):
+    """A bus transfer with the instrument failed for another reason than a timeout."""
+    pass
+
+class InstrumentConnectionError(InstrumentError):
+    """The session of an instrument could not be opened, or reopened after a failure."""
+    pass
@@ -13,6 +13,8 @@ from src.DCA import DCA
 from src.TDS import TDS
 from src.ElectricalSynthesizer import ElectricalSynthesizer
 from src.RFSA import RFSA
+from src.CaptureOrchestrator import CaptureOrchestrator
+from src.SessionStore import SessionStore
 import time
 #import numpy as np
 import datetime
@@ -28,6 +30,8 @@ PSG_ACTIVE = False
 TESTING_MODE = False
 SWEEP_SCOPE = False
 INDEX_WRITE = True
+SESSION_WRITE = False   # Append the traces to SESSION_FILE instead of writing one CSV per instrument
+SESSION_FILE = 'traces.session'
 
 if __name__ == "__main__":
 
@@ -65,64 +69,102 @@ if __name__ == "__main__":
             csvWriter = csv.writer(fileWriter, delimiter = ',', lineterminator='\n')
             csvWriter.writerow((fileName, measuredDevice, rTec, iGain, iPsNum, iPs, vSa, vEam, ixSoa, pMllInj, pMllOut, pOfcInj, fRepSynth))
         
+    # Every active instrument acquires at the same time, saving and plotting follow in this thread
+    capture = CaptureOrchestrator()
+    session = None
+    if SESSION_WRITE:
+        session = SessionStore(filePath + '\\' + SESSION_FILE)
+    
+    def save_trace(instrument, fileSubPath, fileNameAddition):
+        if session != None:
+            instrument.append_to_session(session, fileSubPath + '/' + fileName + fileNameAddition)
+        else:
+            instrument.save_csv(filePath + '\\' + fileSubPath + '\\' + fileName + fileNameAddition + fileType)
+    
     if RFSA_ACTIVE:
         RFSA_8566B = RFSA()
         RFSA_8566B.connect('GPIB0::18::INSTR')
-        RFSA_8566B.get_spectrum()
         fileSubPathRfsa = 'RFSA'
-        fileNameAddition = '-1MHz'
-#        fileNameAddition = '-1MHz-HR'
-#        fileNameAddition = '-10MHz'
-#        fileNameAddition = '_AOM'
-        RFSA_8566B.save_csv(filePath + '\\' + fileSubPathRfsa + '\\' + fileName + fileNameAddition + fileType)
-        RFSA_8566B.plot_waveform()
-        RFSA_8566B.close()
+        fileNameAdditionRfsa = '-1MHz'
+#        fileNameAdditionRfsa = '-1MHz-HR'
+#        fileNameAdditionRfsa = '-10MHz'
+#        fileNameAdditionRfsa = '_AOM'
+        def acquire_rfsa():
+            RFSA_8566B.get_spectrum()
+            return (RFSA_8566B.freqs, RFSA_8566B.spectrum)
+        def save_rfsa():
+            save_trace(RFSA_8566B, fileSubPathRfsa, fileNameAdditionRfsa)
+            RFSA_8566B.plot_waveform()
+            RFSA_8566B.close()
+        capture.add('RFSA', acquire_rfsa, save = save_rfsa, instrument = RFSA_8566B)
 
     if PSG_ACTIVE:
         PSG = ElectricalSynthesizer()
         PSG.connect('GPIB0::19::INSTR')
-        PSG.set_psg_frequency(7.501e9)
-        freqEo = str(PSG.get_psg_frequency())
-        powerEo = str(PSG.get_power_attenuation())
-        print('f_eo = ' + freqEo + ' Hz, Pout= ' + powerEo + ' dB\n')
-        PSG.set_psg_output_state('OFF')
-        print(PSG.get_psg_output_state())
-        PSG.close()
+        def prepare_psg():
+            PSG.set_psg_frequency(7.501e9)
+        def acquire_psg():
+            return (PSG.get_psg_frequency(), PSG.get_power_attenuation())
+        def save_psg():
+            (freqEo, powerEo) = capture.bundle.get('PSG')
+            print('f_eo = ' + str(freqEo) + ' Hz, Pout= ' + str(powerEo) + ' dB\n')
+            PSG.set_psg_output_state('OFF')
+            print(PSG.get_psg_output_state())
+            PSG.close()
+        capture.add('PSG', acquire_psg, prepare = prepare_psg, save = save_psg)
     
     if OSA_ACTIVE:    
         OSA_243A = OSA()
         OSA_243A.connect('GPIB0::27::INSTR')
-        OSA_243A.grab_spectrum('B')
         fileSubPathOsa = 'OSA'
-        fileNameAddition = ''
-        OSA_243A.save_csv(filePath + '\\' + fileSubPathOsa + '\\' + fileName + fileNameAddition + fileType)
-        OSA_243A.plot_waveform()
+        fileNameAdditionOsa = ''
+        def acquire_osa():
+            OSA_243A.grab_spectrum('B')
+            return (OSA_243A.wavelength, OSA_243A.waveform)
+        def save_osa():
+            save_trace(OSA_243A, fileSubPathOsa, fileNameAdditionOsa)
+            OSA_243A.plot_waveform()
+        capture.add('OSA', acquire_osa, save = save_osa, instrument = OSA_243A)
     
     if DCA_ACTIVE:
         DCA_89100C = DCA()
         DCA_89100C.connect('GPIB0::7::INSTR')
-        DCA_89100C.acquire_waveform()
         fileSubPathDca = 'SHG'
-        fileNameAddition = ''
-        DCA_89100C.save_csv(filePath + '\\' + fileSubPathDca + '\\' + fileName + fileNameAddition + fileType)
-        DCA_89100C.plot_waveform()
+        fileNameAdditionDca = ''
+        def acquire_dca():
+            DCA_89100C.acquire_waveform()
+            return (DCA_89100C.timeArray, DCA_89100C.waveformArray)
+        def save_dca():
+            save_trace(DCA_89100C, fileSubPathDca, fileNameAdditionDca)
+            DCA_89100C.plot_waveform()
+        capture.add('DCA', acquire_dca, save = save_dca, instrument = DCA_89100C)
     
     if TDS_ACTIVE:
         TDS210 = TDS()
         TDS210.connect('GPIB0::5::INSTR')
-        if SWEEP_SCOPE:
-            TDS210.set_osc_state('STOP')
-            print("TDS Stopped...")
-            time.sleep(5)
-            TDS210.set_osc_state('RUN')
-            print("TDS Running...")
-            time.sleep(5)
-            print("TDS Acquiring...")
-        TDS210.acquire_waveform()
         fileSubPathTds = 'SHG'
-        fileNameAddition = ''
-        TDS210.save_csv(filePath + '\\' + fileSubPathTds + '\\' + fileName + fileNameAddition + fileType)
-        TDS210.plot_waveform()
-        TDS210.close()
+        fileNameAdditionTds = ''
+        def acquire_tds():
+            if SWEEP_SCOPE:
+                TDS210.set_osc_state('STOP')
+                print("TDS Stopped...")
+                time.sleep(5)
+                TDS210.set_osc_state('RUN')
+                print("TDS Running...")
+                time.sleep(5)
+                print("TDS Acquiring...")
+            TDS210.acquire_waveform()
+            return (TDS210.timeArray, TDS210.waveformArray)
+        def save_tds():
+            save_trace(TDS210, fileSubPathTds, fileNameAdditionTds)
+            TDS210.plot_waveform()
+            TDS210.close()
+        capture.add('TDS', acquire_tds, save = save_tds, instrument = TDS210)
+    
+    bundle = capture.run()
+    bundle.print_summary()
+    bundle.print_skew_report()
+    if session != None:
+        session.close()
     
     
\ No newline at end of file
@@ -0,0 +1,642 @@
+# -*- coding: utf-8 -*-
+"""
+Offline simulator of the instruments of the bench.
+
+Every simulated instrument is an in-process replacement of a pyvisa resource that
+understands the command subset used by its driver and answers with synthetic waveforms
+and spectra. Every bus transaction costs a configurable latency plus its size divided by
+a configurable bandwidth, so changes to the transfer paths can be measured without the
+physical instruments.
+
+Typical usage example:
+    use_simulated_bench(latency = 0.002, bandwidth = 500e3)
+    TDS210 = TDS()
+    TDS210.connect('GPIB0::5::INSTR')
+    TDS210.acquire_waveform()
+
+@author: ri679647
+"""
+
+import re
+import time
+import numpy as np
+import pyvisa
+from pyvisa.util import from_binary_block, from_ieee_block, to_ieee_block
+from src.ResourcePool import shared_pool
+
+DEFAULT_LATENCY = 0.0       # Fixed cost of every bus transaction in seconds
+DEFAULT_BANDWIDTH = None    # Bus throughput in bytes per second, None for an unlimited bus
+DEFAULT_SWEEP_TIME = 0.0    # Duration of a single sweep or acquisition in seconds
+DEFAULT_SAVE_TIME = 0.0     # Duration of a waveform save of the DCA in seconds
+
+attachedArgumentPattern = re.compile(r"([A-Za-z*]+)([-+]?[0-9.].*)$")     # HP/ANDO style commands such as FA100MZ or SPAN40.00
+chainedHeaderPattern = re.compile(r":[A-Za-z*]")                          # A header glued to an argument, e.g. WORD:ACQUIRE:COUNT 8
+quotedStringPattern = re.compile(r'"[^"]*"')
+frequencyPattern = re.compile(r"([-+]?[0-9.]+(?:E[-+]?[0-9]+)?)\s*(HZ|KZ|MZ|GZ)?$", re.IGNORECASE)
+
+switcherFrequencyUnit = {
+    "HZ": 1e0,
+    "KZ": 1e3,
+    "MZ": 1e6,
+    "GZ": 1e9,
+}
+
+def timeout_error():
+    return pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+
+def has_chained_header(argument):
+    """This function tells whether an argument runs into the next header without a ';' separator.
+    """
+    return chainedHeaderPattern.search(quotedStringPattern.sub('', argument)) != None
+
+def split_command(command):
+    """This function splits a single command into its upper case header and its argument.
+
+    Returns
+    -------
+    (header, argument, isQuery): tuple
+        Header without leading colon and question mark, argument string ('' if none)
+        and whether the command asks for a reply.
+    """
+    command = command.strip()
+    parts = command.split(None, 1)
+    header = parts[0].lstrip(':')
+    argument = ''
+    if len(parts) > 1:
+        argument = parts[1].strip()
+    elif ':' not in header and not header.endswith('?'):
+        match = attachedArgumentPattern.match(header)
+        if match != None:
+            header = match.group(1)
+            argument = match.group(2)
+    isQuery = header.endswith('?')
+    return (header.rstrip('?').upper(), argument, isQuery)
+
+class SimulatedInstrument():
+    """This class is an in-process replacement of a pyvisa resource.
+
+    Commands are split on semicolons, settings written with 'HEADER value' are stored and
+    returned by 'HEADER?', and every model adds its own replies on top of that. Like the
+    parser of a real instrument, a command whose argument is followed by another header
+    without a ';' separator is rejected: the rest of the message is ignored and the error
+    is reported by SYST:ERR?.
+
+    Attributes
+    ----------
+    latency: float
+        Fixed cost of every bus transaction in seconds.
+    bandwidth: float
+        Bus throughput in bytes per second, None for an unlimited bus.
+    sweepTime: float
+        Duration of a single sweep or acquisition in seconds.
+    assertSrq: boolean
+        Assert a service request at the end of every sweep, otherwise wait_for_srq() always times out.
+    settings: dict
+        Current value of every setting keyed by upper case header.
+    bytesWritten: int
+        Bytes received from the drivers.
+    bytesRead: int
+        Bytes sent to the drivers.
+    transactions: int
+        Number of bus transactions served.
+    errors: list
+        Error queue read by SYST:ERR?, oldest first.
+    """
+    idn = "SIMULATED,INSTRUMENT,0,0"
+    defaultSettings = {}
+    queryHeaders = ()       # Headers that produce a reply without a question mark
+
+    def __init__(self, latency = DEFAULT_LATENCY, bandwidth = DEFAULT_BANDWIDTH, sweepTime = DEFAULT_SWEEP_TIME,
+                 assertSrq = False, seed = 0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.sweepTime = sweepTime
+        self.assertSrq = assertSrq
+        self.rng = np.random.default_rng(seed)
+        self.settings = dict(self.defaultSettings)
+        self.timeout = 2000
+        self.sessionOpen = True
+        self.sweepEnd = 0.0
+        self.outputQueue = []
+        self.bytesWritten = 0
+        self.bytesRead = 0
+        self.transactions = 0
+        self.errors = []
+
+    # pyvisa resource interface
+
+    def write(self, command):
+        self.check_session()
+        self.outputQueue = []
+        self.transact(len(command))
+        self.bytesWritten = self.bytesWritten + len(command)
+        self.execute(command)
+        return len(command)
+
+    def read_raw(self):
+        self.check_session()
+        if len(self.outputQueue) == 0:
+            self.transact(0)
+            raise timeout_error()
+        replies = self.outputQueue
+        self.outputQueue = []
+        if len(replies) == 1 and isinstance(replies[0], bytes):
+            response = replies[0]     # Binary blocks carry their own termination
+        else:
+            response = (';'.join([str(reply) for reply in replies]) + '\n').encode('ascii')
+        self.transact(len(response))
+        self.bytesRead = self.bytesRead + len(response)
+        return response
+
+    def read(self):
+        return self.read_raw().decode('ascii')
+
+    def query(self, command):
+        self.write(command)
+        return self.read()
+
+    def query_binary_values(self, command, datatype = 'f', is_big_endian = False, container = list, header_fmt = 'ieee',
+                            expect_termination = True, data_points = 0, chunk_size = None):
+        self.write(command)
+        block = self.read_raw()
+        if header_fmt == 'ieee':
+            return from_ieee_block(block, datatype, is_big_endian, container)
+        return from_binary_block(block, 0, data_points*np.dtype(datatype).itemsize, datatype, is_big_endian, container)
+
+    def clear(self):
+        self.check_session()
+        self.outputQueue = []
+        self.transact(0)
+
+    def read_stb(self):
+        self.check_session()
+        self.transact(0)
+        return 0
+
+    def wait_for_srq(self, timeout = 25000):
+        remaining = self.sweepEnd - time.monotonic()
+        if self.assertSrq and remaining <= timeout/1000:
+            time.sleep(max(remaining, 0))
+            return
+        time.sleep(timeout/1000)
+        raise timeout_error()
+
+    def close(self):
+        self.sessionOpen = False
+
+    # Simulation
+
+    def check_session(self):
+        if not self.sessionOpen:
+            raise pyvisa.errors.InvalidSession()
+
+    def transact(self, numberOfBytes):
+        """This method blocks for the duration of a bus transaction moving numberOfBytes bytes.
+        """
+        self.transactions = self.transactions + 1
+        delay = self.latency
+        if self.bandwidth != None:
+            delay = delay + numberOfBytes/self.bandwidth
+        if delay > 0:
+            time.sleep(delay)
+
+    def execute(self, message):
+        for command in message.split(';'):
+            if command.strip() == '':
+                continue
+            (header, argument, isQuery) = split_command(command)
+            if has_chained_header(argument):
+                self.errors.append('-103,"Invalid separator"')
+                return
+            if isQuery or header in self.queryHeaders:
+                self.outputQueue.append(self.reply(header, argument))
+            else:
+                self.configure(header, argument)
+
+    def start_sweep(self):
+        self.sweepEnd = time.monotonic() + self.sweepTime
+
+    def is_sweeping(self):
+        return time.monotonic() < self.sweepEnd
+
+    def reply(self, header, argument):
+        """This method returns the reply to a query, models override it for their data queries.
+        """
+        if header == "*IDN":
+            return self.idn
+        if header == "*OPC":
+            return "1"
+        if header == "*STB":
+            return "0"
+        if header == "SWEEP":
+            return "1" if self.is_sweeping() else "0"
+        if header in ("SYST:ERR", "SYSTEM:ERROR"):
+            if len(self.errors) > 0:
+                return self.errors.pop(0)
+            return '0,"No error"'
+        if header in self.settings:
+            return self.settings[header]
+        raise timeout_error()
+
+    def configure(self, header, argument):
+        """This method applies a command without reply, models override it for their actions.
+        """
+        if header in ("*CLS", "*RST", "DCL", "GTL", "*WAI"):
+            return
+        if header == "SGL":
+            self.start_sweep()
+            return
+        if header == "RPT":
+            return
+        self.settings[header] = argument
+
+class SimulatedTDS(SimulatedInstrument):
+    """Tektronix TDS210 oscilloscope, CURVE? in ASCIi, RIBinary or RPBinary and the positional WFMPre? reply."""
+    idn = "TEKTRONIX,TDS 210,0,CF:91.1CT FV:v1.16 TDS2CM:CMV:v1.04"
+    defaultSettings = {
+        "DATA:ENCDG": "RIBINARY",
+        "DATA:WIDTH": "1",
+        "HEADER": "0",
+        "ACQUIRE:MODE": "SAMPLE",
+        "ACQUIRE:NUMAVG": "16",
+        "ACQUIRE:STATE": "1",
+        "HORIZONTAL": "MAIN;5.0E-4;0.0E0",
+        "HORIZONTAL:DELAY:SCALE": "5.0E-4",
+        "HORIZONTAL:MAIN:SCALE": "5.0E-4",
+        "HORIZONTAL:MAIN:POSITION": "0.0E0",
+        "CH1:BANDWIDTH": "OFF",
+        "CH2:BANDWIDTH": "OFF",
+        "CH1:COUPLING": "DC",
+        "CH2:COUPLING": "DC",
+        "CH1:INVERT": "OFF",
+        "CH2:INVERT": "OFF",
+        "CH1:POSITION": "0.0E0",
+        "CH2:POSITION": "0.0E0",
+        "CH1:PROBE": "1",
+        "CH2:PROBE": "1",
+        "CH1:SCALE": "5.0E-1",
+        "CH2:SCALE": "5.0E-1",
+        "CH1:VOLTS": "5.0E-1",
+        "CH2:VOLTS": "5.0E-1",
+    }
+    xIncrement = 2.0E-7
+    yMultiplier = 2.0E-2
+
+    def __init__(self, recordLength = 2500, **kwargs):
+        super().__init__(**kwargs)
+        self.recordLength = recordLength
+
+    def get_codes(self):
+        """This method returns one record of 8-bit digitizer codes, a noisy pulse train."""
+        phase = np.arange(self.recordLength)*2*np.pi*8/self.recordLength
+        codes = 90*np.tanh(4*np.sin(phase)) + self.rng.normal(0, 2, self.recordLength)
+        return np.clip(np.round(codes), -128, 127).astype(np.int32)
+
+    def get_transfer_format(self):
+        return (self.settings["DATA:ENCDG"].upper(), int(self.settings["DATA:WIDTH"]))
+
+    def get_code_offset(self, encoding, width):
+        """This method returns the code of 0 V, non zero for the positive RPBinary encoding."""
+        if encoding.startswith("RP"):
+            return 128 if width == 1 else 32768
+        return 0
+    
+    def encode_codes(self, codes, encoding, width, isBigEndian = True):
+        """This method encodes 8-bit codes as the CURVE? reply for the given encoding and width."""
+        if width == 2:
+            codes = codes*256
+        if encoding.startswith("ASC"):
+            return ','.join(codes.astype(str))
+        if encoding.startswith("RP"):
+            codes = codes + self.get_code_offset(encoding, width)
+            datatype = 'B' if width == 1 else 'H'
+        else:
+            datatype = 'b' if width == 1 else 'h'
+        return to_ieee_block(codes.astype(np.dtype(datatype).newbyteorder('>' if isBigEndian else '<')).tobytes(), 's') + b'\n'
+
+    def reply(self, header, argument):
+        (encoding, width) = self.get_transfer_format()
+        if header == "WFMPRE":
+            yMultiplier = self.yMultiplier/(256 if width == 2 else 1)
+            binaryFormat = "RP" if encoding.startswith("RP") else "RI"
+            return ';'.join([str(width), str(8*width), "ASC" if encoding.startswith("ASC") else "BIN", binaryFormat, "MSB",
+                             str(self.recordLength), '"Ch1, DC coupling, 5.0E-1 V/div, 5.0E-4 s/div, ' + str(self.recordLength) + ' points, Sample mode"',
+                             "Y", "%.4E" % self.xIncrement, "0", "%.4E" % (-self.xIncrement*self.recordLength/2), '"s"',
+                             "%.4E" % yMultiplier, "0.0E0", str(self.get_code_offset(encoding, width)), '"Volts"'])
+        if header == "CURVE":
+            return self.encode_codes(self.get_codes(), encoding, width)
+        return super().reply(header, argument)
+
+class SimulatedCSA(SimulatedTDS):
+    """Tektronix CSA8200 sampling oscilloscope, keyword tagged WFMOutpre? and windowed CURVE? reads."""
+    idn = "TEKTRONIX,CSA8200,B010123,CF:91.1CT FV:4.0.3"
+    defaultSettings = dict(SimulatedTDS.defaultSettings, **{
+        "DATA:START": "1",
+        "DATA:STOP": "4000",
+        "WFMOUTPRE:BYT_NR": "2",
+        "VERBOSE": "1",
+        "CH1:UNITS": "VOLT",
+        "HORIZONTAL:MAIN:SCALE": "1.0E-10",
+    })
+    xIncrement = 1.0E-12
+    yMultiplier = 1.0E-3
+
+    def __init__(self, recordLength = 4000, **kwargs):
+        super().__init__(recordLength, **kwargs)
+        self.record = np.empty(0, dtype=np.int32)
+
+    def get_transfer_format(self):
+        return (self.settings["DATA:ENCDG"].upper(), int(self.settings["WFMOUTPRE:BYT_NR"]))
+
+    def get_window(self):
+        firstPoint = max(int(self.settings["DATA:START"]), 1)
+        lastPoint = min(int(self.settings["DATA:STOP"]), self.recordLength)
+        return (firstPoint, max(lastPoint, firstPoint))
+
+    def configure(self, header, argument):
+        if header in ("HEADER", "VERBOSE"):
+            argument = "1" if argument.upper() in ("ON", "1") else "0"
+        super().configure(header, argument)
+
+    def reply(self, header, argument):
+        (encoding, width) = self.get_transfer_format()
+        (firstPoint, lastPoint) = self.get_window()
+        if header == "WFMOUTPRE":
+            values = [("BYT_NR", str(width)), ("BIT_NR", str(8*width)), ("ENCDG", "ASCII" if encoding.startswith("ASC") else "BINARY"),
+                      ("BN_FMT", "RP" if encoding.startswith("RP") else "RI"), ("BYT_OR", "MSB"), ("WFID", '"Main View C1 Record"'),
+                      ("NR_PT", str(lastPoint - firstPoint + 1)), ("PT_FMT", "Y"), ("XUNIT", '"s"'), ("XINCR", "%.4E" % self.xIncrement),
+                      ("XZERO", "%.4E" % (self.xIncrement*(firstPoint - 1))), ("PT_OFF", "0"), ("YUNIT", '"V"'),
+                      ("YSCALE", "%.4E" % (self.yMultiplier/(256 if width == 2 else 1))), ("YOFF", str(self.get_code_offset(encoding, width))), ("YZERO", "0.0E0")]
+            if self.settings["HEADER"] == "1":
+                return ':WFMOUTPRE:' + ';'.join([keyword + ' ' + value for (keyword, value) in values])
+            return ';'.join([value for (keyword, value) in values])
+        if header == "CURVE":
+            if firstPoint == 1 or len(self.record) != self.recordLength:
+                self.record = self.get_codes()     # A read from the first point starts a new record, windows share it
+            return self.encode_codes(self.record[firstPoint - 1:lastPoint], encoding, width)
+        return SimulatedInstrument.reply(self, header, argument)
+
+switcherDcaFormat = {
+    "ASCII": 0,
+    "BYTE": 1,
+    "WORD": 2,
+}
+
+class SimulatedDCA(SimulatedInstrument):
+    """Agilent 86100C DCA, :WAVEFORM:PREAMBLE?, LSB first :WAVEFORM:DATA? and the :SAVE:WAVeform event bits."""
+    idn = "Agilent Technologies,86100C,MY43490127,A.08.00"
+    defaultSettings = {
+        "SYSTEM:HEADER": "OFF",
+        "TIMEBASE:SCALE": "100 NS",
+        "TIMEBASE:POSITION": "0",
+        "TRIGGER:MODE": "EDGE",
+        "TRIGGER:EDGE:SOURCE": "LINE",
+        "SAVE:WAVEFORM:FORMAT": "ASCIIXY",
+        "SAVE:WAVEFORM:LENGTH": "1000",
+    }
+    xIncrement = 9.765625E-10
+
+    def __init__(self, saveTime = DEFAULT_SAVE_TIME, **kwargs):
+        super().__init__(**kwargs)
+        self.saveTime = saveTime
+        self.waveformFormat = "ASCII"
+        self.points = 1024
+        self.saveEnd = None
+
+    def configure(self, header, argument):
+        if header == "WAVEFORM:FORMAT":
+            self.waveformFormat = argument.upper()
+            return
+        if header == "ACQUIRE:POINTS":
+            self.points = int(argument)
+            return
+        if header == "DIGITIZE":
+            self.start_sweep()
+            return
+        if header == "SAVE:WAVEFORM:START":
+            self.saveEnd = time.monotonic() + self.saveTime
+            return
+        if header == "SINGLE":
+            self.start_sweep()
+            return
+        super().configure(header, argument)
+
+    def get_y_increment(self):
+        """This method returns the volts per code of the current format, BYTE codes span the same range as WORD codes."""
+        if self.waveformFormat == "BYTE":
+            return 6.4E-4
+        return 2.5E-6
+    
+    def get_volts(self):
+        phase = np.arange(self.points)*2*np.pi*4/self.points
+        return 0.04*np.sin(phase)**8 + self.rng.normal(0, 5e-4, self.points)
+
+    def reply(self, header, argument):
+        if header == "WAVEFORM:PREAMBLE":
+            return ','.join([str(switcherDcaFormat.get(self.waveformFormat, 0)), "2", str(self.points), "8",
+                             "%.6E" % self.xIncrement, "2.4E-8", "0", "%.6E" % self.get_y_increment(), "0.0E0", "0", "1",
+                             "%.6E" % (self.xIncrement*self.points), "2.4E-8", "8.0E-2", "0.0E0",
+                             '"01 JAN 2020"', '"09:54:55:89"', '"86100C:MY43490127"', '"CHANNEL1"', "0", "100", "2", "1", "5.0E10", "0"])
+        if header == "WAVEFORM:DATA":
+            volts = self.get_volts()
+            if self.waveformFormat == "ASCII":
+                return ','.join(["%.6E" % value for value in volts])
+            datatype = '<i2' if self.waveformFormat == "WORD" else 'i1'
+            codes = np.clip(np.round(volts/self.get_y_increment()), np.iinfo(datatype).min, np.iinfo(datatype).max)
+            return to_ieee_block(codes.astype(datatype).tobytes(), 's') + b'\n'
+        if header == "OPER:EVENT":
+            # Event registers are cleared by reading them
+            if self.saveEnd != None and time.monotonic() >= self.saveEnd:
+                self.saveEnd = None
+                return str(1 << 13)
+            return "0"
+        return super().reply(header, argument)
+
+switcherOsaSensitivity = {
+    "SNHD": "5",
+    "SNAT": "5",
+    "SHI1": "1",
+    "SHI2": "2",
+    "SHI3": "3",
+    "SMID": "6",
+}
+
+class SimulatedOSA(SimulatedInstrument):
+    """ANDO AQ6317B optical spectrum analyzer, LDAT/WDAT traces of an optical frequency comb."""
+    idn = "ANDO,AQ6317B,0,MR01.03"
+    defaultSettings = {
+        "STAWL": "1530.00",
+        "STPWL": "1570.00",
+        "RESLN": "0.10",
+        "SENS": "5",
+        "REFL": "-10.0",
+        "SMPL": "1001",
+        "AVG": "1",
+    }
+    queryHeaders = ("LDATA", "LDATB", "LDATC", "WDATA", "WDATB", "WDATC")
+    combSpacing = 0.24      # Comb line spacing in nm (30 GHz at 1550 nm)
+
+    def __init__(self, samplingPoints = 1001, **kwargs):
+        super().__init__(**kwargs)
+        self.settings["SMPL"] = str(samplingPoints)
+
+    def get_wavelength(self):
+        return np.linspace(float(self.settings["STAWL"]), float(self.settings["STPWL"]), int(self.settings["SMPL"]))
+
+    def get_level(self):
+        """This method returns the trace in dBm, comb lines under a Gaussian envelope above the noise floor."""
+        wavelength = self.get_wavelength()
+        center = (wavelength[0] + wavelength[-1])/2
+        lines = center + self.combSpacing*np.arange(-40, 41)
+        linePower = 10**(-1.5 - ((lines - center)/4.0)**2)                     # mW, 0.03 mW peak
+        sigma = max(float(self.settings["RESLN"]), 0.01)/2.355
+        profile = np.exp(-0.5*((wavelength[:, np.newaxis] - lines[np.newaxis, :])/sigma)**2)
+        noise = 10**(-7.0 + self.rng.normal(0, 0.05, len(wavelength)))
+        return 10*np.log10(profile.dot(linePower) + noise)
+
+    def configure(self, header, argument):
+        if header == "SPAN":
+            center = (float(self.settings["STAWL"]) + float(self.settings["STPWL"]))/2
+            self.settings["STAWL"] = "%.2f" % (center - float(argument)/2)
+            self.settings["STPWL"] = "%.2f" % (center + float(argument)/2)
+            return
+        if header == "CTRWL":
+            span = float(self.settings["STPWL"]) - float(self.settings["STAWL"])
+            self.settings["STAWL"] = "%.2f" % (float(argument) - span/2)
+            self.settings["STPWL"] = "%.2f" % (float(argument) + span/2)
+            return
+        if header in switcherOsaSensitivity:
+            self.settings["SENS"] = switcherOsaSensitivity[header]
+            return
+        super().configure(header, argument)
+
+    def reply(self, header, argument):
+        if header.startswith("LDAT"):
+            level = self.get_level()
+            return str(len(level)) + ',' + ','.join(["%.3f" % value for value in level])
+        if header.startswith("WDAT"):
+            wavelength = self.get_wavelength()
+            return str(len(wavelength)) + ',' + ','.join(["%.3f" % value for value in wavelength])
+        if header == "SPAN":
+            return "%.2f" % (float(self.settings["STPWL"]) - float(self.settings["STAWL"]))
+        if header == "CTRWL":
+            return "%.2f" % ((float(self.settings["STPWL"]) + float(self.settings["STAWL"]))/2)
+        return super().reply(header, argument)
+
+class SimulatedRFSA(SimulatedInstrument):
+    """HP 8566B RF spectrum analyzer, trace A in the O3 (ASCII) or O2 (binary) output format."""
+    idn = "HEWLETT-PACKARD,8566B,0,0"
+    defaultSettings = {
+        "FA": "1.0E8",
+        "FB": "3.0E8",
+        "RB": "1.0E5",
+        "VB": "1.0E5",
+        "RL": "0.0",
+        "LG": "10",
+    }
+    queryHeaders = ("TA", "TB")
+    tracePoints = 1001
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.outputFormat = "3"
+
+    def configure(self, header, argument):
+        if header == "O":
+            self.outputFormat = argument.strip()
+            return
+        if header in ("FA", "FB", "CF", "RB", "VB"):
+            match = frequencyPattern.match(argument.strip())
+            if match == None:
+                return
+            frequency = float(match.group(1))*switcherFrequencyUnit.get((match.group(2) or "HZ").upper(), 1.0)
+            self.settings[header] = repr(frequency)
+            return
+        super().configure(header, argument)
+
+    def get_level(self):
+        """This method returns trace A in dBm, two harmonics of a tone above the noise floor."""
+        frequency = np.linspace(float(self.settings["FA"]), float(self.settings["FB"]), self.tracePoints)
+        span = frequency[-1] - frequency[0]
+        tones = frequency[0] + span*np.array([0.3, 0.6])
+        width = max(float(self.settings["RB"]), span/self.tracePoints)
+        power = 10**(-2.0)*np.exp(-0.5*((frequency - tones[0])/width)**2) + 10**(-4.0)*np.exp(-0.5*((frequency - tones[1])/width)**2)
+        return 10*np.log10(power + 10**(-8.0 + self.rng.normal(0, 0.1, self.tracePoints)))
+
+    def reply(self, header, argument):
+        if header in ("TA", "TB"):
+            level = self.get_level()
+            if self.outputFormat == "2":
+                dbPerUnit = float(self.settings["LG"])*10/1000
+                units = np.clip(np.round(1000 + (level - float(self.settings["RL"]))/dbPerUnit), 0, 1023)
+                return units.astype('>u2').tobytes()
+            return '\n'.join(["%.2f" % value for value in level])
+        if header == "CF":
+            return repr((float(self.settings["FA"]) + float(self.settings["FB"]))/2)
+        return super().reply(header, argument)
+
+class SimulatedPSG(SimulatedInstrument):
+    """Agilent E8257D PSG signal generator, fixed frequency, output state and attenuation."""
+    idn = "Agilent Technologies, E8257D, US12345678, C.06.10"
+    defaultSettings = {
+        "FREQUENCY:FIXED": "1.0E10",
+        "OUTPUT": "0",
+        "POWER:ATTENUATION": "10",
+    }
+
+    def configure(self, header, argument):
+        if header == "OUTPUT":
+            argument = "1" if argument.upper() in ("ON", "1") else "0"
+        elif header == "POWER:ATTENUATION":
+            argument = argument.upper().replace("DB", "").strip()
+        super().configure(header, argument)
+
+class SimulatedResourceManager():
+    """This class replaces pyvisa.ResourceManager with a fixed set of simulated instruments.
+
+    Attributes
+    ----------
+    instruments: dict
+        Simulated instrument of every resource address.
+    """
+    def __init__(self, instruments):
+        self.instruments = instruments
+
+    def list_resources(self):
+        return tuple(sorted(self.instruments))
+
+    def open_resource(self, address):
+        instrument = self.instruments.get(address)
+        if instrument == None:
+            raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_resource_not_found)
+        instrument.sessionOpen = True
+        return instrument
+
+    def close(self):
+        for instrument in self.instruments.values():
+            instrument.close()
+
+def create_simulated_bench(latency = DEFAULT_LATENCY, bandwidth = DEFAULT_BANDWIDTH, sweepTime = DEFAULT_SWEEP_TIME):
+    """This function returns a SimulatedResourceManager with the instruments of the bench at their usual addresses.
+    """
+    return SimulatedResourceManager({
+        'GPIB0::4::INSTR': SimulatedCSA(latency = latency, bandwidth = bandwidth, sweepTime = sweepTime),
+        'GPIB0::5::INSTR': SimulatedTDS(latency = latency, bandwidth = bandwidth, sweepTime = sweepTime),
+        'GPIB0::7::INSTR': SimulatedDCA(latency = latency, bandwidth = bandwidth, sweepTime = sweepTime),
+        'GPIB0::18::INSTR': SimulatedRFSA(latency = latency, bandwidth = bandwidth, sweepTime = sweepTime),
+        'GPIB0::19::INSTR': SimulatedPSG(latency = latency, bandwidth = bandwidth, sweepTime = sweepTime),
+        'GPIB0::27::INSTR': SimulatedOSA(latency = latency, bandwidth = bandwidth, sweepTime = sweepTime),
+    })
+
+def use_simulated_bench(latency = DEFAULT_LATENCY, bandwidth = DEFAULT_BANDWIDTH, sweepTime = DEFAULT_SWEEP_TIME, resourceManager = None):
+    """This function makes every driver of this process talk to simulated instruments.
+
+    Returns
+    -------
+    resourceManager: SimulatedResourceManager
+        Manager installed in the shared pool, its instruments can be reconfigured.
+    """
+    if resourceManager == None:
+        resourceManager = create_simulated_bench(latency, bandwidth, sweepTime)
+    shared_pool().use_resource_manager(resourceManager)
+    return resourceManager
@@ -6,10 +6,10 @@ Created on Tue Jun 25 15:52:45 2019
 """
 
 import matplotlib.pyplot as plt
-import csv
 import numpy as np
 import tkinter as tk
 from tkinter import filedialog
+from src.TraceFile import read_trace_csv
 
 class MaskCalculator():
     """This class calculates the mask for harmonic injection locking.
@@ -202,27 +202,15 @@ class MaskCalculator():
         plt.show()
     
     def read_csv(self, fileName):
-        with open(fileName, 'r') as fileReader:
-            self.csvReader = csv.reader(fileReader, delimiter ='\t')
-            for row in self.csvReader:
-                if(len(row) > 1):
-#                separated_row = row[0].split(',')
-#                my_array = np.asarray(separated_row)
-#                self.wavelength.append(float(my_array[0]))
-#                self.spectrum.append(float(my_array[-1]))
-                    self.wavelength.append(float(row[0]))
-                    self.spectrum.append(float(row[1]))
-                else:
-                    self.header.append(row)
-            # Define useful constants for mask calculation
-            self.max_wavelength = max(self.wavelength)
-            self.min_wavelength = min(self.wavelength)            
-            self.len_wavelength = len(self.wavelength)
-            self.wavelength_span = self.max_wavelength - self.min_wavelength
-            self.max_spectrum = max(self.spectrum)
-            self.min_spectrum = min(self.spectrum)            
-            self.len_spectrum = len(self.spectrum)
-            self.spectrum_span = self.max_spectrum - self.min_spectrum       
+        ((wavelength, spectrum), self.header, extrema) = read_trace_csv(fileName)
+        # The mask calculation looks up values with list.index()
+        self.wavelength = wavelength.tolist()
+        self.spectrum = spectrum.tolist()
+        # Define useful constants for mask calculation
+        (self.min_wavelength, self.max_wavelength, self.wavelength_span) = extrema[0]
+        self.len_wavelength = len(self.wavelength)
+        (self.min_spectrum, self.max_spectrum, self.spectrum_span) = extrema[1]
+        self.len_spectrum = len(self.spectrum)
             
     def createMaskArray(self):        
         section_wavelength = self.wavelength_span/self.wavelength_sep
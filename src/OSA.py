@@ -18,14 +18,42 @@ import numpy as np
 import matplotlib.pyplot as plt
 import datetime
 import csv
+from src.CompletionWaiter import CompletionWaiter
+from src.InstrumentErrors import InstrumentConnectionError
+from src.TraceFile import write_columns
+from src.Instrument import Instrument, timed_acquisition
 
-class OSA():
+SWEEP_TIMEOUT = 600     # Hard deadline of a single sweep in seconds
+
+class OsaSettings():
+    """This class holds a snapshot of the OSA settings saved with every spectrum.
+    
+    Attributes
+    ----------
+    span: str
+        Span in nm (SPAN?).
+    rbw: str
+        Resolution bandwidth in nm (RESLN?).
+    sensitivity: str
+        Measurement sensitivity name (SENS?).
+    referenceLevel: str
+        Reference level in dB (REFL?).
+    """
+    def __init__(self, span, rbw, sensitivity, referenceLevel):
+        self.span = span
+        self.rbw = rbw
+        self.sensitivity = sensitivity
+        self.referenceLevel = referenceLevel
+
+class OSA(Instrument):
     def __init__(self,Port=None):
         """
         Initialization process of OSA script
         """
+        super().__init__()
         self.connected = False
         self.bool_sweep = False
+        self.sweepDuration = 0.0
         
         self.start_wl = '900.00'
         self.stop_wl = '1100.00'
@@ -39,8 +67,9 @@ class OSA():
         
         self.waveform = np.empty((0,1), dtype=np.float64)
         self.wavelength = np.empty((0,1), dtype=np.float64)
+        self.wavelengthKey = None       # (channel, points) of the cached wavelength axis, reset by the span/center setters
+        self.settings = None            # Cached OsaSettings, see snapshot_settings()
         self.parent=self
-        self.list_devices()
 #        self.connect()
         
 #        self.csv_ctl = csv()
@@ -60,13 +89,6 @@ class OSA():
 #        timestamp = strftime("%Y-%m-%d_%H-%M-%S_", gmtime())
 #        return timestamp + sMeaningful +'.npy'
     
-    def list_devices(self):
-        try:
-            self.rm = pyvisa.ResourceManager()
-            self.list = self.rm.list_resources()
-        except:
-            print("Couldn't find resource manager")
-                
     def connect(self, device): 
         try:
 #            self.ser=serial.Serial(self.port,self.baud,bytesize=self.bytesize, 
@@ -76,10 +98,13 @@ class OSA():
 #                self.print_message('Connected to laser ' + self.name + ' on port ' + self.port)
 #                self.connected = True
             
-            self.handle = self.rm.open_resource(device)
+            self.open_session(device)
+            # The front panel may have changed any setting since the last connection
+            self.invalidate_wavelength_cache()
+            self.invalidate_settings()
 
             self.print_message('connected to')
-            print(self.handle.query("*IDN?"))
+            print(self.query("*IDN?"))
             self.connected = True
             
             self.print_message('setting parameters')
@@ -90,85 +115,192 @@ class OSA():
         except Exception as e:
             self.print_message(e)
             self.print_message(' Couldn\'t connect')
+            raise InstrumentConnectionError("Couldn't connect to " + str(device)) from e
             
     def set_params(self):
         if self.connected:
-#            self.handle.write('STAWL'+self.start_wl + ', STPWL'+self.stop_wl +
+#            self.write('STAWL'+self.start_wl + ', STPWL'+self.stop_wl +
 #                              ', RESOLN'+self.resolution + ', AVG'+self.average +
 #                              ', SMPL'+ self.sampling_points + ', ' + self.range)
 
-#            self.handle.write()
+#            self.write()
             pass
                 
+    def invalidate_driver_caches(self):
+        self.invalidate_settings()
+        self.invalidate_wavelength_cache()
+    
     def close(self):
         
-        self.handle.write("GTL")
+        self.write("GTL")
+        # Back in local mode the front panel can change any setting
+        self.invalidate_settings()
+        self.invalidate_wavelength_cache()
         time.sleep(1)
-        self.rm.close()
+        self.close_session()
         self.print_message('Connection to OSA closed')
         
     def send_cmd(self, cmd):
         
-        self.handle.write(cmd)
+        self.write(cmd)
+        self.invalidate_settings()
+        self.invalidate_wavelength_cache()
          
-        response = self.handle.read_raw()
+        response = self.read_raw(cmd)
         return response
     
     def cont_sweep(self):
 
         self.bool_sweep = True
-        self.handle.write("RPT")
+        self.write("RPT")
     
-    def single_sweep(self):
-
+    def single_sweep(self, timeout = SWEEP_TIMEOUT, srqCommand = None):
+        """This method starts a single sweep (SGL) and waits until SWEEP? reports it finished.
+        
+        The wait wakes on a service request from the instrument and otherwise polls SWEEP?
+        with a sub-second adaptive interval, see CompletionWaiter.
+        
+        Parameters
+        ----------
+        timeout: float
+            Hard deadline of the sweep in seconds, InstrumentTimeoutError is raised after it.
+        srqCommand: str
+            Optional command sent before SGL that makes the instrument assert SRQ when the sweep ends.
+        
+        Returns
+        -------
+        sweepDuration: float
+            Observed sweep duration in seconds.
+        """
         self.bool_sweep = True
-        self.handle.write("SGL")
-        time.sleep(1)
-        response = self.handle.query("SWEEP?")
-        while response != "0\r\n":
-            time.sleep(1)
-            response = self.handle.query("SWEEP?")
-#            print(response)
-        self.bool_sweep = False
+        if srqCommand != None:
+            self.write(srqCommand)
+        startTime = time.monotonic()
+        self.write("SGL")
+        self.mark_trigger()
+        waiter = CompletionWaiter(self, timeout)
+        try:
+            self.sweepDuration = waiter.wait(lambda: self.query("SWEEP?").strip() == "0", startTime)
+        finally:
+            self.bool_sweep = False
+        return self.sweepDuration
 
+    def invalidate_wavelength_cache(self):
+        """This method forces the next grab_spectrum() to transfer the wavelength axis with WDAT.
+        """
+        self.wavelengthKey = None
+    
+    def get_wavelength_key(self, channel, samplingPoints):
+        """This method returns the key of the cached wavelength axis of a trace.
+        
+        The start and stop wavelengths are not queried, the setters that move them
+        (set_span(), set_center()), send_cmd(), connect() and close() invalidate the cache
+        instead, so a cache hit costs no bus transfer.
+        
+        Parameters
+        ----------
+        channel: str
+            Trace (A, B or C).
+        samplingPoints: int
+            Number of points of the trace, as reported by the LDAT reply.
+        """
+        self.sampling_points = str(samplingPoints)
+        return (channel, self.sampling_points)
+    
+    @timed_acquisition
     def grab_spectrum(self, channel = 'A'):
+            """This method reads the level (LDAT) and wavelength (WDAT) values of a trace.
+            
+            The wavelength axis is only transferred again when the channel or the number of
+            sampling points changed since the last grab, or the cache was invalidated.
+            """
             try:            
-                tmp = self.handle.query('LDAT'+channel)
+                tmp = self.query('LDAT'+channel)
 #                print(tmp)
-                time.sleep(1)
-                tmp2 = [float(k) for k in tmp.split(',')]
-                self.waveform = np.array(tmp2[1:])
+                self.waveform = np.array(tmp.split(','), dtype=np.float64)[1:]
 #                print(self.waveform)
             except ValueError:
                 self.close()
                 print('Acquisition error with spectrum values\r\n')
             
-            try:                
-                tmp = self.handle.query('WDAT'+channel)
-#                print(tmp)
-                time.sleep(1)
-                tmp2 = [float(k) for k in tmp.split(',')]
-                self.wavelength = np.array(tmp2[1:])
+            try:
+                wavelengthKey = self.get_wavelength_key(channel, len(self.waveform))
+                if wavelengthKey != self.wavelengthKey or len(self.wavelength) != len(self.waveform):
+                    tmp = self.query('WDAT'+channel)
+#                    print(tmp)
+                    self.wavelength = np.array(tmp.split(','), dtype=np.float64)[1:]
+                    self.start_wl = self.query("STAWL?").strip()
+                    self.stop_wl = self.query("STPWL?").strip()
+                    self.wavelengthKey = wavelengthKey
 #                print(self.wavelength)
             except ValueError:
+                self.invalidate_wavelength_cache()
                 self.close()
                 print('Acquisition error with wavelength values\r\n')  
     
+    def invalidate_settings(self):
+        """This method discards the cached settings, the next snapshot_settings() queries the OSA again.
+        """
+        self.settings = None
+    
+    def snapshot_settings(self, refresh = False):
+        """This method returns the span, RBW, sensitivity and reference level of the OSA.
+        
+        The four queries are issued back to back and the result is cached until a setter,
+        send_cmd(), a new session (connect()) or a return to local mode (close()) invalidates it.
+        
+        Parameters
+        ----------
+        refresh: boolean
+            Query the OSA even if a cached snapshot exists.
+        
+        Returns
+        -------
+        settings: OsaSettings
+            Current settings, also kept in span_wl, rbw_wl, sensitivity and reference_lvl.
+        """
+        if self.settings == None or refresh:
+            self.get_span()
+            self.get_rbw()
+            self.get_sensitivity()
+            self.get_ref_lvl()
+            self.settings = OsaSettings(self.span_wl, self.rbw_wl, self.sensitivity, self.reference_lvl)
+        else:
+            self.span_wl = self.settings.span
+            self.rbw_wl = self.settings.rbw
+            self.sensitivity = self.settings.sensitivity
+            self.reference_lvl = self.settings.referenceLevel
+        return self.settings
+    
+    def set_span(self, span):
+        self.write("SPAN" + '{0:.2f}'.format(span))
+        self.invalidate_settings()
+        self.invalidate_wavelength_cache()
+    
+    def set_center(self, centerWavelength):
+        self.write("CTRWL" + '{0:.2f}'.format(centerWavelength))
+        self.invalidate_wavelength_cache()
+    
+    def set_rbw(self, rbw):
+        self.write("RESLN" + '{0:.2f}'.format(rbw))
+        self.invalidate_settings()
+    
+    def set_ref_lvl(self, referenceLevel):
+        self.write("REFL" + '{0:.1f}'.format(referenceLevel))
+        self.invalidate_settings()
+    
     def get_span(self):
-        self.span_wl = self.handle.query("SPAN?")
-        time.sleep(1)
+        self.span_wl = self.query("SPAN?")
         self.span_wl = self.span_wl.replace("\r","")
         self.span_wl = self.span_wl.replace("\n","") 
     
     def get_rbw(self):
-        self.rbw_wl = self.handle.query("RESLN?")
-        time.sleep(1)
+        self.rbw_wl = self.query("RESLN?")
         self.rbw_wl = self.rbw_wl.replace("\r","")
         self.rbw_wl = self.rbw_wl.replace("\n","") 
 
     def get_sensitivity(self):
-        sensitivity_num = self.handle.query("SENS?")
-        time.sleep(1)
+        sensitivity_num = self.query("SENS?")
         sensitivity_num = sensitivity_num.replace("\r","")
         sensitivity_num = sensitivity_num.replace("\n","")
         sensitivity_num = int(sensitivity_num)
@@ -183,20 +315,41 @@ class OSA():
         self.sensitivity = sensitivity_lvl.get(sensitivity_num)
     
     def get_ref_lvl(self):
-        self.reference_lvl = self.handle.query("REFL?")
-        time.sleep(1)
+        self.reference_lvl = self.query("REFL?")
         self.reference_lvl = self.reference_lvl.replace("\r","")
         self.reference_lvl = self.reference_lvl.replace("\n","")
-        
-    def print_message(self, msg):
-        if __name__ == "__main__":
-            print(msg)
     
+    def get_binary_arrays(self):
+        return {"wavelength": self.wavelength, "level": self.waveform}
+    
+    def get_binary_metadata(self):
+        return {
+            "span": self.span_wl,
+            "resolutionBandwidth": self.rbw_wl,
+            "sensitivity": self.sensitivity,
+            "referenceLevel": self.reference_lvl,
+            "startWavelength": self.start_wl,
+            "stopWavelength": self.stop_wl,
+            "samplingPoints": self.sampling_points,
+        }
+    
+    def set_binary_arrays(self, arrays, metadata):
+        self.wavelength = arrays["wavelength"]
+        self.waveform = arrays["level"]
+        self.invalidate_wavelength_cache()                  # The loaded axis was not read from the OSA
+        self.span_wl = metadata.get("span", self.span_wl)
+        self.rbw_wl = metadata.get("resolutionBandwidth", self.rbw_wl)
+        self.sensitivity = metadata.get("sensitivity", self.sensitivity)
+        self.reference_lvl = metadata.get("referenceLevel", self.reference_lvl)
+        self.start_wl = metadata.get("startWavelength", self.start_wl)
+        self.stop_wl = metadata.get("stopWavelength", self.stop_wl)
+        self.sampling_points = metadata.get("samplingPoints", self.sampling_points)
+        
     def save_csv(self, fileName):
         try:
             with open(fileName, 'w',newline='') as fileWriter:
                 self.csvWriter = csv.writer(fileWriter, delimiter = '\t')
-                now_ = datetime.datetime.now()
+                now_ = self.get_capture_datetime()
                 timestamp = now_.strftime('%m/%d/%Y %H:%M hrs')
                 self.csvWriter.writerow([timestamp])
                 self.csvWriter.writerow(["Reference Level: " + self.reference_lvl + " (dB)"])
@@ -204,8 +357,7 @@ class OSA():
                 self.csvWriter.writerow(["Resolution bandwidth: " + self.rbw_wl + " (nm)"])
                 self.csvWriter.writerow(["Span: " + self.span_wl + " (nm)"])
                 self.csvWriter.writerow(["Wavelength (nm) Amplitude (dB)"])
-                for (x,y) in zip(self.wavelength, self.waveform):
-                    self.csvWriter.writerow(('{0:.3f}'.format(x),'{0:.3f}'.format(y)))
+                write_columns(fileWriter, (self.wavelength, self.waveform), ('%.3f', '%.3f'))
         except:
             self.close()
             print("Error while saving " + fileName + " file")
@@ -225,10 +377,7 @@ if __name__ == "__main__":
 #    OSA.single_sweep()
     time.sleep(1)
     print('Now')
-    OSA.get_span()
-    OSA.get_rbw()
-    OSA.get_sensitivity()
-    OSA.get_ref_lvl()
+    OSA.snapshot_settings()
     OSA.grab_spectrum('B')
     now_ = datetime.datetime.now()
     timestamp = now_.strftime("%Y-%m-%d_%H-%M")
@@ -6,10 +6,10 @@ Created on Wed Jul 17 13:21:34 2019
 """
 
 import matplotlib.pyplot as plt
-import csv
 import numpy as np
 import tkinter as tk
 from tkinter import filedialog
+from src.TraceFile import read_trace_csv
 
 class OpticalDataManager():
     def __init__(self):
@@ -21,19 +21,14 @@ class OpticalDataManager():
         self.yArray = []
         
     def read_csv(self, delimiterType, xCol, yCol):
-        with open(self.fileName, 'r') as fileReader:
-            if delimiterType == 'comma':
-                self.csvReader = csv.reader(fileReader, delimiter = ',')
-            elif delimiterType == 'tab':
-                self.csvReader = csv.reader(fileReader, delimiter = '\t')
-            else: 
-                self.csvReader = csv.reader(fileReader)
-            for row in self.csvReader:
-                if len(row) >= 2:
-                    self.xVar.append(float(row[xCol]))
-                    self.yVar.append(float(row[yCol]))
-                else:
-                    self.header.append(row)
+        if delimiterType == 'tab':
+            delimiter = '\t'
+        else:
+            delimiter = ','         # 'comma' and the csv.reader default
+        ((xValues, yValues), header, extrema) = read_trace_csv(self.fileName, (xCol, yCol), delimiter)
+        self.xVar.extend(xValues.tolist())
+        self.yVar.extend(yValues.tolist())
+        self.header.extend(header)
     
     def conv_to_array(self):
         self.xArray = np.asarray(self.xVar)
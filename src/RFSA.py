@@ -12,16 +12,22 @@ Created on Mon Jun 11 16:46:27 2018
 @author: st452223
 """
 
-import visa
+import pyvisa
 import time
 import numpy as np
 import datetime
 import matplotlib.pyplot as plt
 import csv
+from src.InstrumentErrors import InstrumentConnectionError
+from src.TraceFile import write_columns
+from src.Instrument import Instrument, timed_acquisition
 
 GLOBAL_TOUT =  100000   # IO time out in milliseconds
 START_FREQUENCY = 100   # HP8566B start frequency limit
 STOP_FREQUENCY = 22e9   # HP8566B stop frequency limit
+TRACE_POINTS = 1001     # HP8566B trace length
+TOP_GRATICULE_UNITS = 1000  # Measurement units (O2 format) of the top graticule line, i.e. the reference level
+DEFAULT_TRACE_FORMAT = "BINARY" # Trace transfer format of get_spectrum(), BINARY (O2) or ASCII (O3)
 
 switcherFrequencyMultiplier = {
     0: "HZ",    # 1e0 Hz: Hz.
@@ -37,26 +43,21 @@ switcherFrequencyMultiplierReverse = {
     "GZ": 1e9,    # 1e9 Hz: GHz.
 }
 
-class RFSA():
+class RFSA(Instrument):
     def __init__(self,Port=None): 
+        super().__init__()
         self.connected = False
         self.bool_sweep = False
+        self.clearOnReconnect = False   # A device clear resets the HPIB interface of the 8566B, see set_params()
         
         # freqs are in MHz
         self.start_freq = 0
         self.stop_freq = 200
         self.center_freq = 100
         self.span        = 200
-        self.list_devices()
+        self.sweepMetadataValid = False     # CF, RB, VB, FA, FB, RL and LG values cached by get_sweep_metadata()
     
     
-    def list_devices(self):
-        try:
-            self.rm = visa.ResourceManager()
-            self.list = self.rm.list_resources()
-        except:
-            print("couldn't find resource manager")
-                
     def connect(self, device): 
         try:
 #            self.ser=serial.Serial(self.port,self.baud,bytesize=self.bytesize, 
@@ -65,37 +66,43 @@ class RFSA():
 #            if self.ser.isOpen():
 #                self.print_message('Connected to laser ' + self.name + ' on port ' + self.port)
             self.connected = True
-            self.handle = self.rm.open_resource(device)
+            self.open_session(device)
+            self.invalidate_sweep_metadata()   # The front panel may have changed the sweep since the last connection
             self.print_message('Hopefully connected to RFSA')
             print(self.handle)
-#            self.handle.write("*CLS")
+#            self.write("*CLS")
             self.set_params()
         except Exception as e:
             self.print_message(e)
             self.print_message(' Couldn\'t connect')
+            raise InstrumentConnectionError("Couldn't connect to " + str(device)) from e
             
     def set_params(self):
         if self.connected:
 #            self.send_cmd('OUTPUT 718; "*FA%dMZ;"' %(self.start_freq))
 #            self.send_cmd('OUTPUT 718; "*FB%dMZ;"' %self.stop_freq)
-#            self.handle.write('STAWL'+self.start_wl + ', STPWL'+self.stop_wl +
+#            self.write('STAWL'+self.start_wl + ', STPWL'+self.stop_wl +
 #                              ', RESOLN'+self.resolution + ', AVG'+self.average +
 #                              ', SMPL'+ self.sampling_points + ', ' + self.range)
 
-#            self.handle.write()
+#            self.write()
             self.handle.timeout = GLOBAL_TOUT
             ## Clear the instrument bus. This command resets the HPIB bus so we have to skip it
-#            self.handle.clear() 
+#            self.clear() 
 
             ## Clear any previously encountered errors
-            self.handle.write("*CLS")            
+            self.write("*CLS")            
             
+    def invalidate_driver_caches(self):
+        self.invalidate_sweep_metadata()
+    
     def close(self):
-        self.rm.close()
+        self.close_session()
         self.print_message('Connection to RFSA closed')
         
     def send_cmd(self, cmd):     
-        self.handle.write(cmd)
+        self.write(cmd)
+        self.invalidate_sweep_metadata()
     
     def convert_number_to_frequency_command(self, frequencyNumber):
         """This method converts a frequency number into a string that the RFSA will recognize.
@@ -159,7 +166,8 @@ class RFSA():
             stopFrequency = self.get_stop_frequency()
             if startFrequency < stopFrequency:
                 startFrequencyCommand = self.convert_number_to_frequency_command(startFrequency)
-                self.handle.write('FA ' + startFrequencyCommand)
+                self.write('FA ' + startFrequencyCommand)
+                self.invalidate_sweep_metadata()
             else:
                 print("Start frequency", startFrequency, "Hz, higher than stop frequency", stopFrequency, "Hz.")
         else:
@@ -175,7 +183,7 @@ class RFSA():
         startFrequency: float
             Start frequency in Hz.
         """
-        startFrequencyCommand = self.handle.query('FA?')
+        startFrequencyCommand = self.query('FA?')
 #        print("FA?", startFrequencyCommand)
         self.startFrequency = self.convert_frequency_command_to_number(startFrequencyCommand)
         return self.startFrequency
@@ -194,7 +202,8 @@ class RFSA():
             startFrequency = self.get_start_frequency()
             if stopFrequency > startFrequency:
                 stopFrequencyCommand = self.convert_number_to_frequency_command(stopFrequency)
-                self.handle.write('FB ' + stopFrequencyCommand)
+                self.write('FB ' + stopFrequencyCommand)
+                self.invalidate_sweep_metadata()
             else:
                 print("Stop frequency", stopFrequency, "Hz, lower than start frequency", startFrequency, "Hz.")
         else:
@@ -210,13 +219,69 @@ class RFSA():
         startFrequency: float
             Stop frequency in Hz.
         """
-        stopFrequencyCommand = self.handle.query('FB?')
+        stopFrequencyCommand = self.query('FB?')
 #        print("FB?", stopFrequencyCommand)
         self.stopFrequency = self.convert_frequency_command_to_number(stopFrequencyCommand)
         return self.stopFrequency
   
-    def get_spectrum(self):
+    def invalidate_sweep_metadata(self):
+        """This method forces the next get_spectrum() to query the sweep settings again.
+        """
+        self.sweepMetadataValid = False
+    
+    def get_sweep_metadata(self, refresh = False):
+        """This method queries the sweep settings of the RFSA and caches them until a setter changes them.
+        
+        The central frequency (CF?), resolution bandwidth (RB?), video bandwidth (VB?), start
+        and stop frequencies (FA?, FB?), reference level (RL?) and log scale (LG?) are stored
+        in the corresponding attributes.
+        
+        Parameters
+        ----------
+        refresh: boolean
+            Query the RFSA even if the cached values are still valid.
+        """
+        if refresh or not self.sweepMetadataValid:
+            self.centralFrequency = self.query('CF?')     # Central frequency query
+            self.resolutionBandwidth = self.query('RB?')  # Resolution bandwidth
+            self.videoBandwidth = self.query('VB?')       # Video bandwidth
+            self.get_start_frequency()                          # Obtain trace start frequency
+            self.get_stop_frequency()                           # Obtain trace stop frequency
+            self.referenceLevel = float(self.query('RL?'))   # Reference level in dBm
+            self.logScale = float(self.query('LG?'))         # Log scale in dB/div, 0 in linear mode
+            self.sweepMetadataValid = True
+    
+    def read_trace_binary(self):
+        """This method reads trace A in the O2 binary format and converts it to dBm.
+        
+        Every point is a 16-bit measurement unit, MSB first, where TOP_GRATICULE_UNITS is the
+        reference level and every division of the 10 division display spans
+        TOP_GRATICULE_UNITS/10 units. The output format is set back to O3 afterwards.
+        
+        Returns
+        -------
+        spectrum: array
+            Trace A amplitude in dBm.
+        """
+        self.write('O2')
+        try:
+            traceUnits = self.query_binary_block('TA', 'H', True, headerFmt = 'empty', dataPoints = TRACE_POINTS, expectTermination = False)
+        finally:
+            self.write('O3')
+        dbPerUnit = self.logScale*10/TOP_GRATICULE_UNITS
+        return self.referenceLevel + (traceUnits.astype(np.float64) - TOP_GRATICULE_UNITS)*dbPerUnit
+    
+    @timed_acquisition
+    def get_spectrum(self, traceFormat = DEFAULT_TRACE_FORMAT, refreshMetadata = False):
         """This method acquires the waveform stored in trace A and saves it in spectrum and freqs.
+        
+        Parameters
+        ----------
+        traceFormat: str
+            BINARY to transfer the trace in the O2 format, ASCII to read it as real amplitude text.
+            The binary format is only used with a log amplitude scale.
+        refreshMetadata: boolean
+            Query the sweep settings even if the cached values are still valid.
         """
         # stop continuous measurements and draw trace A
 #        self.send_cmd('IP;LF;')
@@ -226,13 +291,13 @@ class RFSA():
        # self.send_cmd('OUTPUT 718; "*FA%dMZ;*FB%dMZ;S2;TS;"' %(self.start_freq, self.start_freq))
 #        self.send_cmd('OUTPUT 718; "O1;TA"')
 #        self.send_cmd('SNGLS')                          # Single sweep
-        self.centralFrequency = self.handle.query('CF?')     # Central frequency query
-#        frequencySpan = self.handle.query('SP?')        # Span
-        self.resolutionBandwidth = self.handle.query('RB?')  # Resolution bandwidth
-        self.videoBandwidth = self.handle.query('VB?')       # Video bandwidth
-        startFrequency = self.get_start_frequency()     # Obtain trace start frequency
-        stopFrequency = self.get_stop_frequency()       # Obtain trace start frequency
-        traceA = self.handle.query('TA')                # Query waveform from trace A
+#        frequencySpan = self.query('SP?')        # Span
+        self.get_sweep_metadata(refreshMetadata)
+        if traceFormat.upper() == "BINARY" and self.logScale > 0:
+            self.spectrum = self.read_trace_binary()
+        else:
+            traceA = self.query('TA')                # Query waveform from trace A
+            self.spectrum = np.array(traceA.split(), dtype=np.float64)
 
 #        Testing labels
 #        print(type(traceA))
@@ -241,14 +306,40 @@ class RFSA():
 #        print("RBW:", self.resolutionBandwidth, "Hz")
 #        print("VBW:", self.videoBandwidth, "Hz")
 #        print("Central frequency:", self.centralFrequency, "Hz")
-        self.spectrum = np.array([float(k) for k in traceA.splitlines()])
-        self.freqs    = np.linspace(startFrequency, stopFrequency, len(self.spectrum))
+        self.freqs    = np.linspace(self.startFrequency, self.stopFrequency, len(self.spectrum))
+    
+    def get_binary_arrays(self):
+        return {"frequency": self.freqs, "spectrum": self.spectrum}
+    
+    def get_binary_metadata(self):
+        return {
+            "resolutionBandwidth": self.resolutionBandwidth.strip(),
+            "videoBandwidth": self.videoBandwidth.strip(),
+            "centralFrequency": self.centralFrequency.strip(),
+            "startFrequency": self.startFrequency,
+            "stopFrequency": self.stopFrequency,
+            "referenceLevel": self.referenceLevel,
+            "logScale": self.logScale,
+        }
+    
+    def set_binary_arrays(self, arrays, metadata):
+        self.freqs = arrays["frequency"]
+        self.spectrum = arrays["spectrum"]
+        self.invalidate_sweep_metadata()                    # The loaded settings were not read from the RFSA
+        self.resolutionBandwidth = metadata.get("resolutionBandwidth", 'XX')
+        self.videoBandwidth = metadata.get("videoBandwidth", 'XX')
+        self.centralFrequency = metadata.get("centralFrequency", 'XX')
+        if "startFrequency" in metadata:
+            self.startFrequency = metadata["startFrequency"]
+            self.stopFrequency = metadata["stopFrequency"]
+            self.referenceLevel = metadata["referenceLevel"]
+            self.logScale = metadata["logScale"]
 
     def save_csv(self, fileName):
         try:
             with open(fileName, 'w',newline='') as fileWriter:
                 self.csvWriter = csv.writer(fileWriter, delimiter = '\t')
-                now_ = datetime.datetime.now()
+                now_ = self.get_capture_datetime()
                 timestamp = now_.strftime('%m/%d/%Y %H:%M hrs')
                 self.csvWriter.writerow([timestamp])
 #                self.csvWriter.writerow(["Reference Level: " + self.reference_lvl + " (dB)"])
@@ -258,16 +349,11 @@ class RFSA():
                 self.csvWriter.writerow(["Cental frequency: " + self.centralFrequency + " (Hz)"])
 #                self.csvWriter.writerow(["Span: " + self.span_wl + " (nm)"])
 #                self.csvWriter.writerow(["Wavelength (nm) Amplitude (dB)"])
-                for (x,y) in zip(self.freqs, self.spectrum):
-                    self.csvWriter.writerow(('{0:.3f}'.format(x),'{0:.3f}'.format(y)))
+                write_columns(fileWriter, (self.freqs, self.spectrum), ('%.3f', '%.3f'))
         except:
             self.close()
             print("Error while saving " + fileName + " file")
         
-    def print_message(self, msg):
-        if __name__ == "__main__":
-            print(msg)
-
     def plot_waveform(self):
         """Plot the acquired waveform after function get_spectrum().
         """
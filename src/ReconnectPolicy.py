@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Reconnection policy of the instrument drivers.
+
+A transient GPIB failure (a timeout, a bus reset, an instrument that stops answering for a
+moment) should not end a sweep that runs for hours. The policy tells the drivers how many
+times to reopen a failed session and how long to wait before every attempt, the waits grow
+exponentially up to maxDelay so a bus that recovers slowly is not hammered.
+
+Typical usage example:
+    TDS210.reconnectPolicy = ReconnectPolicy(maxRetries = 6, maxDelay = 30)
+    TDS210.call_with_reconnect(TDS210.acquire_waveform)
+
+@author: ri679647
+"""
+
+DEFAULT_MAX_RETRIES = 4         # Attempts to reopen a session before giving up
+DEFAULT_INITIAL_DELAY = 0.5     # Wait before the first attempt in seconds
+DEFAULT_MAX_DELAY = 16.0        # Longest wait between attempts in seconds
+DEFAULT_GROWTH = 2.0            # Wait multiplier after every failed attempt
+
+class ReconnectPolicy():
+    """This class holds the retry count and the exponential backoff of the reconnections.
+    
+    Attributes
+    ----------
+    maxRetries: int
+        Attempts to reopen a session before InstrumentConnectionError is raised.
+    initialDelay: float
+        Wait before the first attempt in seconds.
+    maxDelay: float
+        Longest wait between attempts in seconds.
+    growth: float
+        Wait multiplier after every failed attempt.
+    """
+    def __init__(self, maxRetries = DEFAULT_MAX_RETRIES, initialDelay = DEFAULT_INITIAL_DELAY,
+                 maxDelay = DEFAULT_MAX_DELAY, growth = DEFAULT_GROWTH):
+        self.maxRetries = maxRetries
+        self.initialDelay = initialDelay
+        self.maxDelay = maxDelay
+        self.growth = growth
+    
+    def get_delay(self, attempt):
+        """This method returns the wait before attempt (counted from 0) in seconds.
+        """
+        return min(self.initialDelay*self.growth**attempt, self.maxDelay)
+    
+    def get_delays(self):
+        """This method returns the wait before every attempt in seconds.
+        """
+        return [self.get_delay(attempt) for attempt in range(self.maxRetries)]
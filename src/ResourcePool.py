@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Process wide VISA resource manager and connection pool.
+
+Creating a ResourceManager and opening a GPIB session costs a noticeable time on every
+capture. The drivers share a single ResourceManager and keep their sessions in a pool
+keyed by resource address, so reconnecting to an instrument reuses the live session.
+Sessions are health checked with a serial poll before being reused and closed once they
+stay released for longer than the idle timeout.
+
+Typical usage example:
+    pool = shared_pool()
+    handle = pool.acquire('GPIB0::27::INSTR')
+    ...
+    pool.release('GPIB0::27::INSTR')
+
+@author: ri679647
+"""
+
+import atexit
+import threading
+import time
+import pyvisa
+
+DEFAULT_IDLE_TIMEOUT = 300      # Released sessions idle for longer than this are closed, in seconds
+DEFAULT_LIST_TTL = 60           # Bus enumerations younger than this are reused, in seconds
+
+class PooledSession():
+    """This class holds one open session of the pool.
+    
+    Attributes
+    ----------
+    handle: pyvisa resource
+        Open session of the instrument.
+    users: int
+        Number of drivers that acquired the session and did not release it yet.
+    lastUsed: float
+        time.monotonic() value of the last acquire or release.
+    """
+    def __init__(self, handle):
+        self.handle = handle
+        self.users = 0
+        self.lastUsed = time.monotonic()
+
+class ResourcePool():
+    """This class shares a ResourceManager and its open sessions between the drivers.
+    
+    Attributes
+    ----------
+    idleTimeout: float
+        Released sessions idle for longer than this are closed, in seconds.
+    rm: pyvisa ResourceManager
+        Shared resource manager, created on first use.
+    sessions: dict
+        PooledSession of every open session keyed by resource address.
+    opened: int
+        Number of sessions opened by the pool.
+    reused: int
+        Number of acquires served by an already open session.
+    listTtl: float
+        Bus enumerations younger than this are reused, in seconds.
+    resources: tuple
+        Memoized result of the last bus enumeration, None before the first one.
+    busLocks: dict
+        Lock of every interface board keyed by board name, e.g. 'GPIB0'.
+    """
+    def __init__(self, idleTimeout = DEFAULT_IDLE_TIMEOUT, listTtl = DEFAULT_LIST_TTL):
+        self.idleTimeout = idleTimeout
+        self.listTtl = listTtl
+        self.resources = None
+        self.resourcesTime = 0.0
+        self.rm = None
+        self.sessions = {}
+        self.opened = 0
+        self.reused = 0
+        self.busLocks = {}
+        self.lock = threading.RLock()
+    
+    def get_resource_manager(self):
+        """This method returns the shared ResourceManager, creating it on first use.
+        """
+        with self.lock:
+            if self.rm == None:
+                self.rm = pyvisa.ResourceManager()
+            return self.rm
+    
+    def list_resources(self, refresh = False):
+        """This method returns the resources on the bus.
+        
+        Scanning the bus takes seconds on GPIB, so the result is memoized for listTtl seconds.
+        
+        Parameters
+        ----------
+        refresh: boolean
+            Scan the bus again even if the memoized list did not expire yet.
+        """
+        with self.lock:
+            if refresh or self.resources == None or time.monotonic() - self.resourcesTime > self.listTtl:
+                self.resources = self.get_resource_manager().list_resources()
+                self.resourcesTime = time.monotonic()
+            return self.resources
+    
+    def is_healthy(self, handle):
+        """This method checks that an open session still talks to its instrument.
+        
+        A serial poll is used because every GPIB instrument answers it, including the
+        ones without IEEE 488.2 common commands, and it leaves the output queue untouched.
+        """
+        try:
+            handle.read_stb()
+            return True
+        except Exception:
+            return False
+    
+    def acquire(self, address):
+        """This method returns an open session of the instrument at address.
+        
+        A healthy pooled session is reused, otherwise a new one is opened.
+        
+        Parameters
+        ----------
+        address: str
+            VISA resource address, e.g. 'GPIB0::27::INSTR'.
+        
+        Returns
+        -------
+        handle: pyvisa resource
+            Open session of the instrument.
+        """
+        with self.lock:
+            self.evict_idle()
+            session = self.sessions.get(address)
+            if session != None and not self.is_healthy(session.handle):
+                self.discard(address)
+                session = None
+            if session == None:
+                session = PooledSession(self.get_resource_manager().open_resource(address))
+                self.sessions[address] = session
+                self.opened = self.opened + 1
+            else:
+                self.reused = self.reused + 1
+            session.users = session.users + 1
+            session.lastUsed = time.monotonic()
+            return session.handle
+    
+    def get_bus_lock(self, address):
+        """This method returns the lock serializing the transfers on the interface board of address.
+        
+        A GPIB board addresses one talker at a time, so drivers running in parallel threads
+        take this lock around every bus transfer. Instruments on different boards do not
+        share a lock.
+        
+        Parameters
+        ----------
+        address: str
+            VISA resource address, e.g. 'GPIB0::27::INSTR'.
+        """
+        board = address.split('::')[0].upper()
+        with self.lock:
+            if board not in self.busLocks:
+                self.busLocks[board] = threading.RLock()
+            return self.busLocks[board]
+    
+    def release(self, address):
+        """This method hands a session back to the pool without closing it.
+        """
+        with self.lock:
+            session = self.sessions.get(address)
+            if session != None:
+                session.users = max(session.users - 1, 0)
+                session.lastUsed = time.monotonic()
+    
+    def discard(self, address):
+        """This method closes the session of address and removes it from the pool.
+        """
+        with self.lock:
+            session = self.sessions.pop(address, None)
+            if session != None:
+                try:
+                    session.handle.close()
+                except Exception:
+                    pass
+    
+    def evict_idle(self):
+        """This method closes the released sessions that stayed idle for longer than idleTimeout.
+        """
+        with self.lock:
+            now = time.monotonic()
+            for address in list(self.sessions):
+                session = self.sessions[address]
+                if session.users == 0 and now - session.lastUsed > self.idleTimeout:
+                    self.discard(address)
+    
+    def use_resource_manager(self, rm):
+        """This method replaces the shared ResourceManager, e.g. by a simulated one, closing the open sessions.
+        """
+        with self.lock:
+            self.close()
+            self.rm = rm
+    
+    def close(self):
+        """This method closes every session and the shared ResourceManager.
+        """
+        with self.lock:
+            for address in list(self.sessions):
+                self.discard(address)
+            if self.rm != None:
+                try:
+                    self.rm.close()
+                except Exception:
+                    pass
+                self.rm = None
+            self.resources = None
+
+sharedPool = None
+
+def shared_pool():
+    """This function returns the process wide ResourcePool, creating it on first use.
+    """
+    global sharedPool
+    if sharedPool == None:
+        sharedPool = ResourcePool()
+        atexit.register(sharedPool.close)
+    return sharedPool
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only session files holding every trace of an acquisition run.
+
+A sweep used to leave one CSV file per trace on the network share, so reloading it cost
+thousands of opens. A session file keeps the traces of a run, or of several runs, in a
+single file:
+
+    file header | record | record | ... | index record | trailer
+
+Every record holds the JSON metadata of one trace (name, array layout and the metadata of
+the capture, see Instrument.get_binary_capture()) followed by its arrays, aligned to
+ALIGNMENT bytes and written in chunks of CHUNK_BYTES. A CRC-32 covers the metadata and the
+arrays. The index record at the end lists the offset and metadata of every trace, so
+opening a session costs one read of the index and loading a whole sweep one contiguous
+read of the data. With memoryMap the arrays are read-only views of a memory map of the file
+instead, nothing is read until a sample is used and the pages stay reclaimable, so the
+analysis of an archive larger than the memory only holds the traces in use.
+
+Records are never rewritten. append() syncs every record to disk, the index is written
+by close() and dropped when the session is opened to append again. If the process dies
+before close(), opening the file scans the records instead, keeps every record whose CRC
+matches and discards the torn tail.
+
+Typical usage example:
+    with SessionStore(filePath + '\\\\sweep.session') as session:
+        TDS210.acquire_waveform()
+        TDS210.append_to_session(session, 'SHG/' + shgAcFileName)
+    session = SessionStore(filePath + '\\\\sweep.session', 'r')
+    traces = session.read_all()
+    for name in session.get_names():
+        (arrays, metadata) = session.read(name, memoryMap = True)
+
+@author: ri679647
+"""
+
+import json
+import os
+import struct
+import zlib
+import numpy as np
+from src.CaptureStore import get_json_value
+
+FILE_MAGIC = b'DAQSESS1'
+RECORD_MAGIC = b'TRC1'
+INDEX_MAGIC = b'IDX1'
+TRAILER_MAGIC = b'END1'
+RECORD_HEADER = struct.Struct('<4sIQI')     # Magic, metadata bytes, payload bytes, CRC-32 of metadata and payload
+TRAILER = struct.Struct('<4sQ')             # Magic, offset of the index record
+ALIGNMENT = 64                              # Arrays start at multiples of ALIGNMENT bytes
+CHUNK_BYTES = 1 << 20                       # Bytes handed to a single write() call
+
+def get_aligned(offset):
+    return -(-offset//ALIGNMENT)*ALIGNMENT
+
+def get_layout(arrays):
+    """This function places the arrays of a record one after the other, every one aligned.
+
+    Returns
+    -------
+    layout: list
+        name, dtype, shape and offset from the start of the payload of every array.
+    payloadLength: int
+        Bytes of the payload.
+    """
+    layout = []
+    offset = 0
+    for name, array in arrays.items():
+        offset = get_aligned(offset)
+        layout.append({"name": name, "dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+        offset += array.nbytes
+    return (layout, offset)
+
+def get_arrays(buffer, payloadStart, layout):
+    """This function returns the arrays of a record as views of buffer, nothing is copied.
+    """
+    arrays = {}
+    for entry in layout:
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype = np.int64))
+        array = np.frombuffer(buffer, dtype = dtype, count = count, offset = payloadStart + entry["offset"])
+        arrays[entry["name"]] = array.reshape(entry["shape"])
+    return arrays
+
+class SessionStore():
+    """This class appends traces to a session file and reads them back.
+
+    A trace appended again under the same name replaces the previous one in the index,
+    the old record stays in the file.
+
+    Attributes
+    ----------
+    fileName: str
+        Session file.
+    mode: str
+        'r' to read an existing session, 'a' to create it or append to it.
+    autoFlush: boolean
+        Sync the file after every append(), so a trace survives a crash once append()
+        returned.
+    records: dict
+        Offset and metadata of every trace keyed by name, in the order they were appended.
+    dataEnd: int
+        End of the last record, where the next record or the index is written.
+    """
+    def __init__(self, fileName, mode = 'a', autoFlush = True):
+        if mode not in ('r', 'a'):
+            raise ValueError("Invalid session mode: " + str(mode))
+        self.fileName = fileName
+        self.mode = mode
+        self.autoFlush = autoFlush
+        self.records = {}
+        self.dataEnd = len(FILE_MAGIC)
+        if mode == 'a' and not os.path.isfile(fileName):
+            self.fileHandle = open(fileName, 'w+b')
+            self.fileHandle.write(FILE_MAGIC)
+            self.flush()
+            return
+        self.fileHandle = open(fileName, 'rb' if mode == 'r' else 'r+b')
+        if self.fileHandle.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            self.fileHandle.close()
+            raise ValueError(fileName + " is not a session file")
+        if not self.read_index():
+            self.scan_records()
+        if mode == 'a':
+            self.fileHandle.truncate(self.dataEnd)     # Drop the index, or the torn tail of a crash
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def read_index(self):
+        """This method loads the index written at the end of the file.
+
+        Returns
+        -------
+        found: boolean
+            False if the file does not end with a valid index, e.g. after a crash.
+        """
+        fileSize = self.fileHandle.seek(0, os.SEEK_END)
+        if fileSize < len(FILE_MAGIC) + TRAILER.size:
+            return False
+        self.fileHandle.seek(fileSize - TRAILER.size)
+        (magic, indexOffset) = TRAILER.unpack(self.fileHandle.read(TRAILER.size))
+        if magic != TRAILER_MAGIC or indexOffset + RECORD_HEADER.size > fileSize - TRAILER.size:
+            return False
+        self.fileHandle.seek(indexOffset)
+        (magic, metadataLength, payloadLength, crc) = RECORD_HEADER.unpack(self.fileHandle.read(RECORD_HEADER.size))
+        if magic != INDEX_MAGIC or indexOffset + RECORD_HEADER.size + metadataLength != fileSize - TRAILER.size:
+            return False
+        indexBytes = self.fileHandle.read(metadataLength)
+        if zlib.crc32(indexBytes) != crc:
+            return False
+        self.records = {}
+        for record in json.loads(indexBytes.decode('utf-8')):
+            self.records[record["name"]] = record
+        self.dataEnd = indexOffset
+        return True
+
+    def scan_records(self):
+        """This method rebuilds the index from the records, up to the first incomplete or corrupt one.
+        """
+        fileSize = self.fileHandle.seek(0, os.SEEK_END)
+        offset = len(FILE_MAGIC)
+        self.records = {}
+        while offset + RECORD_HEADER.size <= fileSize:
+            self.fileHandle.seek(offset)
+            (magic, metadataLength, payloadLength, crc) = RECORD_HEADER.unpack(self.fileHandle.read(RECORD_HEADER.size))
+            if magic != RECORD_MAGIC:
+                break
+            payloadStart = get_aligned(offset + RECORD_HEADER.size + metadataLength)
+            if payloadStart + payloadLength > fileSize:
+                break
+            metadataBytes = self.fileHandle.read(metadataLength)
+            self.fileHandle.seek(payloadStart)
+            recordCrc = zlib.crc32(metadataBytes)
+            remaining = payloadLength
+            while remaining > 0:
+                chunk = self.fileHandle.read(min(CHUNK_BYTES, remaining))
+                recordCrc = zlib.crc32(chunk, recordCrc)
+                remaining -= len(chunk)
+            if recordCrc != crc:
+                break
+            record = json.loads(metadataBytes.decode('utf-8'))
+            record["offset"] = offset
+            record["payloadStart"] = payloadStart
+            record["payloadLength"] = payloadLength
+            self.records.pop(record["name"], None)
+            self.records[record["name"]] = record
+            offset = payloadStart + payloadLength
+        self.dataEnd = offset
+        if offset < fileSize:
+            print("Session " + self.fileName + ": " + str(fileSize - offset) + " bytes after the last complete record were discarded")
+
+    def append(self, name, arrays, metadata = None):
+        """This method appends a trace at the end of the session.
+
+        Parameters
+        ----------
+        name: str
+            Name of the trace, e.g. the file name save_csv() would have used.
+        arrays: dict
+            Arrays of the trace keyed by name, saved with their dtype and shape.
+        metadata: dict
+            JSON serializable description of the trace.
+        """
+        if self.mode != 'a':
+            raise ValueError("Session " + self.fileName + " is read only")
+        arrays = {arrayName: np.ascontiguousarray(array) for arrayName, array in arrays.items()}
+        (layout, payloadLength) = get_layout(arrays)
+        record = {"name": name, "arrays": layout, "metadata": {} if metadata == None else metadata}
+        metadataBytes = json.dumps(record, default = get_json_value).encode('utf-8')
+        offset = self.dataEnd
+        payloadStart = get_aligned(offset + RECORD_HEADER.size + len(metadataBytes))
+        chunks = []                 # Payload in file order, the alignment padding included
+        position = 0
+        for entry in layout:
+            chunks.append(bytes(entry["offset"] - position))
+            array = arrays[entry["name"]]
+            chunks.append(memoryview(array).cast('B') if array.nbytes > 0 else b'')
+            position = entry["offset"] + array.nbytes
+        crc = zlib.crc32(metadataBytes)
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+        self.fileHandle.seek(offset)
+        self.fileHandle.write(RECORD_HEADER.pack(RECORD_MAGIC, len(metadataBytes), payloadLength, crc))
+        self.fileHandle.write(metadataBytes)
+        self.fileHandle.write(bytes(payloadStart - offset - RECORD_HEADER.size - len(metadataBytes)))
+        for chunk in chunks:
+            for start in range(0, len(chunk), CHUNK_BYTES):
+                self.fileHandle.write(chunk[start:start + CHUNK_BYTES])
+        record["offset"] = offset
+        record["payloadStart"] = payloadStart
+        record["payloadLength"] = payloadLength
+        self.records.pop(name, None)
+        self.records[name] = record
+        self.dataEnd = payloadStart + payloadLength
+        if self.autoFlush:
+            self.flush()
+
+    def get_names(self):
+        return list(self.records)
+
+    def has_trace(self, name):
+        return name in self.records
+
+    def get_metadata(self, name):
+        """This method returns the metadata of a trace without reading its arrays.
+        """
+        return self.records[name]["metadata"]
+
+    def get_memory_map(self, offset, length):
+        """This method maps length bytes of the file from offset read-only.
+
+        The map is released once the last array viewing it is gone.
+        """
+        if self.mode == 'a':
+            self.fileHandle.flush()     # Appended records may still be buffered
+        return np.memmap(self.fileName, dtype = np.uint8, mode = 'r', offset = offset, shape = (length,))
+
+    def read(self, name, memoryMap = False):
+        """This method reads the arrays of one trace with a single read.
+
+        Parameters
+        ----------
+        name: str
+            Name of the trace.
+        memoryMap: boolean
+            Return read-only views of a memory map of the trace instead of reading it.
+
+        Returns
+        -------
+        arrays: dict
+            Arrays of the trace keyed by name.
+        metadata: dict
+            Metadata of the trace.
+        """
+        record = self.records[name]
+        if memoryMap and record["payloadLength"] > 0:
+            buffer = self.get_memory_map(record["payloadStart"], record["payloadLength"])
+        else:
+            buffer = bytearray(record["payloadLength"])
+            self.fileHandle.seek(record["payloadStart"])
+            self.fileHandle.readinto(buffer)
+        return (get_arrays(buffer, 0, record["arrays"]), record["metadata"])
+
+    def read_all(self, memoryMap = False):
+        """This method reads every trace of the session with one contiguous read.
+
+        Parameters
+        ----------
+        memoryMap: boolean
+            Return read-only views of one memory map of the file instead of reading it.
+
+        Returns
+        -------
+        traces: dict
+            (arrays, metadata) of every trace keyed by name, in the order they were appended.
+        """
+        if memoryMap:
+            buffer = self.get_memory_map(0, self.dataEnd)
+        else:
+            buffer = bytearray(self.dataEnd)
+            self.fileHandle.seek(0)
+            self.fileHandle.readinto(buffer)
+        traces = {}
+        for name, record in self.records.items():
+            traces[name] = (get_arrays(buffer, record["payloadStart"], record["arrays"]), record["metadata"])
+        return traces
+
+    def flush(self):
+        """This method syncs the records appended so far to disk.
+        """
+        if self.mode != 'a':
+            return
+        self.fileHandle.flush()
+        os.fsync(self.fileHandle.fileno())
+
+    def write_index(self):
+        """This method writes the index and the trailer after the last record.
+        """
+        indexBytes = json.dumps(list(self.records.values()), default = get_json_value).encode('utf-8')
+        self.fileHandle.seek(self.dataEnd)
+        self.fileHandle.write(RECORD_HEADER.pack(INDEX_MAGIC, len(indexBytes), 0, zlib.crc32(indexBytes)))
+        self.fileHandle.write(indexBytes)
+        self.fileHandle.write(TRAILER.pack(TRAILER_MAGIC, self.dataEnd))
+        self.fileHandle.truncate()
+
+    def close(self):
+        """This method writes the index of an appended session and closes the file.
+        """
+        if self.fileHandle.closed:
+            return
+        if self.mode == 'a':
+            self.write_index()
+            self.flush()
+        self.fileHandle.close()
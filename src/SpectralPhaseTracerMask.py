@@ -9,6 +9,7 @@ from src.DispersionCalculator import DispersionCalculator
 from src.OSA import OSA as OSA6317B
 from src.TDS import TDS as TDS210
 from src.WaveShaperManager import WaveShaperManager
+from src.SessionStore import SessionStore
 import time
 #import datetime
 import matplotlib.pyplot as plt
@@ -26,18 +27,16 @@ class MllOpticalFrequencyCombManager():
         self.tdsManager = TDS210()
         self.wvmngr = WaveShaperManager("ws1")
         self.maskCalc = DispersionCalculator()
+        self.sessionStore = None            # SHG traces are appended here instead of one CSV each, see open_session_store()
 #        self.osaManager.connect(self.osaGpibAddress)
         self.tdsManager.connect(self.tdsGpibAddress)
     
     def saveOsaSpectrum(self, fileName, channel):
         self.osaManager.connect(self.osaGpibAddress)
-        self.osaManager.single_sweep()
+        self.osaManager.call_with_reconnect(self.osaManager.single_sweep)
         time.sleep(1)
-        self.osaManager.get_span()
-        self.osaManager.get_rbw()
-        self.osaManager.get_sensitivity()
-        self.osaManager.get_ref_lvl()
-        self.osaManager.grab_spectrum(channel)
+        self.osaManager.snapshot_settings()
+        self.osaManager.call_with_reconnect(self.osaManager.grab_spectrum, channel)
         self.osaManager.save_csv(self.filePathOsa + '\\' + fileName)
 #        self.osaManager.close()
         # Print captured spectrum
@@ -52,8 +51,11 @@ class MllOpticalFrequencyCombManager():
         print("TDS Running...")
         time.sleep(20)
         print("TDS Acquiring...")
-        self.tdsManager.acquire_waveform()
-        self.tdsManager.save_csv(self.filePathTds + '\\' + fileName)
+        self.tdsManager.call_with_reconnect(self.tdsManager.acquire_waveform)     # Survive a bus hiccup during long sweeps
+        if self.sessionStore != None:
+            self.tdsManager.append_to_session(self.sessionStore, fileName)
+        else:
+            self.tdsManager.save_csv(self.filePathTds + '\\' + fileName)
 #        self.osaManager.close()
         # Print captured spectrum
         self.tdsManager.plot_waveform()
@@ -159,9 +161,21 @@ class MllOpticalFrequencyCombManager():
         self.wvmngr.load_profile_to_waveshaper(profileName)
         self.wvmngr.disconnect_from_waveshaper()
     
+    def open_session_store(self, fileName):
+        """This method appends the SHG traces of the following sweeps to a single session file in filePathTds.
+        """
+        self.close_session_store()
+        self.sessionStore = SessionStore(self.filePathTds + '\\' + fileName)
+    
+    def close_session_store(self):
+        if self.sessionStore != None:
+            self.sessionStore.close()
+            self.sessionStore = None
+    
     def closePorts(self):
         self.osaManager.close()
         self.tdsManager.close()
+        self.close_session_store()
     
     def calculate_bandwidth_and_tlp(self):
         opticalBandwidthAndTlp = self.maskCalc.get_optical_spectrum_bandwidth_and_tlp()
@@ -169,7 +183,7 @@ class MllOpticalFrequencyCombManager():
     
     def calculate_dispersion_and_pulse_width(self, fileArray, dispersionParameter):
         filePath = self.filePathTds
-        acValues = self.maskCalc.get_autocorrelation_values_from_file_array(fileArray, dispersionParameter, filePath)
+        acValues = self.maskCalc.get_autocorrelation_values_from_file_array(fileArray, dispersionParameter, filePath, self.sessionStore)
         return acValues
     
     def calculate_tlp_from_parameter_sweep(self, opticalBandwidthNm, transformLimitedPulsePs, opticalPulsewidthPsList, parameterSweep, parameterSweepUnits):
@@ -380,6 +394,7 @@ if __name__ == "__main__":
     masterOfcMngr = MllOpticalFrequencyCombManager()
     
     masterOfcMngr.setOfcAllPass()
+    masterOfcMngr.open_session_store('DCF_MLL_PIC_sweep.session')
 #    masterOfcMngr.saveOsaSpectrum(fileNameOsa, 'B')
 #     Save harmonic OFC master
     fileNameShg = 'DCF_MLL_PIC_'
@@ -423,6 +438,7 @@ if __name__ == "__main__":
     
     masterOfcMngr.setDispersionProfile(centralFreqOffsetMinPulsewidth, quadraticDispersionMinPulsewidth, cubicDispersionMinPulsewidth)
     masterOfcMngr.show_spectral_phase_on_spectrum(centralFreqOffsetMinPulsewidth, 0.0, quadraticDispersionMinPulsewidth, cubicDispersionMinPulsewidth, fileNameOsa)
+    masterOfcMngr.close_session_store()
 #    masterOfcMngr.setDispersionProfile(0, quadraticDispersionMinPulsewidth, 0.0)
     
     """
@@ -5,24 +5,42 @@ Created on Mon Mar 30 12:18:19 2020
 @author: ri679647
 """
 
-import sys
 import pyvisa
 import time
 import numpy as np
 import matplotlib.pyplot as plt
 import datetime
 import csv
+from src.WaveformScaling import codes_from_ascii, get_reusable_buffer, scale_waveform
+from src.CompletionWaiter import CompletionWaiter
+from src.InstrumentErrors import InstrumentConnectionError
+from src.TraceFile import write_columns
+from src.Instrument import Instrument, timed_acquisition
 #import types
 
 GLOBAL_TOUT =  100000 # IO time out in milliseconds
+SWEEP_TIMEOUT = 600   # Hard deadline of a single sweep in seconds
+DEFAULT_ENCODING = "RIBinary" # CURVE? transfer encoding (ASCIi, RIBinary or RPBinary)
+DEFAULT_WIDTH = 2             # Bytes per sample point transferred by CURVE?
+NUMBER_OF_CHANNELS = 2
+CHANNEL_SETTINGS = ["SCAle", "POSition", "COUPling", "BANdwidth"]      # Read by refresh() for every channel
+HORIZONTAL_SETTINGS = ["HORizontal:MAIn:SCAle", "HORizontal:MAIn:POSition"]
 
-class TDS():
+switcherCurveDatatype = {
+    ("RIBINARY", 1): "b",   # Signed integer, one byte per sample.
+    ("RIBINARY", 2): "h",   # Signed integer, two bytes per sample, MSB first.
+    ("RPBINARY", 1): "B",   # Positive integer, one byte per sample.
+    ("RPBINARY", 2): "H",   # Positive integer, two bytes per sample, MSB first.
+}
+
+class TDS(Instrument):
     def __init__(self,Port=None): 
+        super().__init__()
         self.connected = False
         self.bool_sweep = False
+        self.sweepDuration = 0.0
 
         self.parent=self
-        self.list_devices()
         self.idn='IDN'
         self.idnMfg = 'XX'
         self.idnModel = 'XX'
@@ -46,20 +64,17 @@ class TDS():
         self.waveformMode = 'XX'   
         self.timeArray = []
         self.waveformArray = []
+        self.reuseBuffers = False                                               # Scale new captures into the previous arrays
+        self.waveformPreamble = 'XX'                                            # Preamble reply of the last acquisition
+        self.waveformCodes = None                                               # Raw record of the last acquisition
+        self.waveformScaling = None                                             # scale_waveform() factors of waveformCodes
             
-    def list_devices(self):
-        try:
-            self.rm = pyvisa.ResourceManager()
-            self.list = self.rm.list_resources()
-        except:
-            print("Couldn't find resource manager")
-                
     def connect(self, device): 
         try:          
-            self.handle = self.rm.open_resource(device)
+            self.open_session(device)
 
             self.print_message('connected to...')
-            self.idn = str(self.handle.query("*IDN?"))
+            self.idn = str(self.query("*IDN?"))
 #            print(self.idn)
             self.idn = self.idn.split(',')
             self.idnMfg = self.idn[0]                                           # Manufacturer
@@ -77,35 +92,37 @@ class TDS():
         except Exception as e:
             self.print_message(e)
             self.print_message(' Couldn\'t connect to: ' + device)
-#            sys.exit() # From InfiniiVision Script
+            raise InstrumentConnectionError("Couldn't connect to " + str(device)) from e
     
     def get_measurement_params(self):
-        self.handle.write("DCL")
+        self.write("DCL")
     
     def set_params(self):
         self.handle.timeout = GLOBAL_TOUT
         ## Clear the instrument bus
-        self.handle.clear()
+        self.clear()
 
-        ## Clear any previously encountered errors
-        self.handle.write("*CLS")
-        self.handle.write("HEADER OFF")
+        ## Clear any previously encountered errors, the settings query carries both writes
+        with self.batch():
+            self.write("*CLS")
+            self.write("HEADER OFF")
+            self.refresh()
 #        print("Initial parameters set.")
     
     def get_number_averages(self):
-        self.numAvg = int(self.handle.query("ACQuire:NUMAVg?"))
+        self.numAvg = int(self.query("ACQuire:NUMAVg?"))
         return self.numAvg
         
     def set_number_averages(self, numAvg):
         if numAvg == 4 or 16 or 64 or 128:
-            self.handle.write("ACQuire:NUMAVg " + str(numAvg))
+            self.write("ACQuire:NUMAVg " + str(numAvg))
             print('Number of averages: ' + str(numAvg) + ' set')
         else:
             print('Incorrect number of averages: ' + str(numAvg))
     
     def get_osc_state(self):
-        print(self.handle.query("ACQuire:MODE?"))
-        oscNumState = self.handle.query("ACQuire:STATE?")
+        print(self.query("ACQuire:MODE?"))
+        oscNumState = self.query("ACQuire:STATE?")
         print('Oscilloscope state: ' + oscNumState)
         if oscNumState == '0\n':
             self.oscState = 'STOP'
@@ -118,26 +135,27 @@ class TDS():
     def set_osc_state(self, oscState): # RUN or STOP
         if oscState != 0:#'RUN' or 'STOP':
 #            self.oscState = oscState
-            self.handle.write("ACQuire:STATE " + oscState)      
+            self.write("ACQuire:STATE " + oscState)      
     
     def get_channel_bandwidth(self, channelNumber):
         if channelNumber == 1 or 2:
-            channelBandwidthState = self.handle.query("CH" + str(channelNumber) + ":BANdwidth?")
+            channelBandwidthState = self.get_setting("CH" + str(channelNumber) + ":BANdwidth")
             print('CH' + str(channelNumber) + ' bandwidth state: ' + channelBandwidthState)
-            if channelBandwidthState == 'OFF\n':
+            if channelBandwidthState == 'OFF':
                 self.channelBandwidth[channelNumber-1] = 'OFF'      # 20 MHz
-            elif channelBandwidthState == 'ON\n':
+            elif channelBandwidthState == 'ON':
                 self.channelBandwidth[channelNumber-1] = 'ON'       # Full oscilloscope bandwidth
             else:
                 self.channelBandwidth[channelNumber-1] = '0'
                 print('Invalid CH' + str(channelNumber) + ' state: ' + channelBandwidthState)
         else:
             print('Invalid channel number: ' + str(channelNumber))           
+        return self.channelBandwidth[channelNumber-1]
     
     def set_channel_bandwidth(self, channelNumber, channelBandwidthState):
         if channelNumber == 1 or 2:
             if channelBandwidthState == 'ON' or 'OFF':
-                self.handle.write("CH" + str(channelNumber) + ":BANdwidth " + channelBandwidthState)
+                self.write_setting("CH" + str(channelNumber) + ":BANdwidth", channelBandwidthState)
             else:
                 print('Invalid CH' + str(channelNumber) + ' state: ' + channelBandwidthState)
         else:
@@ -145,25 +163,25 @@ class TDS():
     
     def get_channel_coupling(self, channelNumber):
         if channelNumber == 1 or 2:
-            channelCoupling = self.handle.query("CH" + str(channelNumber) + ":COUPling?")
+            channelCoupling = self.get_setting("CH" + str(channelNumber) + ":COUPling")
             print('CH' + str(channelNumber) + ' coupling: ' + channelCoupling)
-            if channelCoupling == 'DC\n':
-                self.channelBandwidth[channelNumber-1] = 'DC'       # DC coupling
-            elif channelCoupling == 'AC\n':
-                self.channelBandwidth[channelNumber-1] = 'AC'       # AC coupling
-            elif channelCoupling == 'GND\n':
-                self.channelBandwidth[channelNumber-1] = 'GND'      # Ground coupling, only a flat ground-level waveform
+            if channelCoupling == 'DC':
+                self.channelCoupling[channelNumber-1] = 'DC'        # DC coupling
+            elif channelCoupling == 'AC':
+                self.channelCoupling[channelNumber-1] = 'AC'        # AC coupling
+            elif channelCoupling == 'GND':
+                self.channelCoupling[channelNumber-1] = 'GND'       # Ground coupling, only a flat ground-level waveform
             else:
                 self.channelCoupling[channelNumber-1] = '0'
                 print('Invalid CH' + str(channelNumber) + ' coupling: ' + channelCoupling)
         else:
             print('Invalid channel number: ' + str(channelNumber))
-        return self.channelBandwidth[channelNumber-1]
+        return self.channelCoupling[channelNumber-1]
     
     def set_channel_coupling(self, channelNumber, channelCoupling):
         if channelNumber == 1 or 2:
             if channelCoupling == 'DC' or 'AC' or 'GND':
-                self.handle.write("CH" + str(channelNumber) + ":COUPLing " + channelCoupling)
+                self.write_setting("CH" + str(channelNumber) + ":COUPling", channelCoupling)
             else:
                 print('Invalid CH' + str(channelNumber) + ' coupling: ' + channelCoupling)
         else:
@@ -171,18 +189,18 @@ class TDS():
 
     def get_channel_scale(self, channelNumber):
         if channelNumber == 1 or 2:
-            channelPosition = self.handle.query("CH" + str(channelNumber) + ":SCAle?")
-#            print('CH' + str(channelNumber) + ' scale: ' + channelPosition + ' V/div')
-            self.channelPosition[channelNumber-1] = float(channelPosition)      # DC coupling
+            channelScale = self.get_setting("CH" + str(channelNumber) + ":SCAle")
+#            print('CH' + str(channelNumber) + ' scale: ' + channelScale + ' V/div')
+            self.channelScale[channelNumber-1] = float(channelScale)
         else:
             print('Invalid channel number: ' + str(channelNumber))
-        return self.channelPosition[channelNumber-1]
+        return self.channelScale[channelNumber-1]
     
     def set_channel_scale(self, channelNumber, channelScale):
         if channelNumber == 1 or 2:
             if isinstance(channelScale, float):
                 if abs(channelScale) <= 5 and abs(channelScale) >= 2e-3:            # 2mV/div < x < 5 V/div
-                    self.handle.write("CH" + str(channelNumber) + ":SCAle " + str(channelScale))
+                    self.write_setting("CH" + str(channelNumber) + ":SCAle", channelScale)
                 else:
                     print('Invalid CH' + str(channelNumber) + ' scale, outside limits: ' + str(channelScale))
             else:
@@ -192,7 +210,7 @@ class TDS():
     
     def get_channel_position(self, channelNumber):
         if channelNumber == 1 or 2:
-            channelPosition = self.handle.query("CH" + str(channelNumber) + ":POSITION?")
+            channelPosition = self.get_setting("CH" + str(channelNumber) + ":POSition")
 #            print('CH' + str(channelNumber) + ' position: ' + channelPosition)
             self.channelPosition[channelNumber-1] = float(channelPosition)       # DC coupling
         else:
@@ -203,7 +221,7 @@ class TDS():
         if channelNumber == 1 or 2:
             if isinstance(channelPosition, float):
                 if abs(channelPosition) < abs(self.get_channel_scale(channelNumber)):
-                    self.handle.write("CH" + str(channelNumber) + ":POSITION " + str(channelPosition))
+                    self.write_setting("CH" + str(channelNumber) + ":POSition", channelPosition)
                 else:
                     print('Invalid CH' + str(channelNumber) + ' position, bigger than scale: ' + str(channelPosition))
             else:
@@ -212,11 +230,33 @@ class TDS():
             print('Invalid channel number: ' + str(channelNumber))
     
     def get_horizontal_parameters(self):
-        horizontalParams = self.handle.query("HORizontal?")
+        horizontalParams = self.query("HORizontal?")
         print(horizontalParams)
     
+    def get_horizontal_scale(self):
+        return float(self.get_setting("HORizontal:MAIn:SCAle"))
+    
+    def get_horizontal_position(self):
+        return float(self.get_setting("HORizontal:MAIn:POSition"))
+    
     def set_time_scale(self,timeScale):
-        self.handle.write("HORizontal:DELay:SCAle " + str(timeScale))
+        self.write_setting("HORizontal:DELay:SCAle", timeScale)
+    
+    def get_settings_commands(self):
+        """This method returns the headers of the channel and horizontal settings read by refresh().
+        """
+        commands = []
+        for channelNumber in range(1, NUMBER_OF_CHANNELS + 1):
+            commands = commands + ["CH" + str(channelNumber) + ":" + setting for setting in CHANNEL_SETTINGS]
+        return commands + HORIZONTAL_SETTINGS
+    
+    def refresh(self):
+        """This method reads the channel and horizontal state in one compound query.
+        
+        connect() fills the cache and the setters keep it up to date, call refresh() after
+        changing settings on the front panel.
+        """
+        return self.refresh_settings(self.get_settings_commands())
     
     def set_waveform_parameters(self, waveformId):
 #        print("Waveform ID: " + waveformId)
@@ -273,32 +313,107 @@ class TDS():
             print('Waveform mode error.')
             return 'XX'
         
-    def set_waveform_values(self, waveformAscii, xZero, xIncrement, pointsOffset, yZero, yMultiplier, yOffset):
-        waveformAscii = waveformAscii.split(',')
-#        print("Number of waveform samples: " + str(len(waveformAscii)))
-        waveformTime = []
-        waveformVolts = []
-        y = 0
-        n = 0
-        for y in waveformAscii:
-            y = int(y)
-            waveformTime.append(  xZero + xIncrement  * ( n - pointsOffset) )
-            waveformVolts.append( yZero + yMultiplier * ( y - yOffset     ) )            
-            n = n + 1
-        self.timeArray = np.array(waveformTime)
-        self.waveformArray = np.array(waveformVolts)     
+    def set_waveform_values(self, waveformCodes, xZero, xIncrement, pointsOffset, yZero, yMultiplier, yOffset):
+        if isinstance(waveformCodes, str):
+            waveformCodes = codes_from_ascii(waveformCodes, np.int32)
+#        print("Number of waveform samples: " + str(len(waveformCodes)))
+        self.waveformCodes = waveformCodes
+        self.waveformScaling = {"xZero": xZero, "xIncrement": xIncrement, "pointsOffset": pointsOffset,
+                                "yZero": yZero, "yMultiplier": yMultiplier, "yOffset": yOffset}
+        timeOut = None
+        voltsOut = None
+        if self.reuseBuffers:
+            timeOut = get_reusable_buffer(self.timeArray, len(waveformCodes))
+            voltsOut = get_reusable_buffer(self.waveformArray, len(waveformCodes))
+        (self.timeArray, self.waveformArray) = scale_waveform(waveformCodes, xZero, xIncrement, pointsOffset,
+                                                              yZero, yMultiplier, yOffset, timeOut, voltsOut)
     
     def get_waveform_time(self):
         return self.timeArray
     
     def get_waveform_volts(self):
         return self.waveformArray
+    
+    def get_binary_arrays(self):
+        """This method returns the raw codes of the last acquisition, or the scaled record if it was loaded from a CSV file.
+        """
+        if self.waveformCodes is None:
+            return {"time": self.timeArray, "volts": self.waveformArray}
+        return {"codes": self.waveformCodes}
+    
+    def get_binary_metadata(self):
+        return {
+            "preamble": self.waveformPreamble,
+            "scaling": self.waveformScaling,
+            "channel": self.waveformChannel,
+            "coupling": self.waveformCoupling,
+            "verticalScale": self.waveformVerScale,
+            "horizontalScale": self.waveformHorScale,
+            "samplePoints": self.waveformSamplePoints,
+            "mode": self.waveformMode,
+        }
+    
+    def set_binary_arrays(self, arrays, metadata):
+        self.waveformPreamble = metadata.get("preamble", 'XX')
+        self.waveformChannel = metadata.get("channel", 'XX')
+        self.waveformCoupling = metadata.get("coupling", 'XX')
+        self.waveformVerScale = metadata.get("verticalScale", 'XX')
+        self.waveformHorScale = metadata.get("horizontalScale", 'XX')
+        self.waveformSamplePoints = metadata.get("samplePoints", 'XX')
+        self.waveformMode = metadata.get("mode", 'XX')
+        if "codes" in arrays:
+            scaling = metadata["scaling"]
+            self.set_waveform_values(arrays["codes"], scaling["xZero"], scaling["xIncrement"], scaling["pointsOffset"],
+                                     scaling["yZero"], scaling["yMultiplier"], scaling["yOffset"])
+        else:
+            self.waveformCodes = None
+            self.waveformScaling = None
+            self.timeArray = arrays["time"]
+            self.waveformArray = arrays["volts"]
+    
+    def read_curve(self, encoding = DEFAULT_ENCODING, width = DEFAULT_WIDTH):
+        """This method reads the waveform record with CURVE? and returns the raw digitizer codes.
         
-    def acquire_waveform(self):
-        self.handle.write("DATA:ENCDG ASCIi")
-        self.handle.write("DATA:WIDth 2")
-        waveformParameters = self.handle.query("WFMPre?")
+        Binary encodings are read as a definite-length block straight into a NumPy array,
+        the ASCIi encoding splits the comma separated reply instead.
+        
+        Parameters
+        ----------
+        encoding: str
+            Encoding set with DATA:ENCDG (ASCIi, RIBinary or RPBinary).
+        width: int
+            Bytes per sample point set with DATA:WIDth (1 or 2).
+        
+        Returns
+        -------
+        waveformCodes: array
+            Raw waveform codes, to be scaled with the WFMPre? values.
+        """
+        if encoding.upper() == "ASCII":
+            waveformAscii = self.query("CURVE?")
+            return np.array(waveformAscii.split(','), dtype=np.int32)
+        datatype = switcherCurveDatatype.get((encoding.upper(), int(width)))
+        if datatype == None:
+            raise ValueError("Invalid CURVE? encoding and width: " + str(encoding) + ", " + str(width))
+        return self.query_binary_block("CURVE?", datatype, True)
+        
+    @timed_acquisition
+    def acquire_waveform(self, encoding = DEFAULT_ENCODING, width = DEFAULT_WIDTH):
+        """This method acquires the displayed waveform and stores it in timeArray and waveformArray.
+        
+        Parameters
+        ----------
+        encoding: str
+            CURVE? transfer encoding, RIBinary or RPBinary for a binary block or ASCIi as a fallback.
+        width: int
+            Bytes per sample point (1 or 2).
+        """
+        with self.batch():
+            self.write("DATA:ENCDG " + encoding)
+            self.write("DATA:WIDth " + str(width))
+            waveformParameters = self.query("WFMPre?")
 #        print('Waveform parameters: ' + waveformParameters)
+        self.waveformPreamble = waveformParameters.strip()
         waveformParameters = waveformParameters.split(";")
         waveformId = waveformParameters[6].replace('"','')  # WFID
         xIncrement = float(waveformParameters[8])           # XINcr
@@ -312,53 +427,62 @@ class TDS():
 #        print("\nXINcr: " + str(xIncrement) + "\nPT_Off: " + str(pointsOffset) + "\nXZEro: " + str(xZero) +
 #              "\nXUNit: " + xUnit           + "\nYMUlt: "  + str(yMultiplier)  + "\nYZEro: " + str(yZero) + 
 #              "\nYOFf: "  + str(yOffset)    + "\nYUNit: "  + yUnit)
-        waveformAscii = self.handle.query("CURVE?")
+        waveformCodes = self.read_curve(encoding, width)
         self.set_waveform_parameters(waveformId)
-        self.set_waveform_values(waveformAscii, xZero, xIncrement, pointsOffset, yZero, yMultiplier, yOffset)
+        self.set_waveform_values(waveformCodes, xZero, xIncrement, pointsOffset, yZero, yMultiplier, yOffset)
     
     def close(self):
+        sessionFailed = False
         try:
-            self.handle.write("*CLS")
+            self.write("*CLS")
         except Exception as e:
             self.print_message(e)
-            sys.exit() # From InfiniiVision Script                              
+            sessionFailed = True                                                # Not handed back to the pool
         time.sleep(1)
+        self.invalidate_settings_cache()                                        # Front panel unlocked
         try:
-            self.rm.close()
+            self.close_session(sessionFailed)
         except Exception as e:
             self.print_message(e)
-            sys.exit() # From InfiniiVision Script                
         time.sleep(1)
         self.print_message('Connection to ' + self.idnMfg + ': ' + self.idnModel + ' closed')
         
-    def send_cmd(self, cmd):
-        
-        self.handle.write(cmd)
-         
-        response = self.handle.read_raw()
-        return response
-    
     def cont_sweep(self):
 
         self.bool_sweep = True
-        self.handle.write("RPT")
+        self.write("RPT")
     
-    def single_sweep(self):
-
+    def single_sweep(self, timeout = SWEEP_TIMEOUT, srqCommand = None):
+        """This method starts a single sweep (SGL) and waits until SWEEP? reports it finished.
+        
+        The wait wakes on a service request from the instrument and otherwise polls SWEEP?
+        with a sub-second adaptive interval, see CompletionWaiter.
+        
+        Parameters
+        ----------
+        timeout: float
+            Hard deadline of the sweep in seconds, InstrumentTimeoutError is raised after it.
+        srqCommand: str
+            Optional command sent before SGL that makes the instrument assert SRQ when the sweep ends.
+        
+        Returns
+        -------
+        sweepDuration: float
+            Observed sweep duration in seconds.
+        """
         self.bool_sweep = True
-        self.handle.write("SGL")
-        time.sleep(1)
-        response = self.handle.query("SWEEP?")
-        while response != "0\r\n":
-            time.sleep(1)
-            response = self.handle.query("SWEEP?")
-#            print(response)
-        self.bool_sweep = False
+        if srqCommand != None:
+            self.write(srqCommand)
+        startTime = time.monotonic()
+        self.write("SGL")
+        self.mark_trigger()
+        waiter = CompletionWaiter(self, timeout)
+        try:
+            self.sweepDuration = waiter.wait(lambda: self.query("SWEEP?").strip() == "0", startTime)
+        finally:
+            self.bool_sweep = False
+        return self.sweepDuration
 
-    def print_message(self, msg):
-        if __name__ == "__main__":
-            print(msg)
-            
 #    def get_measurement_parameters(channelNumber):
 #        measurementParameters.append(self.get_)
     
@@ -366,7 +490,7 @@ class TDS():
         try:
             with open(fileName, 'w',newline='') as fileWriter:
                 self.csvWriter = csv.writer(fileWriter, delimiter = '\t')
-                now_ = datetime.datetime.now()
+                now_ = self.get_capture_datetime()
                 timestamp = now_.strftime('%m/%d/%Y %H:%M hrs')
                 self.csvWriter.writerow([timestamp])
                 self.csvWriter.writerow(["Record length: " + self.get_waveform_sample_points()])
@@ -380,8 +504,7 @@ class TDS():
                 self.csvWriter.writerow(["Acquisition mode: " + self.get_waveform_mode()])
 #                self.csvWriter.writerow(["Number of averages: " + self.span_wl])
                 self.csvWriter.writerow(["Time (s) Waveform (V)"])
-                for (x,y) in zip(self.get_waveform_time(), self.get_waveform_volts()):
-                    self.csvWriter.writerow(('{0:.12f}'.format(x),'{0:.12f}'.format(y)))
+                write_columns(fileWriter, (self.get_waveform_time(), self.get_waveform_volts()), ('%.12f', '%.12f'))
         except Exception as e:
             print(e)
             self.close()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Text trace files written by the save_csv methods of the drivers.
+
+A trace file holds a few header lines followed by one tab delimited row per sample. The
+rows used to be formatted and written one by one with csv.writer, which took longer than
+the acquisition for long records. Here every block of rows is formatted by a single
+string formatting operation and written with one call, the bytes on disk stay the same
+(csv.writer rows terminated by '\\r\\n').
+
+Reading is the same the other way round: read_trace_csv() takes the header lines as the
+analysis classes always did, every row holding a single field, and parses the block of
+samples after them into NumPy arrays with one call instead of a float() per value. The
+extrema and span of every column the mask calculations need come with the arrays.
+
+Typical usage example:
+    with open(fileName, 'w', newline='') as fileWriter:
+        csvWriter = csv.writer(fileWriter, delimiter = '\\t')
+        csvWriter.writerow(["Time (s) Waveform (V)"])
+        write_columns(fileWriter, (timeArray, waveformArray), ('%.12f', '%.12f'))
+    (columns, header, extrema) = read_trace_csv(fileName)
+    (minimumTime, maximumTime, timeSpan) = extrema[0]
+
+@author: ri679647
+"""
+
+import csv
+import io
+import numpy as np
+
+DELIMITER = '\t'
+LINE_TERMINATOR = '\r\n'    # Line terminator of csv.writer
+BLOCK_ROWS = 65536          # Rows formatted and written per call
+
+def format_rows(columns, formats, delimiter = DELIMITER, lineTerminator = LINE_TERMINATOR):
+    """This function formats rows of samples into one string.
+    
+    Parameters
+    ----------
+    columns: list
+        Arrays of the same length, one per column.
+    formats: list
+        printf style format of every column, e.g. '%.3f'.
+    
+    Returns
+    -------
+    text: str
+        One line per row, columns separated by delimiter.
+    """
+    numberOfRows = len(columns[0])
+    if numberOfRows == 0:
+        return ''
+    rowFormat = delimiter.join(formats) + lineTerminator
+    values = np.column_stack([np.asarray(column, dtype = np.float64) for column in columns]).ravel().tolist()
+    return (rowFormat*numberOfRows) % tuple(values)
+
+def write_columns(fileWriter, columns, formats, delimiter = DELIMITER, lineTerminator = LINE_TERMINATOR):
+    """This function writes columns of samples to an open text file, one row per sample.
+    
+    The columns are cut to the shortest one, like zip() does, and written in blocks of
+    BLOCK_ROWS rows so the formatted text of a long record is never held in memory at once.
+    
+    Parameters
+    ----------
+    fileWriter: file
+        Text file opened with newline='' so the line terminator is written unchanged.
+    columns: list
+        Arrays, one per column.
+    formats: list
+        printf style format of every column, e.g. '%.12f'.
+    """
+    numberOfRows = min([len(column) for column in columns])
+    for firstRow in range(0, numberOfRows, BLOCK_ROWS):
+        lastRow = min(firstRow + BLOCK_ROWS, numberOfRows)
+        fileWriter.write(format_rows([column[firstRow:lastRow] for column in columns], formats, delimiter, lineTerminator))
+
+def split_header(text, delimiter = DELIMITER):
+    """This function separates the header rows at the start of a trace file from its samples.
+    
+    A row holding less than two fields is a header row, like the analysis classes always
+    read the files of save_csv(). Quoted values spanning several lines, such as the RFSA
+    settings queried with their line terminator, stay one header row.
+    
+    Returns
+    -------
+    header: list
+        Header rows, every row a list of fields as csv.reader returns it.
+    dataStart: int
+        Position in text of the first row of samples, len(text) if there is none.
+    """
+    header = []
+    lineStart = [0]
+    def get_lines():
+        position = 0
+        while position < len(text):
+            end = text.find('\n', position)
+            end = len(text) if end < 0 else end + 1
+            lineStart[0] = position
+            yield text[position:end]
+            position = end
+    for row in csv.reader(get_lines(), delimiter = delimiter):
+        if len(row) > 1:
+            return (header, lineStart[0])
+        header.append(row)
+    return (header, len(text))
+
+def parse_rows(text, delimiter, columns, header):
+    """This function parses the samples row by row, header rows between them are appended to header.
+    
+    It is the fallback of read_trace_csv() for files whose samples are not a plain table.
+    """
+    values = []
+    for row in csv.reader(io.StringIO(text), delimiter = delimiter):
+        if len(row) > 1:
+            values.append([float(row[column]) for column in columns])
+        else:
+            header.append(row)
+    return np.array(values, dtype = np.float64).reshape(-1, len(columns))
+
+def read_trace_csv(fileName, columns = (0, 1), delimiter = DELIMITER):
+    """This function reads columns of samples from a text trace file.
+    
+    The header rows are split off with csv.reader and the samples after them are parsed
+    in a single pass into a table of floats. Files holding further header rows between the
+    samples are read row by row instead.
+    
+    Parameters
+    ----------
+    fileName: str
+        File written by a save_csv() method, or any delimited file of samples.
+    columns: tuple
+        Indexes of the columns returned, e.g. (3, 4) for the oscilloscope CSV files.
+    delimiter: str
+        Field delimiter, '\\t' for the files of save_csv().
+    
+    Returns
+    -------
+    columns: list
+        One array of samples per requested column.
+    header: list
+        Header rows, every row a list of fields.
+    extrema: list
+        (minimum, maximum, span) of every requested column, NaN if the file holds no samples.
+    """
+    columns = tuple(columns)
+    with open(fileName, 'r') as fileReader:
+        text = fileReader.read()
+    (header, dataStart) = split_header(text, delimiter)
+    if dataStart == len(text):
+        values = np.empty((0, len(columns)))
+    else:
+        try:
+            values = np.loadtxt(io.StringIO(text[dataStart:]), dtype = np.float64, delimiter = delimiter, comments = None,
+                                usecols = columns, ndmin = 2)
+        except ValueError:
+            values = parse_rows(text[dataStart:], delimiter, columns, header)
+    if len(values) > 0:
+        minima = values.min(axis = 0)
+        maxima = values.max(axis = 0)
+    else:
+        minima = np.full(len(columns), np.nan)
+        maxima = np.full(len(columns), np.nan)
+    extrema = [(float(minimum), float(maximum), float(maximum - minimum)) for minimum, maximum in zip(minima, maxima)]
+    return ([values[:, index].copy() for index in range(len(columns))], header, extrema)
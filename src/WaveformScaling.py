@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized conversion of raw oscilloscope records into time and voltage arrays.
+
+The TDS, CSA and DCA drivers describe a captured record with a preamble that maps
+sample indexes and digitizer codes to physical units:
+
+    time  = xZero + xIncrement  * (n    - pointsOffset)
+    volts = yZero + yMultiplier * (code - yOffset)
+
+(XZEro/XINcr/PT_Off/YZEro/YMUlt/YOFf on the Tektronix scopes, xOrigin/xIncrement/
+xReference/yOrigin/yIncrement/yReference on the DCA). The functions in this module
+apply both expressions to a whole record at once and can write into caller supplied
+buffers so that repeated captures of the same length do not allocate new arrays.
+
+@author: ri679647
+"""
+
+import numpy as np
+
+_indexRamp = np.arange(0, dtype=np.float64)    # Shared 0, 1, 2, ... sample index ramp
+
+def get_index_ramp(numberOfPoints):
+    """This function returns a read-only view of the sample indexes 0 ... numberOfPoints-1.
+    
+    The ramp is kept between calls and only grown when a longer record is scaled.
+    """
+    global _indexRamp
+    indexRamp = _indexRamp                  # Read once, another thread may replace it meanwhile
+    if len(indexRamp) < numberOfPoints:
+        indexRamp = np.arange(numberOfPoints, dtype=np.float64)
+        indexRamp.setflags(write=False)
+        _indexRamp = indexRamp
+    return indexRamp[:numberOfPoints]
+
+def get_reusable_buffer(buffer, numberOfPoints):
+    """This function returns buffer if it can hold a float64 record of numberOfPoints samples, otherwise None.
+    """
+    if isinstance(buffer, np.ndarray) and buffer.dtype == np.float64 and buffer.shape == (numberOfPoints,) and buffer.flags.writeable:
+        return buffer
+    return None
+
+def codes_from_ascii(waveformAscii, dtype = np.float64):
+    """This function converts a comma separated ASCII record (e.g. a CURVE? reply) into an array.
+    
+    Parameters
+    ----------
+    waveformAscii: str
+        Comma separated sample values.
+    dtype: numpy dtype
+        Type of the returned array, integer for digitizer codes or float for values already in volts.
+    """
+    return np.array(waveformAscii.split(','), dtype = dtype)
+
+def scale_time_axis(numberOfPoints, xZero, xIncrement, pointsOffset = 0, out = None):
+    """This function builds the time axis of a record.
+    
+    Parameters
+    ----------
+    numberOfPoints: int
+        Number of samples in the record.
+    xZero: float
+        Time of the sample at pointsOffset (XZEro or xOrigin).
+    xIncrement: float
+        Time between samples (XINcr or xIncrement).
+    pointsOffset: float
+        Sample index that corresponds to xZero (PT_Off or xReference).
+    out: array
+        Optional float64 buffer of length numberOfPoints to write the result into.
+    
+    Returns
+    -------
+    timeArray: array
+        Time of every sample.
+    """
+    if out is None:
+        out = np.empty(numberOfPoints, dtype = np.float64)
+    np.subtract(get_index_ramp(numberOfPoints), pointsOffset, out = out)
+    out *= xIncrement
+    out += xZero
+    return out
+
+def scale_codes_to_volts(waveformCodes, yZero, yMultiplier, yOffset, out = None):
+    """This function converts raw digitizer codes into vertical units.
+    
+    Parameters
+    ----------
+    waveformCodes: array
+        Raw record, integer codes or floats.
+    yZero: float
+        Vertical value of code yOffset (YZEro or yOrigin).
+    yMultiplier: float
+        Vertical units per code (YMUlt, YSCale or yIncrement).
+    yOffset: float
+        Code that corresponds to yZero (YOFf or yReference).
+    out: array
+        Optional float64 buffer of the same length as waveformCodes to write the result into.
+    
+    Returns
+    -------
+    waveformArray: array
+        Vertical value of every sample.
+    """
+    waveformCodes = np.asarray(waveformCodes)
+    if out is None:
+        out = np.empty(len(waveformCodes), dtype = np.float64)
+    np.subtract(waveformCodes, yOffset, out = out, casting = 'unsafe')
+    out *= yMultiplier
+    out += yZero
+    return out
+
+def scale_waveform(waveformCodes, xZero, xIncrement, pointsOffset, yZero, yMultiplier, yOffset, timeOut = None, voltsOut = None):
+    """This function converts a raw record and its preamble into time and voltage arrays in one pass.
+    
+    Returns
+    -------
+    (timeArray, waveformArray): tuple of arrays
+        Time and vertical value of every sample, written into timeOut and voltsOut when given.
+    """
+    waveformArray = scale_codes_to_volts(waveformCodes, yZero, yMultiplier, yOffset, out = voltsOut)
+    timeArray = scale_time_axis(len(waveformArray), xZero, xIncrement, pointsOffset, out = timeOut)
+    return (timeArray, waveformArray)